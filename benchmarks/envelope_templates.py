@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Compares building request envelopes with suds and with envelope templates
+(the envelope_templates option of FedexConfig), for Rate and Track requests.
+
+Building envelopes only:
+
+    python benchmarks/envelope_templates.py
+
+Whole requests against a local stub server:
+
+    python benchmarks/envelope_templates.py --stub
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fedex.config import FedexConfig
+from fedex.services.rate_service import FedexRateServiceRequest
+from fedex.services.track_service import FedexTrackRequest
+from fedex.stub_server import FedexStubServer
+
+
+def rate_request(config, index):
+    rate = FedexRateServiceRequest(config, customer_transaction_id='benchmark {}'.format(index))
+    rate.RequestedShipment.ShipTimestamp = datetime.datetime(2017, 1, 2, 10, 0)
+    rate.RequestedShipment.DropoffType = 'REGULAR_PICKUP'
+    rate.RequestedShipment.PackagingType = 'YOUR_PACKAGING'
+    rate.RequestedShipment.Shipper.Address.PostalCode = '29631'
+    rate.RequestedShipment.Shipper.Address.CountryCode = 'US'
+    rate.RequestedShipment.Recipient.Address.PostalCode = '{:05d}'.format(27000 + index % 1000)
+    rate.RequestedShipment.Recipient.Address.CountryCode = 'US'
+    rate.RequestedShipment.Recipient.Address.Residential = index % 2 == 0
+    rate.RequestedShipment.EdtRequestType = 'NONE'
+    rate.RequestedShipment.ShippingChargesPayment.PaymentType = 'SENDER'
+    package = rate.create_wsdl_object_of_type('RequestedPackageLineItem')
+    package.Weight = rate.create_wsdl_object_of_type('Weight')
+    package.Weight.Value = 1.0 + index % 50
+    package.Weight.Units = 'LB'
+    package.PhysicalPackaging = 'BOX'
+    package.GroupPackageCount = 1
+    rate.add_package(package)
+    return rate
+
+
+def track_request(config, index):
+    track = FedexTrackRequest(config, customer_transaction_id='benchmark {}'.format(index))
+    track.SelectionDetails.PackageIdentifier.Type = 'TRACKING_NUMBER_OR_DOORTAG'
+    track.SelectionDetails.PackageIdentifier.Value = '{:012d}'.format(781820562774 + index)
+    return track
+
+
+def build(factory, config, count):
+    """
+    Returns the mean time to build an envelope, in milliseconds.
+    """
+
+    requests = [factory(config, index) for index in range(count)]
+    start = time.perf_counter()
+    for request in requests:
+        request._prepare_request()
+    return (time.perf_counter() - start) / count * 1000
+
+
+def send(factory, config, count):
+    """
+    Returns the mean time of a whole request and of its marshal phase, in
+    milliseconds.
+    """
+
+    total = marshal = 0.0
+    for index in range(count):
+        request = factory(config, index)
+        request.send_request()
+        metrics = request.metrics
+        total += metrics.total
+        marshal += metrics.phases['marshal']
+    return total / count * 1000, marshal / count * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Envelope template benchmark.")
+    parser.add_argument('--count', type=int, default=500, help="requests per service and path")
+    parser.add_argument('--stub', action='store_true', help="send the requests to a local stub server")
+    args = parser.parse_args(argv)
+
+    server = FedexStubServer().start() if args.stub else None
+    try:
+        for name, factory in (('rate', rate_request), ('track', track_request)):
+            results = []
+            for envelope_templates in (False, True):
+                config = FedexConfig(key='', password='', account_number='', meter_number='',
+                                     use_test_server=True, envelope_templates=envelope_templates,
+                                     endpoint_url=server.url if server else None, keep_alive=True)
+                # Warm up the client cache, and compile the template.
+                build(factory, config, 5)
+                if server:
+                    results.append(send(factory, config, args.count))
+                else:
+                    results.append(build(factory, config, args.count))
+            if server:
+                (suds_total, suds_marshal), (template_total, template_marshal) = results
+                print('{:6} suds {:7.3f} ms/request ({:.3f} ms marshal)   '
+                      'templates {:7.3f} ms/request ({:.3f} ms marshal)'.format(
+                          name, suds_total, suds_marshal, template_total, template_marshal))
+            else:
+                suds, template = results
+                print('{:6} suds {:7.3f} ms/envelope   templates {:7.3f} ms/envelope   {:5.1f}x'.format(
+                    name, suds, template, suds / template))
+    finally:
+        if server:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -53,3 +53,13 @@ our U{Github project<http://github.com/gtaylor/python-fedex/>} and enter
 an issue in the U{Issue Tracker<http://github.com/gtaylor/python-fedex/issues>}.
 """
 VERSION = __version__ = '2.4.1'
+
+
+def warmup(config_obj, services=None):
+    """
+    Loads service schemas ahead of time, see L{preload.warmup}. This is
+    imported lazily so that importing C{fedex} stays cheap.
+    """
+
+    from .preload import warmup as _warmup
+    return _warmup(config_obj, services=services)
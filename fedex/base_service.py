@@ -7,37 +7,471 @@ In particular, the L{FedexBaseService} class handles most of the basic,
 repetitive setup work that most requests do.
 """
 
+import asyncio
+import copy
+import functools
 import os
 import logging
+import re
+import threading
+import time
+
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlparse
 
 import suds
-from suds.client import Client
-from suds.plugin import MessagePlugin 
+from suds.bindings.multiref import MultiRef
+from suds.client import Client, RequestContext, ServiceSelector, _SoapClient
+from suds.options import Options
+from suds.plugin import MessagePlugin, PluginContainer
+from suds.sudsobject import Object
+from suds.transport import Request, TransportError
+from suds.transport.https import HttpAuthenticated
+
+from .cache import WsdlSchemaCache
+from .decoding import get_reply_decoder
+from .instrumentation import RequestMetrics, notify_observers
+from .preload import _get_service_class
+from .templates import get_envelope_template
+from .transport import PooledHttpTransport, get_async_transport
 
 
 class GeneralSudsPlugin(MessagePlugin):
     """
     General Suds Plugin: Adds logging request and response functionality
     and prunes empty WSDL objects before sending.
+
+    Envelopes are only rendered when the C{fedex.request} and
+    C{fedex.response} loggers are enabled for INFO, so disabled logging
+    costs nothing. Logged envelopes may be redacted and truncated.
     """
 
-    def __init__(self, **kwargs):
-        """Initializes the request and response loggers."""
+    REDACTED_FIELDS = ('Key', 'Password', 'AccountNumber', 'MeterNumber', 'Image')
+    """Suggested element names for the redact_fields option: credentials and label images."""
+
+    def __init__(self, max_length=None, redact_fields=None, **kwargs):
+        """
+        Initializes the request and response loggers.
+
+        @type max_length: L{int}
+        @keyword max_length: Logged envelopes are cut to this many bytes.
+        @type redact_fields: L{tuple}
+        @keyword redact_fields: Names of elements whose contents are replaced
+            by their length in logged envelopes, e.g. L{REDACTED_FIELDS}.
+        """
         self.request_logger = logging.getLogger('fedex.request')
         self.response_logger = logging.getLogger('fedex.response')
+        self.max_length = max_length
+        self.prune_seconds = 0.0
+        """@ivar: Time spent pruning the last envelope."""
+        self._redact_pattern = None
+        if redact_fields:
+            self._redact_pattern = re.compile(
+                br'(<(?:[\w.-]+:)?(?:' + b'|'.join(re.escape(field.encode('utf-8')) for field in redact_fields) +
+                br')(?:\s[^>]*)?>)([^<]*)(<)')
         self.kwargs = kwargs
 
     def marshalled(self, context):
         """Removes the WSDL objects that do not have a value before sending."""
+        start = time.perf_counter()
         context.envelope = context.envelope.prune()
+        self.prune_seconds = time.perf_counter() - start
 
     def sending(self, context):
         """Logs the sent request."""
-        self.request_logger.info("FedEx Request {}".format(context.envelope))
+        if self.request_logger.isEnabledFor(logging.INFO):
+            self.request_logger.info("FedEx Request %s", self._format_message(context.envelope))
 
     def received(self, context):
         """Logs the received response."""
-        self.response_logger.info("FedEx Response {}".format(context.reply))
+        if self.response_logger.isEnabledFor(logging.INFO):
+            self.response_logger.info("FedEx Response %s", self._format_message(context.reply))
+
+    def _format_message(self, message):
+        """
+        Applies redaction and truncation to an envelope about to be logged.
+        """
+
+        if self._redact_pattern is None and self.max_length is None:
+            return message
+        if not isinstance(message, bytes):
+            message = str(message).encode('utf-8')
+        if self._redact_pattern is not None:
+            message = self._redact_pattern.sub(
+                lambda match: match.group(1) + '[{} bytes redacted]'.format(len(match.group(2))).encode('utf-8') +
+                match.group(3), message)
+        if self.max_length is not None and len(message) > self.max_length:
+            message = message[:self.max_length] + '... [{} bytes truncated]'.format(
+                len(message) - self.max_length).encode('utf-8')
+        return message
+
+
+class _ReplyMultiRef(MultiRef):
+    """
+    Resolves the multirefs of each reply with a MultiRef of its own. suds
+    keeps a single one per WSDL binding, holding the reply being resolved,
+    and clients of the same WSDL share their bindings.
+    """
+
+    def process(self, body):
+        return MultiRef().process(body)
+
+
+class FedexClientCache(object):
+    """
+    A thread-safe, process-wide registry of parsed suds Clients. Parsing a
+    WSDL and resolving its schema is by far the most expensive part of
+    setting up a request, so the first request for a given WSDL pays for it
+    and every later request gets a light clone sharing the resolved schema.
+
+    Clients are keyed by WSDL path, proxy settings and plugin classes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._parse_locks = {}
+        self.hits = 0
+        """@ivar: Number of lookups served from the registry."""
+        self.misses = 0
+        """@ivar: Number of lookups that had to parse a WSDL."""
+
+    @staticmethod
+    def _make_key(wsdl_path, proxy, plugins):
+        """
+        Builds a hashable registry key. Proxies are generally given as dicts,
+        and plugins are keyed on their classes since each clone gets its own
+        plugin instances anyway.
+        """
+
+        if isinstance(proxy, dict):
+            proxy = tuple(sorted(proxy.items()))
+        plugin_types = tuple(type(plugin) for plugin in plugins)
+        return wsdl_path, proxy, plugin_types
+
+    def get_client(self, wsdl_path, proxy=None, plugins=None, schema_cache_dir=None):
+        """
+        Returns a suds Client for the given WSDL, parsing it only if this is
+        the first time it has been asked for.
+
+        @type wsdl_path: L{str}
+        @param wsdl_path: Absolute path to the WSDL file.
+        @type proxy: L{dict}
+        @keyword proxy: Proxy servers, as on L{FedexConfig}.
+        @type plugins: L{list}
+        @keyword plugins: suds plugin instances for the returned client.
+        @type schema_cache_dir: L{str}
+        @keyword schema_cache_dir: When set, a WSDL that isn't in the registry
+            yet is loaded from (or saved to) a L{WsdlSchemaCache} in this
+            directory instead of always being parsed.
+        """
+
+        plugins = list(plugins or [])
+        key = self._make_key(wsdl_path, proxy, plugins)
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                parse_lock = self._parse_locks.setdefault(key, threading.Lock())
+            else:
+                self.hits += 1
+        if client is None:
+            # Parsing under the key's lock keeps concurrent first requests
+            # from each parsing the same WSDL, while other WSDLs are parsed
+            # alongside.
+            with parse_lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._parse_client(wsdl_path, proxy, plugins, schema_cache_dir)
+                    with self._lock:
+                        self.misses += 1
+                        self._clients[key] = client
+                else:
+                    with self._lock:
+                        self.hits += 1
+
+        return self._clone_client(client, plugins=plugins, proxy=proxy, cache=client.options.cache)
+
+    def _parse_client(self, wsdl_path, proxy, plugins, schema_cache_dir):
+        """Parses a WSDL into a new suds Client, see L{get_client}."""
+
+        client_options = {'plugins': plugins, 'proxy': proxy}
+        if schema_cache_dir:
+            client_options['cache'] = WsdlSchemaCache(schema_cache_dir, wsdl_path)
+            client_options['cachingpolicy'] = 1
+        client = Client('file:///%s' % wsdl_path.lstrip('/'), **client_options)
+        self._isolate_replies(client.wsdl)
+        return client
+
+    @staticmethod
+    def _isolate_replies(wsdl):
+        """
+        Gives the WSDL's bindings a L{_ReplyMultiRef}, so that clones of its
+        client may unmarshal replies in several threads at once.
+        """
+
+        for service in wsdl.services:
+            for port in service.ports:
+                for method in port.methods.values():
+                    method.binding.input.multiref = _ReplyMultiRef()
+                    method.binding.output.multiref = _ReplyMultiRef()
+
+    @staticmethod
+    def _clone_client(client, **kwargs):
+        """
+        Creates a client that shares the WSDL, schema and factory of the
+        given one, but has its own options. This mirrors suds' own
+        Client.clone(), which can't deep-copy linked options on newer Pythons.
+        """
+
+        clone = Client.__new__(Client)
+        clone.options = Options()
+        clone.options.transport = HttpAuthenticated()
+        clone.set_options(**kwargs)
+        clone.wsdl = client.wsdl
+        clone.factory = client.factory
+        clone.service = ServiceSelector(clone, client.wsdl.services)
+        clone.sd = client.sd
+        clone.messages = dict(tx=None, rx=None)
+        return clone
+
+    def invalidate(self, wsdl_path=None):
+        """
+        Drops cached clients so the next request re-parses its WSDL.
+
+        @type wsdl_path: L{str}
+        @keyword wsdl_path: Only drop clients for this WSDL. When omitted,
+            the whole registry is cleared.
+        """
+
+        with self._lock:
+            if wsdl_path is None:
+                self._clients.clear()
+            else:
+                for key in [key for key in self._clients if key[0] == wsdl_path]:
+                    del self._clients[key]
+
+    def stats(self):
+        """
+        Returns a dict with the hit and miss counters and the number of
+        clients currently held.
+        """
+
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._clients)}
+
+
+CLIENT_CACHE = FedexClientCache()
+"""The process-wide L{FedexClientCache} used by all services."""
+
+
+class FedexPreparedRequest(object):
+    """
+    A SOAP request that has been marshalled by suds but not sent yet, for
+    sending it outside of suds' own transport.
+    """
+
+    def __init__(self, operation, url, headers, context):
+        """
+        @type operation: L{str}
+        @param operation: Name of the WSDL operation, e.g. 'getRates'.
+        @type url: L{str}
+        @param url: Endpoint URL to post the envelope to.
+        @type headers: L{dict}
+        @param headers: HTTP headers for the request, including SOAPAction.
+        @param context: The suds RequestContext holding the envelope.
+        """
+
+        self.operation = operation
+        self.url = url
+        self.headers = headers
+        self.envelope = context.envelope
+        """@ivar: The SOAP envelope, as bytes."""
+        self.timeout = None
+        """@ivar: Seconds the request was given to complete in, or None."""
+        self.deadline = None
+        """@ivar: The time.perf_counter() it must complete by, or None."""
+        self._context = context
+
+    def time_left(self):
+        """
+        Returns the seconds left until the deadline, or None if there is no
+        deadline.
+        """
+
+        if self.deadline is None:
+            return None
+        return self.deadline - time.perf_counter()
+
+    def check_deadline(self):
+        """
+        Returns L{time_left}, raising a L{FedexTimeoutError} if the deadline
+        has passed.
+        """
+
+        time_left = self.time_left()
+        if time_left is not None and time_left <= 0:
+            raise FedexTimeoutError(self.timeout)
+        return time_left
+
+    def process_reply(self, reply, status=None, description=None):
+        """
+        Hands a reply back to suds for unmarshalling. A None status means
+        HTTP 200.
+        """
+
+        return self._context.process_reply(reply, status, description)
+
+
+class _RecordingServiceSelector(object):
+    """
+    Wraps a suds client's service selector to remember which operation a
+    service's send function invokes. When capturing, the operation isn't
+    invoked and the arguments it was called with are remembered instead.
+    """
+
+    def __init__(self, service_selector, capture=False):
+        self.service_selector = service_selector
+        self.capture = capture
+        self.method = None
+        self.args = None
+        self.kwargs = None
+
+    def __getattr__(self, name):
+        method = getattr(self.service_selector, name)
+        self.method = method.method
+        if self.capture:
+            return self._capture
+        return method
+
+    def _capture(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+
+class FedexRequestPool(object):
+    """
+    A thread-safe pool of reusable requests of one kind, for code that sends
+    many similar requests, such as a rate quote per checkout. Requests are
+    checked out reset to their defaults, and new ones are cloned rather
+    than created, so only the first pays for building the WSDL objects::
+
+        pool = FedexRequestPool(FedexRateServiceRequest, CONFIG_OBJ)
+        with pool.request() as rate_request:
+            rate_request.RequestedShipment.Shipper.Address.PostalCode = '29631'
+            ...
+            rate_request.send_request()
+            amount = rate_request.response.RateReplyDetails[0]...
+
+    A checked out request is only ever used by one thread at a time.
+    """
+
+    def __init__(self, service_class, config_obj, max_idle=10, *args, **kwargs):
+        """
+        Any further arguments are passed on to the service class.
+
+        @type service_class: L{FedexBaseService} sub-class
+        @param service_class: The kind of request to pool.
+        @type config_obj: L{FedexConfig}
+        @param config_obj: A valid FedexConfig object.
+        @type max_idle: L{int}
+        @keyword max_idle: The most requests kept for reuse. More may be
+            checked out at once, the extra ones are dropped when returned.
+        """
+
+        self.service_class = service_class
+        self.config_obj = config_obj
+        self.max_idle = max_idle
+        self._args = args
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._prototype = None
+        self._idle = deque()
+        self.created = 0
+        """@ivar: Number of requests created or cloned."""
+        self.reused = 0
+        """@ivar: Number of checkouts served by a returned request."""
+
+    def checkout(self, customer_transaction_id=None):
+        """
+        Returns a request in its default state, to be given back with
+        L{checkin} once done with.
+
+        @type customer_transaction_id: L{str}
+        @keyword customer_transaction_id: See L{FedexBaseService.reset}.
+        """
+
+        with self._lock:
+            request = self._idle.pop() if self._idle else None
+            if request is not None:
+                self.reused += 1
+            else:
+                self.created += 1
+                if self._prototype is None:
+                    # Cloned, never handed out, so it stays pristine.
+                    self._prototype = self.service_class(self.config_obj, *self._args, **self._kwargs)
+            prototype = self._prototype
+        if request is None:
+            request = prototype.clone()
+            if customer_transaction_id is not None:
+                request.reset(customer_transaction_id)
+        else:
+            request.reset(customer_transaction_id)
+        return request
+
+    def checkin(self, request):
+        """
+        Gives a checked out request back to the pool. It must not be used
+        afterwards.
+        """
+
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(request)
+
+    @contextmanager
+    def request(self, customer_transaction_id=None):
+        """
+        Checks a request out for the duration of a with block.
+        """
+
+        request = self.checkout(customer_transaction_id)
+        try:
+            yield request
+        finally:
+            self.checkin(request)
+
+    def stats(self):
+        """
+        Returns a dict with the created and reused counters and the number
+        of idle requests.
+        """
+
+        with self._lock:
+            return {'created': self.created, 'reused': self.reused, 'idle': len(self._idle)}
+
+
+def _copy_wsdl_value(value, memo):
+    """
+    Copies WSDL objects, and the lists and dicts holding them, sharing their
+    suds metadata, which is much faster than deepcopy. Objects referenced
+    more than once, such as the Parent and User credentials, stay shared.
+    """
+
+    if isinstance(value, Object):
+        clone = memo.get(id(value))
+        if clone is None:
+            clone = memo[id(value)] = value.__class__.__new__(value.__class__)
+            for name, item in value.__dict__.items():
+                clone.__dict__[name] = item if name in ('__metadata__', '__printer__') \
+                    else _copy_wsdl_value(item, memo)
+        return clone
+    if isinstance(value, list):
+        return [_copy_wsdl_value(item, memo) for item in value]
+    if isinstance(value, dict):
+        return dict((key, _copy_wsdl_value(item, memo)) for key, item in value.items())
+    return value
 
 
 class FedexBaseServiceException(Exception):
@@ -89,6 +523,19 @@ class SchemaValidationError(FedexBaseServiceException):
             pass
 
 
+class FedexTimeoutError(FedexBaseServiceException):
+    """
+    Exception: The request did not complete within the timeout it was sent
+    with.
+    """
+
+    def __init__(self, timeout):
+        self.error_code = -1
+        self.value = "Request did not complete within {}s.".format(timeout)
+        self.timeout = timeout
+        """@ivar: The timeout, in seconds."""
+
+
 class FedexBaseService(object):
     """
     This class is the master class for all Fedex request objects. It gets all
@@ -112,6 +559,7 @@ class FedexBaseService(object):
             returned with the response from Fedex.
         """
 
+        start = time.perf_counter()
         self.logger = logging.getLogger('fedex')
         """@ivar: Python logger instance with name 'fedex'."""
 
@@ -132,8 +580,9 @@ class FedexBaseService(object):
             self.logger.info("Using production server.")
             self.wsdl_path = os.path.join(config_obj.wsdl_path, wsdl_name)
 
-        self.client = Client('file:///%s' % self.wsdl_path.lstrip('/'), plugins=[GeneralSudsPlugin()], proxy=config_obj.proxy)
-        # self.client.options.cache.clear()  # Clear the cache, then re-init client when changing wsdl file.
+        self.client = None
+        """@ivar: The suds Client the request is sent with."""
+        self.__set_client()
 
         self.VersionId = None
         """@ivar: Holds details on the version numbers of the WSDL."""
@@ -148,12 +597,85 @@ class FedexBaseService(object):
             you can pull."""
         self.TransactionDetail = None
         """@ivar: Holds customer-specified transaction IDs."""
+        self.metrics = None
+        """@ivar: L{RequestMetrics} of the last request sent."""
+        self.priority = None
+        """@ivar: L{INTERACTIVE<fedex.throttle.INTERACTIVE>},
+            L{NORMAL<fedex.throttle.NORMAL>} or L{BULK<fedex.throttle.BULK>}:
+            which requests waiting on the config's rate limiter go first.
+            None for the limiter's priority of the service."""
+        self.fast_decoding = self.__applies_to_service(config_obj.fast_decoding)
+        """@ivar: When True, replies are decoded into
+            L{ResponseRecord<fedex.decoding.ResponseRecord>}s instead of suds
+            objects. Defaults to the config object's fast_decoding option."""
+        self.envelope_templates = self.__applies_to_service(config_obj.envelope_templates) and \
+            all(isinstance(plugin, GeneralSudsPlugin) for plugin in self.client.options.plugins)
+        """@ivar: When True, envelopes are rendered with
+            L{EnvelopeTemplate<fedex.templates.EnvelopeTemplate>}s where
+            possible. Defaults to the config object's envelope_templates option."""
 
         self.__set_web_authentication_detail()
         self.__set_client_detail(*args, **kwargs)
         self.__set_version_id()
         self.__set_transaction_detail(*args, **kwargs)
         self._prepare_wsdl_objects()
+        self._defaults = self.__copy_defaults(vars(self))
+        self._construct_seconds = time.perf_counter() - start
+
+    def __set_client(self):
+        """
+        Gets a suds client for the service's WSDL, with its own plugin,
+        transport and endpoint.
+        """
+
+        # Clients are shared per WSDL, see CLIENT_CACHE.invalidate() when changing wsdl file.
+        self._plugin = GeneralSudsPlugin(max_length=self.config_obj.log_max_length,
+                                         redact_fields=self.config_obj.log_redact_fields)
+        self.client = CLIENT_CACHE.get_client(self.wsdl_path, proxy=self.config_obj.proxy, plugins=[self._plugin],
+                                              schema_cache_dir=self.config_obj.schema_cache_dir)
+        self.__set_transport()
+        self.__set_endpoint()
+
+    def __set_transport(self):
+        """
+        Swaps in the transport and timeouts configured on the config object.
+        Pooled transports are cheap to create, their connections are shared.
+        """
+
+        transport = None
+        if self.config_obj.transport_factory:
+            transport = self.config_obj.transport_factory(self.config_obj)
+        elif self.config_obj.keep_alive:
+            transport = PooledHttpTransport(pool_maxsize=self.config_obj.pool_maxsize,
+                                            connect_timeout=self.config_obj.connect_timeout)
+        if transport is not None:
+            self.client.set_options(transport=transport)
+            # Proxies are transport options, so they need setting again.
+            if self.config_obj.proxy:
+                self.client.set_options(proxy=self.config_obj.proxy)
+
+        if self.config_obj.read_timeout is not None:
+            self.client.set_options(timeout=self.config_obj.read_timeout)
+
+    def __applies_to_service(self, option):
+        """
+        Resolves a config option that is either a bool or a list of the
+        services it is enabled for.
+        """
+
+        if isinstance(option, (bool, type(None))):
+            return bool(option)
+        return any(isinstance(self, _get_service_class(service)[1]) for service in option)
+
+    def __set_endpoint(self):
+        """
+        Points the client at the configured endpoint_url, keeping the
+        service's path from the WSDL.
+        """
+
+        if self.config_obj.endpoint_url:
+            path = urlparse(self.client.wsdl.services[0].ports[0].location).path
+            self.client.set_options(location=self.config_obj.endpoint_url.rstrip('/') + path)
 
     def __set_web_authentication_detail(self):
         """
@@ -239,6 +761,68 @@ class FedexBaseService(object):
 
         pass
 
+    def _refresh_wsdl_objects(self):
+        """
+        Called by L{reset} to renew default values that depend on when the
+        request was created, such as ship timestamps. Over-ride it in
+        sub-classes that have any.
+        """
+
+        pass
+
+    def reset(self, customer_transaction_id=None):
+        """
+        Puts the request back the way it was when it was created, so it can
+        be filled in and sent again. This copies the WSDL objects made by
+        the constructor instead of creating them again, which is many times
+        faster than creating a new request. The response and metrics are
+        cleared and timestamps are renewed.
+
+        @type customer_transaction_id: L{str}
+        @keyword customer_transaction_id: Replaces the customer transaction
+            ID the request was created with.
+        @rtype: L{FedexBaseService}
+        @return: The request itself.
+        """
+
+        start = time.perf_counter()
+        self.__dict__.update(self.__copy_defaults(self._defaults))
+        if customer_transaction_id is not None:
+            self.__set_transaction_detail(customer_transaction_id=customer_transaction_id)
+        self._refresh_wsdl_objects()
+        self._construct_seconds = time.perf_counter() - start
+        return self
+
+    def clone(self):
+        """
+        Returns a new request of the same kind and configuration, as it was
+        when this one was created, without creating its WSDL objects again.
+        The clone has its own suds client and transport, so it may be used
+        in another thread.
+
+        @rtype: L{FedexBaseService}
+        """
+
+        start = time.perf_counter()
+        clone = copy.copy(self)
+        clone.__set_client()
+        clone.reset()
+        clone._construct_seconds = time.perf_counter() - start
+        return clone
+
+    # Attributes that aren't request data, kept as they are by reset().
+    _SERVICE_ATTRIBUTES = frozenset(['logger', 'config_obj', 'client', 'wsdl_path', 'fast_decoding',
+                                     'envelope_templates'])
+
+    def __copy_defaults(self, attributes):
+        """
+        Copies the request data attributes, see L{reset}.
+        """
+
+        memo = {}
+        return dict((name, _copy_wsdl_value(value, memo)) for name, value in attributes.items()
+                    if not name.startswith('_') and name not in self._SERVICE_ATTRIBUTES)
+
     def __check_response_for_fedex_error(self):
         """
         This checks the response for general Fedex errors that aren't related
@@ -296,7 +880,7 @@ class FedexBaseService(object):
 
         pass
 
-    def send_request(self, send_function=None):
+    def send_request(self, send_function=None, timeout=None):
         """
         Sends the assembled request on the child object.
         @type send_function: function reference
@@ -304,23 +888,685 @@ class FedexBaseService(object):
             parenthesis) to a function that will send the request. This
             allows for overriding the default function in cases such as
             validation requests.
+        @type timeout: L{float}
+        @keyword timeout: Seconds the request must complete in, including
+            looking it up in a response cache, building the envelope,
+            waiting for a connection or the rate limiter, retries and
+            reading the reply. L{FedexTimeoutError} is raised when it
+            doesn't.
+        """
+
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        cached = self._response_cache() if send_function is None else None
+        if cached is None:
+            self._send(send_function, timeout=timeout, deadline=deadline)
+            return
+        if self._serve_from_cache(*cached):
+            return
+        self._send(timeout=timeout, deadline=deadline)
+        self._store_in_cache(*cached)
+
+    def _response_cache(self):
+        """
+        Over-ride this in services that can be served from a cache.
+
+        @rtype: L{tuple}
+        @return: The L{ResponseCache<fedex.cache.ResponseCache>} to serve the
+            request from and the request's key in it, or None.
+        """
+
+        return None
+
+    def _cache_entry(self):
+        """
+        Over-ride this to store something else than self.response in the
+        cache, or to choose when it expires.
+
+        @rtype: L{tuple}
+        @return: The value to cache and the time.time() it expires at, or
+            None for the cache's ttl.
+        """
+
+        return self.response, None
+
+    def _cached_response(self, value):
+        """
+        Over-ride this to turn a value stored by L{_cache_entry} back into a
+        response.
+        """
+
+        return value
+
+    def _serve_from_cache(self, cache, key):
+        """
+        Fills in self.response from the cache if it has an entry for the key,
+        refreshing stale entries in the background.
+
+        @rtype: L{bool}
+        @return: True if the response came from the cache.
+        """
+
+        entry = cache.get(key)
+        if entry is None:
+            return False
+        value, fresh = entry
+        self.response = self._cached_response(value)
+        self.metrics = None
+        if not fresh:
+            cache.refresh(key, self._copy()._fetch_response)
+        return True
+
+    def _store_in_cache(self, cache, key):
+        """
+        Stores the response to a request that wasn't served from the cache,
+        as given by L{_cache_entry}.
+        """
+
+        value, expires = self._cache_entry()
+        cache.put(key, value, expires=expires)
+
+    def _copy(self):
+        """
+        Returns a copy of the request as it is now, with its own client, to
+        send from another thread.
+        """
+
+        duplicate = copy.copy(self)
+        duplicate.__set_client()
+        duplicate.__dict__.update(self.__copy_defaults(vars(self)))
+        return duplicate
+
+    def _fetch_response(self):
+        """
+        Sends the request, bypassing any cache, and returns what to cache
+        and when it expires, as L{_cache_entry} does.
+        """
+
+        self._send()
+        return self._cache_entry()
+
+    def _send(self, send_function=None, reply_parser=None, timeout=None, deadline=None):
+        """
+        Prepares, sends and processes the request, timing each step.
+
+        @keyword reply_parser: See L{_send_prepared}.
+        @keyword timeout: See L{send_request}.
+        @keyword deadline: The time.perf_counter() the timeout runs out at,
+            when it started before this call.
+        """
+
+        if deadline is None and timeout is not None:
+            deadline = time.perf_counter() + timeout
+        self.metrics = RequestMetrics(type(self).__name__)
+        # A reply parser can't be fed a second reply.
+        policy = self.config_obj.retry_policy if reply_parser is None else None
+        hedging = self.config_obj.hedging_policy if reply_parser is None else None
+        try:
+            prepared = self._prepare_request(send_function)
+            prepared.timeout, prepared.deadline = timeout, deadline
+            breaker = self._circuit_breaker(prepared)
+            if policy is not None:
+                policy.request_started(prepared.operation)
+            if hedging is not None:
+                hedging.request_started(prepared.operation)
+            while True:
+                status = None
+                prepared.check_deadline()
+                if breaker is not None:
+                    breaker.before_call()
+                sent = False
+                try:
+                    with self._rate_limit(prepared), self.metrics.phase('network'):
+                        sent = True
+                        if hedging is not None:
+                            reply, status, description = self._send_hedged(prepared, hedging)
+                        else:
+                            reply, status, description = self._send_prepared(prepared, reply_parser)
+                    self._process_reply(prepared, reply, status, description)
+                    if breaker is not None:
+                        breaker.record()
+                    break
+                except Exception as e:
+                    self._record_attempt(breaker, sent, e, status)
+                    delay = self._retry_delay(policy, prepared, e, status)
+                    if delay is None:
+                        raise
+                    with self.metrics.phase('backoff'):
+                        policy.sleep(delay)
+                    self.metrics.attempts += 1
+                except BaseException:
+                    # Interrupted, such as by KeyboardInterrupt.
+                    self._record_attempt(breaker, False)
+                    raise
+        except Exception as e:
+            if self._deadline_passed(deadline, e):
+                self.metrics.error = FedexTimeoutError(timeout)
+                raise self.metrics.error from e
+            self.metrics.error = e
+            raise
+        finally:
+            notify_observers(self.config_obj.observers, self.metrics)
+
+    @staticmethod
+    def _deadline_passed(deadline, error):
+        """
+        Returns True if a request failed with a network error because its
+        deadline passed, so that L{FedexTimeoutError} is raised instead.
+        """
+
+        return deadline is not None and time.perf_counter() >= deadline and \
+            isinstance(error, (OSError, asyncio.TimeoutError))
+
+    def _send_hedged(self, prepared, hedging):
+        """
+        Posts a prepared request as L{_send_prepared} does, and the same
+        envelope again from the hedging policy's thread pool if the policy
+        says so, returning whichever reply comes first. The request is sent
+        on the calling thread. Whichever request loses is aborted if the
+        transport can abort it, or else left to finish in the background.
+
+        @type hedging: L{HedgingPolicy<fedex.hedging.HedgingPolicy>}
+        """
+
+        operation = prepared.operation
+        delay = hedging.hedge_delay(operation)
+        start = time.perf_counter()
+        if delay is None:
+            result = self._send_prepared(prepared)
+            hedging.record(operation, time.perf_counter() - start)
+            return result
+        request = self._transport_request(prepared)
+        hedge_request = self._transport_request(prepared)
+        hedge = hedging.schedule(delay, self._send_hedge, prepared, hedging, hedge_request, request)
+        try:
+            result = self._send_prepared(prepared, request=request)
+        except Exception:
+            if hedge.cancel():
+                raise
+            # Report the original's error if the copy fails too.
+            try:
+                result = hedge.result()
+            except Exception:
+                result = None
+            if result is None:
+                raise
+            hedging.record(operation, time.perf_counter() - start, True)
+            return result
+        if not hedge.cancel():
+            if hedge.done() and hedge.exception() is None and hedge.result() is not None:
+                hedging.record(operation, time.perf_counter() - start, True)
+                return hedge.result()
+            hedge_request.cancelled = True
+            self._abort(hedge_request)
+        hedging.record(operation, time.perf_counter() - start)
+        return result
+
+    def _send_hedge(self, prepared, hedging, request, original):
+        """
+        Posts a copy of a prepared request that is still waiting for its
+        reply, if the hedging policy, rate limiter and circuit breaker allow
+        it, and aborts the original request once the copy's reply came.
+
+        @param request: The suds transport request of the copy.
+        @param original: The suds transport request of the original.
+        @return: The reply as L{_send_prepared} returns it, or None if no
+            copy was sent.
+        """
+
+        if getattr(request, 'cancelled', False) or not hedging.allow_hedge(prepared.operation):
+            return None
+        breaker = self._circuit_breaker(prepared)
+        if breaker is not None:
+            breaker.before_call()
+        self.metrics.hedges += 1
+        sent = False
+        try:
+            with self._rate_limit(prepared):
+                sent = True
+                request.timeout = self._request_timeout(prepared)
+                result = self._send_prepared(prepared, request=request)
+        except BaseException as e:
+            self._record_attempt(breaker, sent and isinstance(e, Exception), e)
+            raise
+        status = result[1]
+        if breaker is not None:
+            breaker.record(None if status in (None, 202) else TransportError(result[2], status), status)
+        self._abort(original)
+        return result
+
+    def _abort(self, request):
+        """
+        Aborts a suds transport request being sent from another thread, if
+        the transport can.
+        """
+
+        abort = getattr(self.client.options.transport, 'abort', None)
+        if abort is not None:
+            abort(request)
+
+    async def _send_hedged_async(self, send, prepared, hedging):
+        """
+        Awaits C{send()}, and a second C{send()} if the hedging policy says
+        so, returning whichever reply comes first and cancelling the other.
+        The second goes through the rate limiter and circuit breaker like
+        the first.
+
+        @type send: L{callable}
+        @param send: Returns a coroutine sending the request.
+        @type hedging: L{HedgingPolicy<fedex.hedging.HedgingPolicy>}
+        """
+
+        operation = prepared.operation
+        delay = hedging.hedge_delay(operation)
+        start = time.perf_counter()
+        tasks = [asyncio.ensure_future(send())]
+        try:
+            if delay is not None:
+                await asyncio.wait(tasks, timeout=delay)
+                if not tasks[0].done() and hedging.allow_hedge(operation):
+                    self.metrics.hedges += 1
+                    tasks.append(asyncio.ensure_future(self._send_hedge_async(send, prepared)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        hedging.record(operation, time.perf_counter() - start, task is not tasks[0])
+                        return task.result()
+            # Both failed, report the original's error.
+            return tasks[0].result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _send_hedge_async(self, send, prepared):
+        """
+        Awaits C{send()} for a copy of a request, through the rate limiter
+        and circuit breaker.
+        """
+
+        breaker = self._circuit_breaker(prepared)
+        if breaker is not None:
+            breaker.before_call()
+        sent = False
+        try:
+            async with self._rate_limit_async(prepared):
+                sent = True
+                reply = await send()
+        except BaseException as e:
+            self._record_attempt(breaker, sent and isinstance(e, Exception), e)
+            raise
+        status = reply[0]
+        if breaker is not None:
+            failed = not 200 <= status < 300
+            breaker.record(TransportError(reply[1], status) if failed else None, status if failed else None)
+        return reply
+
+    @staticmethod
+    def _record_attempt(breaker, sent, error=None, status=None):
+        """
+        Tells the circuit breaker, if there is one, how a failed attempt
+        went. Attempts that weren't sent, because the rate limiter ran out
+        of time or they were cancelled, don't count against the endpoint.
+        """
+
+        if breaker is None:
+            return
+        if sent:
+            breaker.record(error, status)
+        else:
+            breaker.abandon()
+
+    def _retry_delay(self, policy, prepared, error, status):
+        """
+        Asks the retry policy, if there is one, whether to resend a prepared
+        request after a failed attempt.
+
+        @rtype: L{float}
+        @return: Seconds to wait before resending, or None to give up.
+        """
+
+        if policy is None:
+            return None
+        delay = policy.retry_delay(prepared.operation, self.metrics.attempts, error, status, prepared.time_left())
+        if delay is not None:
+            self.logger.warning("Retrying %s in %.2fs after attempt %d failed: %r", prepared.operation, delay,
+                                self.metrics.attempts, error)
+        return delay
+
+    @contextmanager
+    def _rate_limit(self, prepared):
+        """
+        Waits for the config's L{RateLimiter<fedex.throttle.RateLimiter>}, if
+        there is one, to let an attempt at a prepared request through, timed
+        as the 'throttle' phase, and releases it once the wrapped block is
+        done.
         """
 
-        # Send the request and get the response back.
+        limiter = self.config_obj.rate_limiter
+        if limiter is None:
+            yield
+            return
+        account, service = self.config_obj.account_number, type(self).__name__
+        with self.metrics.phase('throttle'):
+            waited = limiter.acquire(account, service, self.priority, prepared.time_left())
+        if waited is None:
+            raise FedexTimeoutError(prepared.timeout)
         try:
-            # If the user has overridden the send function, use theirs
-            # instead of the default.
-            if send_function:
-                # Follow the overridden function.
-                self.response = send_function()
+            yield
+        finally:
+            limiter.release(account, service)
+
+    @asynccontextmanager
+    async def _rate_limit_async(self, prepared):
+        """
+        L{_rate_limit} for send_request_async.
+        """
+
+        limiter = self.config_obj.rate_limiter
+        if limiter is None:
+            yield
+            return
+        account, service = self.config_obj.account_number, type(self).__name__
+        with self.metrics.phase('throttle'):
+            waited = await limiter.acquire_async(account, service, self.priority, prepared.time_left())
+        if waited is None:
+            raise FedexTimeoutError(prepared.timeout)
+        try:
+            yield
+        finally:
+            limiter.release(account, service)
+
+    def _circuit_breaker(self, prepared):
+        """
+        Returns the L{CircuitBreaker<fedex.circuit.CircuitBreaker>} of this
+        service and the prepared request's endpoint, or None if the config
+        has no circuit breakers.
+        """
+
+        registry = self.config_obj.circuit_breakers
+        if registry is None:
+            return None
+        return registry.breaker_for(type(self).__name__, prepared.url)
+
+    async def send_request_async(self, send_function=None, transport=None, timeout=None):
+        """
+        Sends the assembled request without blocking the event loop. The
+        envelope is built by suds exactly as for L{send_request}, sent with
+        an L{AsyncHttpTransport}, and the reply goes through the same
+        error and warning checks.
+
+        The config's keep_alive and pool_maxsize settings apply to the
+        shared transport as they do to L{send_request}. With a
+        transport_factory, the request is instead sent by the suds transport
+        it returns, on the event loop's default executor.
+
+        @type send_function: function reference
+        @keyword send_function: See L{send_request}.
+        @type transport: L{AsyncHttpTransport}
+        @keyword transport: Defaults to the shared transport of the running
+            event loop for the config's settings.
+        @type timeout: L{float}
+        @keyword timeout: See L{send_request}.
+        """
+
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        cached = self._response_cache() if send_function is None else None
+        if cached is not None and self._serve_from_cache(*cached):
+            return self.response
+        self.metrics = RequestMetrics(type(self).__name__)
+        policy = self.config_obj.retry_policy
+        hedging = self.config_obj.hedging_policy
+        try:
+            prepared = self._prepare_request(send_function)
+            prepared.timeout, prepared.deadline = timeout, deadline
+            if transport is None and self.config_obj.transport_factory is not None:
+                send = functools.partial(self._send_prepared_async, prepared)
             else:
-                # Default scenario, business as usual.
-                self.response = self._assemble_and_send_request()
+                if transport is None:
+                    transport = get_async_transport(
+                            self.config_obj.pool_maxsize if self.config_obj.keep_alive else 0)
+                send = functools.partial(transport.send, prepared.url, prepared.envelope, prepared.headers,
+                                         connect_timeout=self.config_obj.connect_timeout,
+                                         read_timeout=self.client.options.timeout, proxy=self.config_obj.proxy)
+            breaker = self._circuit_breaker(prepared)
+            if policy is not None:
+                policy.request_started(prepared.operation)
+            if hedging is not None:
+                hedging.request_started(prepared.operation)
+            while True:
+                status = None
+                prepared.check_deadline()
+                if breaker is not None:
+                    breaker.before_call()
+                sent = False
+                try:
+                    async with self._rate_limit_async(prepared):
+                        with self.metrics.phase('network'):
+                            sent = True
+                            if hedging is not None:
+                                sending = self._send_hedged_async(send, prepared, hedging)
+                            else:
+                                sending = send()
+                            # Bounds the wait for a connection too.
+                            status, reason, headers, body = await asyncio.wait_for(
+                                    sending, prepared.check_deadline())
+                    if 200 <= status < 300 and status not in (202, 204):
+                        status = None
+                    self._process_reply(prepared, body, status, reason)
+                    if breaker is not None:
+                        breaker.record()
+                    break
+                except Exception as e:
+                    self._record_attempt(breaker, sent, e, status)
+                    delay = self._retry_delay(policy, prepared, e, status)
+                    if delay is None:
+                        raise
+                    with self.metrics.phase('backoff'):
+                        await asyncio.sleep(delay)
+                    self.metrics.attempts += 1
+                except BaseException:
+                    # Cancelled.
+                    self._record_attempt(breaker, False)
+                    raise
+        except Exception as e:
+            if self._deadline_passed(deadline, e):
+                self.metrics.error = FedexTimeoutError(timeout)
+                raise self.metrics.error from e
+            self.metrics.error = e
+            raise
+        finally:
+            notify_observers(self.config_obj.observers, self.metrics)
+        if cached is not None:
+            self._store_in_cache(*cached)
+        return self.response
+
+    async def _send_prepared_async(self, prepared):
+        """
+        Posts a prepared request with the client's suds transport on the
+        event loop's default executor. A cancelled send still runs to its
+        end in the executor thread.
+
+        @rtype: L{tuple}
+        @return: The HTTP status, reason, headers and body, as returned by
+            L{AsyncHttpTransport.send}.
+        """
+
+        loop = asyncio.get_event_loop()
+        reply, status, description = await loop.run_in_executor(None, self._send_prepared, prepared)
+        return status or 200, description, {}, reply
+
+    def _prepare_request(self, send_function=None):
+        """
+        Runs the send function with suds set to build the SOAP envelope
+        without sending it, so that it can be sent some other way.
+
+        @type send_function: function reference
+        @keyword send_function: See L{send_request}.
+        @rtype: L{FedexPreparedRequest}
+        """
+
+        send_function = send_function or self._assemble_and_send_request
+        selector = _RecordingServiceSelector(self.client.service, capture=self.envelope_templates)
+        self.client.service = selector
+        self.client.set_options(nosend=True)
+        self._plugin.prune_seconds = 0.0
+        start = time.perf_counter()
+        try:
+            context = send_function()
+            if selector.capture and selector.method is not None:
+                context = self._render_envelope(selector)
+        finally:
+            self.client.service = selector.service_selector
+            self.client.set_options(nosend=False)
+
+        method = selector.method
+        headers = {'Content-Type': 'text/xml; charset=utf-8', 'SOAPAction': method.soap.action}
+        headers.update(self.client.options.headers)
+        prepared = FedexPreparedRequest(method.name, self.client.options.location or method.location,
+                                        headers, context)
+        if self.metrics is not None:
+            self.metrics.operation = method.name
+            self.metrics.add('construct', self._construct_seconds)
+            self.metrics.add('marshal', time.perf_counter() - start - self._plugin.prune_seconds)
+            self.metrics.add('prune', self._plugin.prune_seconds)
+            self.metrics.request_bytes = len(prepared.envelope)
+        return prepared
+
+    def _render_envelope(self, selector):
+        """
+        Renders the envelope for an operation call captured by a recording
+        selector, with its L{EnvelopeTemplate<fedex.templates.EnvelopeTemplate>}
+        if it can, or else with suds, compiling the template on the way.
+
+        @return: A suds RequestContext holding the envelope.
+        """
+
+        method = selector.method
+        template = get_envelope_template(self.client, method)
+        envelope = None if selector.args else template.render(selector.kwargs)
+        if envelope is None:
+            context = getattr(selector.service_selector, method.name)(*selector.args, **selector.kwargs)
+            if not selector.args:
+                template.compile(context.envelope, selector.kwargs)
+            return context
+        # The envelope is already pruned, the plugins only get to see it.
+        envelope = PluginContainer(self.client.options.plugins).message.sending(envelope=envelope).envelope
+        return RequestContext(_SoapClient(self.client, method).process_reply, envelope)
+
+    def _transport_request(self, prepared):
+        """
+        Returns the suds transport L{Request} posting a prepared request,
+        with the time left before its deadline as its timeout.
+        """
+
+        request = Request(prepared.url, prepared.envelope)
+        request.headers = prepared.headers
+        request.timeout = self._request_timeout(prepared)
+        return request
+
+    def _request_timeout(self, prepared):
+        """
+        Returns the timeout of a transport request for a prepared request:
+        the time left before its deadline, if it has one and it is shorter
+        than the suds timeout, or None.
+        """
+
+        time_left = prepared.check_deadline()
+        if time_left is None:
+            return None
+        return min(time_left, self.client.options.timeout or time_left)
+
+    def _send_prepared(self, prepared, reply_parser=None, request=None):
+        """
+        Posts a prepared request with the client's suds transport.
+
+        @keyword request: The suds transport request to post, as returned
+            by L{_transport_request}.
+        @keyword reply_parser: An incremental parser, such as a
+            L{LabelStreamParser<fedex.streaming.LabelStreamParser>}, fed
+            the body of a successful reply in chunks. Its close() returns
+            the reply to process. Transports with a send_streaming() method
+            stream the body into it as it is received.
+        @rtype: L{tuple}
+        @return: The reply body, HTTP status (None for 200) and status
+            description, as expected by L{_process_reply}.
+        """
+
+        transport = self.client.options.transport
+        if request is None:
+            request = self._transport_request(prepared)
+        try:
+            if reply_parser is not None and hasattr(transport, 'send_streaming'):
+                if transport.send_streaming(request, reply_parser.feed, reply_parser.chunk_size) in (202, 204):
+                    return None, 202, None
+                return self._close_reply_parser(reply_parser), None, None
+            reply = transport.send(request)
+        except TransportError as e:
+            # As in suds itself, error replies may carry a SOAP fault.
+            return e.fp and e.fp.read() or b'', e.httpcode, str(e)
+        if reply is None:
+            # 202 and 204 replies have no envelope.
+            return None, 202, None
+        if reply_parser is not None:
+            message = reply.message
+            for start in range(0, len(message), reply_parser.chunk_size):
+                reply_parser.feed(message[start:start + reply_parser.chunk_size])
+            return self._close_reply_parser(reply_parser), None, None
+        return reply.message, None, None
+
+    def _close_reply_parser(self, reply_parser):
+        if self.metrics is not None:
+            self.metrics.reply_bytes = reply_parser.size
+        return reply_parser.close()
+
+    def _process_reply(self, prepared, reply, status=None, description=None):
+        """
+        Unmarshals a reply to a prepared request into self.response and
+        checks it, just like L{send_request} does.
+        """
+
+        metrics = self.metrics
+        if metrics is not None and metrics.reply_bytes is None and reply is not None:
+            metrics.reply_bytes = len(reply)
+        prepared.check_deadline()
+        start = time.perf_counter()
+        try:
+            response = None
+            if self.fast_decoding and status is None and reply:
+                response = self._decode_reply(reply)
+            if response is None:
+                response = prepared.process_reply(reply, status, description)
+            self.response = response
         except suds.WebFault as fault:
-            # When this happens, throw an informative message reminding the
-            # user to check all required variables, making sure they are
-            # populated and valid
             raise SchemaValidationError(fault.fault)
+        finally:
+            if metrics is not None:
+                metrics.add('parse', time.perf_counter() - start)
+        start = time.perf_counter()
+        try:
+            self._check_response()
+        finally:
+            if metrics is not None:
+                metrics.add('checks', time.perf_counter() - start)
+
+    def _decode_reply(self, reply):
+        """
+        Decodes a successful reply with the fast decoder, passing it through
+        the suds plugins' received() hooks just as suds would.
+
+        @return: A L{ResponseRecord<fedex.decoding.ResponseRecord>}, or None
+            if the reply should be left to suds.
+        """
+
+        reply = PluginContainer(self.client.options.plugins).message.received(reply=reply).reply
+        return get_reply_decoder(self.client).decode(reply)
+
+    def _check_response(self):
+        """
+        Checks self.response for errors and warnings.
+        """
 
         # Check the response for general Fedex errors/failures that aren't
         # specific to any given WSDL/request.
@@ -0,0 +1,143 @@
+"""
+The L{batch} module runs many Fedex requests concurrently on a bounded
+thread pool. It is the engine behind the bulk request classes, such as
+L{FedexBulkRateRequest<fedex.services.rate_service.FedexBulkRateRequest>}.
+"""
+
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+
+class BatchResult(object):
+    """
+    The outcome of one item in a batch. Exactly one of C{value} and C{error}
+    is set.
+    """
+
+    def __init__(self, index, item, value=None, error=None):
+        self.index = index
+        """@ivar: Position of the item in the input."""
+        self.item = item
+        """@ivar: The input item."""
+        self.value = value
+        """@ivar: What the batch function returned for the item."""
+        self.error = error
+        """@ivar: The exception raised for the item, if any."""
+
+    @property
+    def ok(self):
+        """True if the item was processed without an exception."""
+
+        return self.error is None
+
+    def __repr__(self):
+        return '<BatchResult %d %s>' % (self.index, 'ok' if self.ok else repr(self.error))
+
+
+def chunked(items, size):
+    """
+    Lazily splits an iterable into lists of at most C{size} items.
+    """
+
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_batch(function, items, max_workers=8, ordered=True):
+    """
+    Calls C{function} on each item using up to C{max_workers} threads and
+    yields a L{BatchResult} per item. Exceptions are captured per item rather
+    than aborting the batch.
+
+    Items are pulled from the iterable lazily and at most twice C{max_workers}
+    are pending at once, so arbitrarily large inputs run in bounded memory.
+
+    @type function: L{callable}
+    @param function: Called with each item.
+    @type items: iterable
+    @param items: The items to process.
+    @type max_workers: L{int}
+    @keyword max_workers: Maximum number of concurrent calls.
+    @type ordered: L{bool}
+    @keyword ordered: When True, results are yielded in input order.
+        Otherwise they are yielded as they complete.
+    """
+
+    def call(index, item):
+        try:
+            return BatchResult(index, item, value=function(item))
+        except Exception as e:
+            return BatchResult(index, item, error=e)
+
+    items = enumerate(items)
+    window = max(1, max_workers) * 2
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque(executor.submit(call, index, item) for index, item in islice(items, window))
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+                yield done[0].result()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield future.result()
+            for index, item in islice(items, len(done)):
+                pending.append(executor.submit(call, index, item))
+
+
+def deadline_after(timeout):
+    """
+    Returns the time.perf_counter() a batch given C{timeout} seconds must
+    be done by, or None for no timeout.
+    """
+
+    return None if timeout is None else time.perf_counter() + timeout
+
+
+def time_left(deadline):
+    """
+    Returns the seconds left until a L{deadline_after}, as the timeout of
+    the next request of the batch, or None for no deadline.
+    """
+
+    return None if deadline is None else max(0.0, deadline - time.perf_counter())
+
+
+def fill_cache(lookup, items, max_workers=8):
+    """
+    Calls C{lookup} on each item concurrently to fill a response cache, for
+    example with the requests of known postal codes or lanes.
+
+    @type lookup: L{callable}
+    @param lookup: Sends the request for an item, returning True if it was
+        sent to Fedex or False if it was answered from the cache.
+    @type items: iterable
+    @param items: The items to look up.
+    @type max_workers: L{int}
+    @keyword max_workers: Maximum number of concurrent calls.
+    @rtype: L{dict}
+    @return: How many items were C{loaded} from Fedex, were C{cached}
+        already or C{failed} with a L{FedexError<fedex.base_service.FedexError>}.
+        Other exceptions are raised.
+    """
+
+    from .base_service import FedexError
+
+    counts = {'loaded': 0, 'cached': 0, 'failed': 0}
+    for result in run_batch(lookup, items, max_workers=max_workers, ordered=False):
+        if not result.ok:
+            if not isinstance(result.error, FedexError):
+                raise result.error
+            counts['failed'] += 1
+        elif result.value:
+            counts['loaded'] += 1
+        else:
+            counts['cached'] += 1
+    return counts
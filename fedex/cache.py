@@ -0,0 +1,486 @@
+"""
+The L{cache} module contains caches that python-fedex can use to avoid
+repeating expensive work, such as parsing the bundled WSDL files or asking
+Fedex the same question again.
+
+Replies are cached by a L{ResponseCache}, which keeps its entries in a
+L{CacheBackend}: in memory with L{MemoryCacheBackend}, or shared between
+processes with L{SQLiteCacheBackend} or a backend of your own.
+"""
+
+import decimal
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import suds
+from suds.cache import Cache
+
+from .decoding import to_response_record
+
+
+class WsdlSchemaCache(Cache):
+    """
+    A suds object cache that stores the resolved schema (the suds WSDL
+    Definitions object) of a single WSDL file on disk, so that new processes
+    can load it instead of parsing the WSDL XML again.
+
+    Entries are keyed by a hash of the WSDL file contents, the suds version,
+    the Python version and the cache format version, so a changed WSDL or an
+    upgraded suds never picks up a stale schema. Pass an instance to a suds
+    Client along with C{cachingpolicy=1}.
+    """
+
+    FORMAT_VERSION = 1
+    """Bump this when the pickled layout changes to orphan old entries."""
+
+    def __init__(self, location, wsdl_path):
+        """
+        @type location: L{str}
+        @param location: Directory to store the pickled schemas in. It is
+            created on the first write if it doesn't exist.
+        @type wsdl_path: L{str}
+        @param wsdl_path: Path to the WSDL file whose schema is cached.
+        """
+
+        self.logger = logging.getLogger('fedex')
+        self.location = location
+        """@ivar: Directory holding the pickled schemas."""
+        self.wsdl_path = wsdl_path
+        """@ivar: Path to the WSDL file whose schema is cached."""
+        self.hits = 0
+        """@ivar: Number of schemas loaded from disk."""
+        self.misses = 0
+        """@ivar: Number of lookups that found no usable entry."""
+        self._digest = None
+
+    def digest(self):
+        """
+        Returns the version key for this WSDL, computed once per instance.
+        """
+
+        if self._digest is None:
+            digest = hashlib.sha256()
+            with open(self.wsdl_path, 'rb') as wsdl_file:
+                digest.update(wsdl_file.read())
+            digest.update('suds-{}|python-{}.{}|format-{}'.format(
+                suds.__version__, sys.version_info[0], sys.version_info[1],
+                self.FORMAT_VERSION).encode('utf-8'))
+            self._digest = digest.hexdigest()[:32]
+        return self._digest
+
+    def _prefix(self):
+        return os.path.splitext(os.path.basename(self.wsdl_path))[0] + '-'
+
+    def _filename(self, id):
+        return os.path.join(self.location, '{}{}-{}.pickle'.format(self._prefix(), self.digest(), id))
+
+    def get(self, id):
+        """Loads a cached schema, returning None when there is none."""
+
+        filename = self._filename(id)
+        try:
+            with open(filename, 'rb') as cache_file:
+                obj = pickle.load(cache_file)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        except Exception as e:
+            # A truncated or otherwise unreadable entry is simply rebuilt.
+            self.logger.warning("Discarding unreadable WSDL schema cache entry %s: %s", filename, e)
+            self.purge(id)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return obj
+
+    def put(self, id, object):
+        """Stores a schema, writing to a temporary file first so concurrent
+        workers never read a half-written entry."""
+
+        try:
+            if not os.path.isdir(self.location):
+                os.makedirs(self.location)
+            fd, temp_name = tempfile.mkstemp(dir=self.location, prefix=self._prefix(), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as cache_file:
+                    pickle.dump(object, cache_file, pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_name, self._filename(id))
+            except Exception:
+                os.unlink(temp_name)
+                raise
+        except Exception as e:
+            # Caching is an optimization, never a reason to fail a request.
+            self.logger.warning("Could not write WSDL schema cache entry for %s: %s", self.wsdl_path, e)
+        return object
+
+    def purge(self, id):
+        """Removes the cached schema for the current WSDL version."""
+
+        try:
+            os.remove(self._filename(id))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Removes every cached schema of this WSDL, for all versions."""
+
+        if not os.path.isdir(self.location):
+            return
+        for filename in os.listdir(self.location):
+            if filename.startswith(self._prefix()) and filename.endswith('.pickle'):
+                try:
+                    os.remove(os.path.join(self.location, filename))
+                except OSError:
+                    pass
+
+
+class CacheBackend(object):
+    """
+    Storage for the entries of a L{ResponseCache}. An entry is a value and
+    the time.time() it expires at, stored under a string key. Backends may
+    drop entries at any time, for example to bound their size.
+
+    Subclass it to keep entries in another store, such as memcached or Redis.
+    """
+
+    def get(self, key):
+        """
+        Returns the (value, expires) entry stored under a key, or None.
+        """
+
+        raise NotImplementedError
+
+    def set(self, key, value, expires):
+        """
+        Stores an entry, replacing any entry of the key.
+        """
+
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Removes the entry of a key, if there is one.
+        """
+
+        raise NotImplementedError
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Keeps entries in a dict in memory, dropping the least recently used
+    once there are too many. Values are stored as they are, so they should
+    be treated as read-only.
+    """
+
+    def __init__(self, max_size=1000):
+        """
+        @type max_size: L{int}
+        @keyword max_size: The most entries kept.
+        """
+
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, expires):
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Keeps entries in an SQLite database file, which any number of processes
+    on a host may share. Values are pickled; suds objects are converted to
+    L{ResponseRecord<fedex.decoding.ResponseRecord>}s first, since they
+    can't be pickled. The least recently used entries are dropped once there
+    are too many.
+    """
+
+    EVICT_EVERY = 64
+    """Writes between checks of the number of entries."""
+
+    def __init__(self, path, max_size=100000, table='fedex_cache'):
+        """
+        @type path: L{str}
+        @param path: The database file, created if it doesn't exist.
+        @type max_size: L{int}
+        @keyword max_size: The most entries kept, roughly.
+        @type table: L{str}
+        @keyword table: Name of the table holding the entries, so several
+            caches can share a database.
+        """
+
+        self.path = path
+        self.max_size = max_size
+        self.table = table
+        self._local = threading.local()
+        self._writes = 0
+        connection = self._connection()
+        with connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, value BLOB, '
+                               'expires REAL, accessed REAL)'.format(self.table))
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=30)
+        return connection
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute('SELECT value, expires FROM {} WHERE key = ?'.format(self.table),
+                                 (key,)).fetchone()
+        if row is None:
+            return None
+        with connection:
+            connection.execute('UPDATE {} SET accessed = ? WHERE key = ?'.format(self.table), (time.time(), key))
+        return pickle.loads(row[0]), row[1]
+
+    def set(self, key, value, expires):
+        value = pickle.dumps(to_response_record(value), pickle.HIGHEST_PROTOCOL)
+        connection = self._connection()
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO {} (key, value, expires, accessed) VALUES (?, ?, ?, ?)'
+                               .format(self.table), (key, value, expires, time.time()))
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                connection.execute('DELETE FROM {0} WHERE key IN (SELECT key FROM {0} ORDER BY accessed DESC '
+                                   'LIMIT -1 OFFSET ?)'.format(self.table), (self.max_size,))
+
+    def delete(self, key):
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM {} WHERE key = ?'.format(self.table), (key,))
+
+    def clear(self):
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM {}'.format(self.table))
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM {}'.format(self.table)).fetchone()[0]
+
+
+class ResponseCache(object):
+    """
+    Caches Fedex replies for a while, keyed on what was asked. Set it as the
+    cache option of a service on your L{FedexConfig<fedex.config.FedexConfig>},
+    such as C{rate_cache}, and send_request() fills in the response from the
+    cache when it can.
+
+    Entries are fresh for C{ttl} seconds. With a C{stale_ttl}, an entry
+    stays usable for that much longer: it is served straight away and
+    refreshed from Fedex in the background, so popular requests never wait
+    on Fedex.
+
+    Cached responses are shared, treat them as read-only.
+    """
+
+    def __init__(self, backend=None, ttl=300, stale_ttl=0, max_size=1000, key_function=None, clock=time.time):
+        """
+        @type backend: L{CacheBackend}
+        @keyword backend: Where entries are kept. Defaults to a
+            L{MemoryCacheBackend} of C{max_size} entries.
+        @type ttl: L{float}
+        @keyword ttl: Seconds an entry is fresh for.
+        @type stale_ttl: L{float}
+        @keyword stale_ttl: Seconds an entry may be served, and refreshed in
+            the background, after it stopped being fresh.
+        @type max_size: L{int}
+        @keyword max_size: Size of the default backend.
+        @type key_function: L{callable}
+        @keyword key_function: Called with a request to get its key,
+            replacing the service's own key function, e.g. to round
+            weights coarser.
+        @type clock: L{callable}
+        @keyword clock: Returns the current time.time().
+        """
+
+        self.backend = backend if backend is not None else MemoryCacheBackend(max_size)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.key_function = key_function
+        self.clock = clock
+        self.logger = logging.getLogger('fedex.cache')
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.hits = 0
+        """@ivar: Number of lookups served fresh entries."""
+        self.stale_hits = 0
+        """@ivar: Number of lookups served stale entries."""
+        self.misses = 0
+        """@ivar: Number of lookups that found no usable entry."""
+        self.refreshes = 0
+        """@ivar: Number of background refreshes started."""
+        self.refresh_errors = 0
+        """@ivar: Number of background refreshes that failed."""
+
+    def get(self, key):
+        """
+        Looks an entry up.
+
+        @rtype: L{tuple}
+        @return: The value and whether it is still fresh, or None if there is
+            no usable entry.
+        """
+
+        entry = self.backend.get(key)
+        now = self.clock()
+        if entry is not None:
+            value, expires = entry
+            if now < expires:
+                self._count('hits')
+                return value, True
+            if now < expires + self.stale_ttl:
+                self._count('stale_hits')
+                return value, False
+            self.backend.delete(key)
+        self._count('misses')
+        return None
+
+    def put(self, key, value, ttl=None, expires=None):
+        """
+        Stores a value.
+
+        @type ttl: L{float}
+        @keyword ttl: Seconds the value is fresh for, instead of the
+            cache's ttl.
+        @type expires: L{float}
+        @keyword expires: The time.time() the value stops being fresh at,
+            instead of a ttl.
+        """
+
+        if expires is None:
+            expires = self.clock() + (self.ttl if ttl is None else ttl)
+        self.backend.set(key, value, expires)
+
+    def invalidate(self, key=None):
+        """
+        Drops the entry of a key, or all entries.
+        """
+
+        if key is None:
+            self.backend.clear()
+        else:
+            self.backend.delete(key)
+
+    def refresh(self, key, fetch):
+        """
+        Stores the value returned by fetch() under a key, fetching it in a
+        background thread. Nothing is done if the key is being refreshed
+        already.
+
+        @type fetch: L{callable}
+        @param fetch: Returns the value and the time.time() it expires at,
+            or None for the cache's ttl.
+        """
+
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self.refreshes += 1
+        thread = threading.Thread(target=self._refresh, args=(key, fetch), name='fedex-cache-refresh')
+        thread.daemon = True
+        thread.start()
+
+    def _refresh(self, key, fetch):
+        try:
+            value, expires = fetch()
+            self.put(key, value, expires=expires)
+        except Exception:
+            self._count('refresh_errors')
+            self.logger.warning("Refreshing cache entry %s failed.", key, exc_info=True)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        """
+        Returns a dict with the lookup and refresh counters, and the number
+        of C{entries} if the backend can tell.
+        """
+
+        with self._lock:
+            stats = {'hits': self.hits, 'stale_hits': self.stale_hits, 'misses': self.misses,
+                     'refreshes': self.refreshes, 'refresh_errors': self.refresh_errors}
+        if hasattr(self.backend, '__len__'):
+            stats['entries'] = len(self.backend)
+        return stats
+
+
+def make_cache_key(prefix, *parts):
+    """
+    Builds a cache key from a prefix and any number of values that
+    L{canonical_value} accepts.
+    """
+
+    digest = hashlib.sha256(repr(tuple(canonical_value(part) for part in parts)).encode('utf-8'))
+    return '{}:{}'.format(prefix, digest.hexdigest())
+
+
+def canonical_value(value):
+    """
+    Returns a plain, stable form of a WSDL object or value for building
+    cache keys. Empty values are left out of objects, numbers compare
+    equal whatever their type and strings are stripped and upper-cased.
+    """
+
+    if hasattr(value, '__keylist__'):
+        items = ((name, canonical_value(getattr(value, name))) for name in value.__keylist__)
+        return tuple(sorted((name, item) for name, item in items if item not in (None, '', ())))
+    if isinstance(value, dict):
+        items = ((name, canonical_value(item)) for name, item in value.items())
+        return tuple(sorted((name, item) for name, item in items if item not in (None, '', ())))
+    if isinstance(value, (list, tuple)):
+        return tuple(canonical_value(item) for item in value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return repr(float(value))
+    if isinstance(value, str):
+        return ' '.join(value.split()).upper()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
@@ -0,0 +1,211 @@
+"""
+The L{circuit} module stops sending requests to a Fedex endpoint that keeps
+failing, so that callers fail fast instead of each waiting on a timeout.
+
+Set a L{CircuitBreakerRegistry} as the C{circuit_breakers} of your
+L{FedexConfig<fedex.config.FedexConfig>}. It keeps a L{CircuitBreaker} per
+service and endpoint URL. After C{failure_threshold} consecutive failures,
+see L{is_failure}, the breaker opens and requests raise
+L{FedexCircuitOpenError} without being sent. After C{reset_timeout} seconds
+it lets a few probe requests through: it closes again if they succeed, and
+opens again if they fail.
+
+Requests answered from a response cache never reach the breaker, so a
+service with a cache keeps answering known requests while Fedex is down.
+"""
+
+import asyncio
+import http.client
+import logging
+import threading
+import time
+
+from .base_service import FedexBaseServiceException, FedexFailure, FedexTimeoutError
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class FedexCircuitOpenError(FedexBaseServiceException):
+    """
+    Exception: The request wasn't sent, because its endpoint has been
+    failing. Try again after C{retry_after} seconds, or fall back.
+    """
+
+    def __init__(self, name, retry_after):
+        self.error_code = -1
+        self.value = "Circuit for {} is open, retry in {:.1f}s.".format(name, retry_after)
+        self.name = name
+        """@ivar: The service and endpoint whose circuit is open."""
+        self.retry_after = retry_after
+        """@ivar: Seconds until the circuit lets a probe through."""
+
+
+class CircuitBreaker(object):
+    """
+    The circuit of one service and endpoint.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, half_open_max_calls=1, clock=time.monotonic):
+        """
+        @type name: L{str}
+        @param name: What the circuit is for, used in messages.
+        @type failure_threshold: L{int}
+        @keyword failure_threshold: Consecutive failures that open it.
+        @type reset_timeout: L{float}
+        @keyword reset_timeout: Seconds it stays open before probing.
+        @type half_open_max_calls: L{int}
+        @keyword half_open_max_calls: Probe requests let through at once.
+        @type clock: L{callable}
+        @keyword clock: Returns the current time in seconds.
+        """
+
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.clock = clock
+        self.logger = logging.getLogger('fedex.circuit')
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probes = 0
+        self.rejected = 0
+        """@ivar: Number of requests failed fast."""
+        self.opened = 0
+        """@ivar: Number of times the circuit opened."""
+
+    @property
+    def state(self):
+        """
+        L{CLOSED}, L{OPEN} or L{HALF_OPEN}.
+        """
+
+        with self._lock:
+            if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def before_call(self):
+        """
+        Called before a request is sent.
+
+        @raise FedexCircuitOpenError: If the request must not be sent.
+        """
+
+        with self._lock:
+            if self._state == OPEN:
+                retry_after = self._opened_at + self.reset_timeout - self.clock()
+                if retry_after > 0:
+                    self.rejected += 1
+                    raise FedexCircuitOpenError(self.name, retry_after)
+                self._state = HALF_OPEN
+                self._probes = 0
+            if self._state == HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    self.rejected += 1
+                    raise FedexCircuitOpenError(self.name, 0.0)
+                self._probes += 1
+
+    def record(self, error=None, status=None):
+        """
+        Called after a request was sent, with the exception it failed with
+        and the HTTP status of its reply, if any.
+        """
+
+        failed = error is not None and is_failure(error, status)
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+            if not failed:
+                if self._state != CLOSED:
+                    self.logger.info("Circuit for %s closed.", self.name)
+                self._state = CLOSED
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opened += 1
+                    self.logger.warning("Circuit for %s opened after %d failure(s): %r", self.name,
+                                        self._failures, error)
+                self._state = OPEN
+                self._opened_at = self.clock()
+
+    def abandon(self):
+        """
+        Called instead of L{record} when a request let through by
+        L{before_call} wasn't sent, or was cancelled, so that it says
+        nothing about the endpoint. Frees its probe slot.
+        """
+
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+
+def is_failure(error, status=None):
+    """
+    Returns True if a request failed in a way that counts against its
+    endpoint: a transport error or timeout, including the request's own
+    L{FedexTimeoutError<fedex.base_service.FedexTimeoutError>}, an HTTP 429
+    or 5xx reply, or a L{FedexFailure<fedex.base_service.FedexFailure>}.
+
+    @param error: The exception the request failed with.
+    @type status: L{int}
+    @param status: The HTTP status of the reply, None for 200 or if there
+        was no reply.
+    """
+
+    if isinstance(error, (FedexFailure, FedexTimeoutError)):
+        return True
+    if status is not None:
+        return status == 429 or 500 <= status < 600
+    return isinstance(error, (OSError, http.client.HTTPException, asyncio.TimeoutError))
+
+
+class CircuitBreakerRegistry(object):
+    """
+    Hands out a L{CircuitBreaker} per service and endpoint URL, all with the
+    same settings.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, half_open_max_calls=1, clock=time.monotonic):
+        """
+        The keyword args are those of L{CircuitBreaker}.
+        """
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def breaker_for(self, service, url):
+        """
+        Returns the breaker of a service, such as 'FedexRateServiceRequest',
+        and endpoint URL.
+        """
+
+        key = (service, url)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(
+                    '{} at {}'.format(service, url), self.failure_threshold, self.reset_timeout,
+                    self.half_open_max_calls, self.clock)
+        return breaker
+
+    def stats(self):
+        """
+        Returns a dict of the state, opened and rejected counts of each
+        breaker, by breaker name.
+        """
+
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return dict((breaker.name, {'state': breaker.state, 'opened': breaker.opened, 'rejected': breaker.rejected})
+                    for breaker in breakers)
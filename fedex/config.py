@@ -21,7 +21,13 @@ class FedexConfig(object):
     """
 
     def __init__(self, key, password, account_number=None, meter_number=None, freight_account_number=None,
-                 integrator_id=None, wsdl_path=None, express_region_code=None, use_test_server=False, proxy=None):
+                 integrator_id=None, wsdl_path=None, express_region_code=None, use_test_server=False, proxy=None,
+                 schema_cache_dir=None, keep_alive=False, pool_maxsize=10, connect_timeout=None,
+                 read_timeout=None, transport_factory=None, log_max_length=None, log_redact_fields=None,
+                 observers=None, endpoint_url=None, fast_decoding=False, envelope_templates=False,
+                 rate_cache=None, address_cache=None, postal_code_cache=None, availability_cache=None,
+                 location_cache=None, retry_policy=None, circuit_breakers=None, rate_limiter=None,
+                 hedging_policy=None):
         """
         @type key: L{str}
         @param key: Developer test key.
@@ -52,6 +58,92 @@ class FedexConfig(object):
         @keyword proxy: Enter your list of proxy servers int the format 
             proxy = {'http': "http://......:8080", 'https': "http://.......:8080", }
             if needed.
+        @type schema_cache_dir: L{str}
+        @keyword schema_cache_dir: Opt-in directory for caching resolved WSDL
+            schemas on disk, so new worker processes don't have to parse the
+            WSDL files again. Entries are keyed on the WSDL contents and the
+            suds version, so the directory may be shared between releases.
+        @type keep_alive: L{bool}
+        @keyword keep_alive: When True, requests are sent over persistent HTTP
+            connections that are pooled per host and shared by all requests
+            in the process. See L{fedex.transport.PooledHttpTransport}, and
+            L{fedex.transport.AsyncHttpTransport} for send_request_async().
+        @type pool_maxsize: L{int}
+        @keyword pool_maxsize: Idle connections kept per host with keep_alive.
+        @type connect_timeout: L{float}
+        @keyword connect_timeout: Seconds to wait for a connection to the Fedex
+            servers. Only applies with keep_alive, defaults to read_timeout.
+        @type read_timeout: L{float}
+        @keyword read_timeout: Seconds to wait for the Fedex servers to reply.
+            Defaults to suds' 90 seconds.
+        @type transport_factory: L{callable}
+        @keyword transport_factory: Plugs in your own suds transport. Called
+            with this config object for every request, it must return a new
+            suds Transport instance each time. Overrides keep_alive.
+        @type log_max_length: L{int}
+        @keyword log_max_length: Cuts the envelopes logged to the
+            C{fedex.request} and C{fedex.response} loggers to this many bytes.
+        @type log_redact_fields: L{tuple}
+        @keyword log_redact_fields: Element names whose contents are left out
+            of logged envelopes. See
+            L{GeneralSudsPlugin.REDACTED_FIELDS<fedex.base_service.GeneralSudsPlugin.REDACTED_FIELDS>}.
+        @type observers: L{list}
+        @keyword observers: L{RequestObserver<fedex.instrumentation.RequestObserver>}
+            instances that are given the phase timings and sizes of every
+            request, such as a L{MetricsRegistry<fedex.instrumentation.MetricsRegistry>}.
+        @type endpoint_url: L{str}
+        @keyword endpoint_url: Sends requests to this server instead of the
+            one in the WSDLs, e.g. C{'http://127.0.0.1:8080'} for a
+            L{FedexStubServer<fedex.stub_server.FedexStubServer>}. Service
+            paths are kept.
+        @type fast_decoding: L{bool}
+        @keyword fast_decoding: When True, replies are decoded with the much
+            faster L{fedex.decoding} module instead of suds' unmarshaller.
+            The response is then a dict, equal to what basic_sobject_to_dict
+            returns, that also allows attribute access. May also be a list of
+            the services to enable it for, by name (e.g. C{['track', 'rate']},
+            see L{fedex.preload.SERVICES}) or class.
+        @type envelope_templates: L{bool}
+        @keyword envelope_templates: When True, request envelopes are rendered
+            by the L{fedex.templates} module, which only serializes what
+            changes between requests, instead of by suds' marshaller. The
+            envelopes are the same. May also be a list of services, as for
+            fast_decoding.
+        @type rate_cache: L{ResponseCache<fedex.cache.ResponseCache>}
+        @keyword rate_cache: Rate replies are served from this cache when it
+            has a reply for the same shipment, see
+            L{rate_cache_key<fedex.services.rate_service.rate_cache_key>}.
+        @type address_cache: L{ResponseCache<fedex.cache.ResponseCache>}
+        @keyword address_cache: Address validation results are cached here,
+            per address, see
+            L{address_cache_key<fedex.services.address_validation_service.address_cache_key>}.
+        @type postal_code_cache: L{ResponseCache<fedex.cache.ResponseCache>}
+        @keyword postal_code_cache: Postal code validation replies are served
+            from this cache when it has a reply for the same postal code, see
+            L{postal_code_cache_key<fedex.services.country_service.postal_code_cache_key>}.
+        @type availability_cache: L{ResponseCache<fedex.cache.ResponseCache>}
+        @keyword availability_cache: Service availability replies are served
+            from this cache when it has a reply for the same lane and
+            weekday, see
+            L{lane_cache_key<fedex.services.availability_commitment_service.lane_cache_key>}.
+        @type location_cache: L{LocationCache<fedex.services.location_service.LocationCache>}
+        @keyword location_cache: Location searches are answered from this
+            cache when they are inside an area searched before.
+        @type retry_policy: L{RetryPolicy<fedex.retry.RetryPolicy>}
+        @keyword retry_policy: Failed requests are resent as this policy
+            says. None never retries.
+        @type circuit_breakers: L{CircuitBreakerRegistry<fedex.circuit.CircuitBreakerRegistry>}
+        @keyword circuit_breakers: Requests to a service endpoint that keeps
+            failing are failed fast, with
+            L{FedexCircuitOpenError<fedex.circuit.FedexCircuitOpenError>}.
+        @type rate_limiter: L{RateLimiter<fedex.throttle.RateLimiter>}
+        @keyword rate_limiter: Requests wait for this limiter before being
+            sent, keeping them within the rate allowed for the account
+            number.
+        @type hedging_policy: L{HedgingPolicy<fedex.hedging.HedgingPolicy>}
+        @keyword hedging_policy: Requests for the policy's operations that
+            are slow to get a reply are sent a second time, and the first
+            reply is used.
         """
         self.key = key
         """@ivar: Developer test key."""
@@ -71,6 +163,48 @@ class FedexConfig(object):
         """@ivar: When True, point to the test server."""
         self.proxy = proxy
         """@ivar: A list of proxy servers."""
+        self.schema_cache_dir = schema_cache_dir
+        """@ivar: Directory for the on-disk WSDL schema cache, or None."""
+        self.keep_alive = keep_alive
+        """@ivar: When True, use pooled persistent HTTP connections."""
+        self.pool_maxsize = pool_maxsize
+        """@ivar: Idle connections kept per host when keep_alive is set."""
+        self.connect_timeout = connect_timeout
+        """@ivar: Connect timeout in seconds, or None."""
+        self.read_timeout = read_timeout
+        """@ivar: Read timeout in seconds, or None for suds' default."""
+        self.transport_factory = transport_factory
+        """@ivar: Callable returning a suds Transport for each request, or None."""
+        self.log_max_length = log_max_length
+        """@ivar: Maximum length of logged envelopes, or None."""
+        self.log_redact_fields = log_redact_fields
+        """@ivar: Element names redacted from logged envelopes, or None."""
+        self.observers = list(observers or [])
+        """@ivar: Observers notified after every request."""
+        self.endpoint_url = endpoint_url
+        """@ivar: Base URL overriding the Fedex servers, or None."""
+        self.fast_decoding = fast_decoding
+        """@ivar: True, False or the services replies are decoded quickly for."""
+        self.envelope_templates = envelope_templates
+        """@ivar: True, False or the services envelopes are rendered from templates for."""
+        self.rate_cache = rate_cache
+        """@ivar: ResponseCache for rate replies, or None."""
+        self.address_cache = address_cache
+        """@ivar: ResponseCache for address validation results, or None."""
+        self.postal_code_cache = postal_code_cache
+        """@ivar: ResponseCache for postal code validation replies, or None."""
+        self.availability_cache = availability_cache
+        """@ivar: ResponseCache for service availability replies, or None."""
+        self.location_cache = location_cache
+        """@ivar: LocationCache for location searches, or None."""
+        self.retry_policy = retry_policy
+        """@ivar: RetryPolicy for failed requests, or None."""
+        self.circuit_breakers = circuit_breakers
+        """@ivar: CircuitBreakerRegistry of the service endpoints, or None."""
+        self.rate_limiter = rate_limiter
+        """@ivar: RateLimiter for requests per account, or None."""
+        self.hedging_policy = hedging_policy
+        """@ivar: HedgingPolicy for slow requests, or None."""
 
         # Allow overriding of the WDSL path.
         if wsdl_path is None:
@@ -0,0 +1,194 @@
+"""
+The L{decoding} module contains a fast alternative to suds' reply
+unmarshaller. suds builds its response objects node by node in pure
+Python, which takes much of the CPU time spent on large replies, such as
+tracking with detailed scans or rating across all services.
+
+L{ReplyDecoder} parses the reply with lxml, when it is installed, or with
+the standard library's ElementTree otherwise, and converts it into
+L{ResponseRecord}s using a decoding plan derived once from the WSDL schema.
+Records are plain dicts, equal to what
+L{basic_sobject_to_dict<fedex.tools.conversion.basic_sobject_to_dict>}
+returns for the suds response, that also allow attribute access so code
+written against suds responses (C{response.Notifications[0].Message})
+keeps working. Unlike suds objects, they can be pickled.
+
+Enable it with the C{fast_decoding} option of
+L{FedexConfig<fedex.config.FedexConfig>}.
+"""
+
+import threading
+import weakref
+
+try:
+    from lxml import etree
+except ImportError:  # pragma: no cover
+    import xml.etree.ElementTree as etree
+
+SOAP_ENV_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+XSI_NIL = '{http://www.w3.org/2001/XMLSchema-instance}nil'
+
+
+class ResponseRecord(dict):
+    """
+    A decoded reply element: a dict of its child elements, which may also
+    be read and set as attributes.
+    """
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class _Field(object):
+    """
+    How to decode one child element of a complex type.
+    """
+
+    __slots__ = ('multi', 'nillable', 'resolved')
+
+    def __init__(self, element):
+        resolved = element.resolve()
+        self.multi = element.multi_occurrence()
+        self.nillable = bool(element.nillable or (resolved.builtin() and resolved.nillable))
+        self.resolved = resolved
+
+
+class ReplyDecoder(object):
+    """
+    Decodes replies for the services of one WSDL. Get one with
+    L{get_reply_decoder}, decoders are shared by all clients of a WSDL.
+    """
+
+    def __init__(self, wsdl):
+        self.wsdl = wsdl
+        self._lock = threading.Lock()
+        self._plans = {}
+        self._reply_types = {}
+
+    def decode(self, reply):
+        """
+        Decodes a SOAP reply envelope.
+
+        @type reply: L{bytes}
+        @param reply: The reply as received.
+        @rtype: L{ResponseRecord}
+        @return: The decoded reply element, or None if the reply holds a
+            SOAP fault or an unknown element, which are best left to suds.
+        """
+
+        root = etree.fromstring(reply)
+        body = root.find('{%s}Body' % SOAP_ENV_NS)
+        if body is None or len(body) == 0:
+            return None
+        element = body[0]
+        reply_type = self._reply_type(element.tag)
+        if reply_type is None:
+            return None
+        return self._decode_complex(element, reply_type)
+
+    def _reply_type(self, tag):
+        if tag not in self._reply_types:
+            namespace, _, name = tag[1:].partition('}')
+            element = self.wsdl.schema.elements.get((name, namespace))
+            self._reply_types[tag] = element.resolve() if element is not None else None
+        return self._reply_types[tag]
+
+    def _plan(self, complex_type):
+        """
+        Returns the fields of a complex type by element name, building them
+        on first use.
+        """
+
+        plan = self._plans.get(complex_type)
+        if plan is None:
+            with self._lock:
+                plan = {}
+                for child, ancestry in complex_type:
+                    if child.name is not None and not child.isattr():
+                        plan[child.name] = _Field(child)
+                self._plans[complex_type] = plan
+        return plan
+
+    def _decode_complex(self, element, complex_type):
+        plan = self._plan(complex_type) if complex_type is not None else {}
+        record = ResponseRecord()
+        for child in element:
+            tag = child.tag
+            if not isinstance(tag, str):
+                # Comments and processing instructions.
+                continue
+            name = tag.rpartition('}')[2]
+            field = plan.get(name)
+            value = self._decode(child, field)
+            if name in record:
+                # Repeated elements become lists, as they do in suds.
+                existing = record[name]
+                if isinstance(existing, list):
+                    existing.append(value)
+                else:
+                    record[name] = [existing, value]
+            elif field is not None and field.multi:
+                record[name] = [] if value is None else [value]
+            else:
+                record[name] = value
+        return record
+
+    def _decode(self, element, field):
+        if element.get(XSI_NIL) in ('true', '1'):
+            return None
+        if len(element):
+            complex_type = field.resolved if field is not None and not field.resolved.builtin() else None
+            return self._decode_complex(element, complex_type)
+        # As in suds, whitespace around other text is kept.
+        text = element.text
+        if not text or text.isspace():
+            return None if field is not None and field.nillable else ''
+        if field is None:
+            return text
+        return field.resolved.translate(text)
+
+
+def to_response_record(value):
+    """
+    Converts a suds response, or any part of it, into L{ResponseRecord}s,
+    as the fast decoder would have returned it. Dicts are copied into
+    records too, other values are returned as they are.
+    """
+
+    if hasattr(value, '__keylist__'):
+        return ResponseRecord((name, to_response_record(getattr(value, name))) for name in value.__keylist__)
+    if isinstance(value, dict):
+        return ResponseRecord((name, to_response_record(item)) for name, item in value.items())
+    if isinstance(value, list):
+        return [to_response_record(item) for item in value]
+    return value
+
+
+_DECODERS = weakref.WeakKeyDictionary()
+_DECODERS_LOCK = threading.Lock()
+
+
+def get_reply_decoder(client):
+    """
+    Returns the L{ReplyDecoder} for a suds client's WSDL.
+    """
+
+    with _DECODERS_LOCK:
+        decoder = _DECODERS.get(client.wsdl)
+        if decoder is None:
+            decoder = _DECODERS[client.wsdl] = ReplyDecoder(client.wsdl)
+    return decoder
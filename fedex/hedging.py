@@ -0,0 +1,249 @@
+"""
+The L{hedging} module cuts the tail latency of requests someone is waiting
+on, such as rating at checkout, where a single slow Fedex server would
+otherwise set the response time.
+
+Set a L{HedgingPolicy} as the C{hedging_policy} of your
+L{FedexConfig<fedex.config.FedexConfig>}. When a request for one of its
+operations has had no reply after a percentile of the operation's recent
+latencies, a copy of it is sent, the first reply to arrive is used and the
+other request is cancelled. Only operations that are safe to repeat may be
+hedged, getRates and serviceAvailability by default, and hedges are
+limited to a fraction of the requests sent, so that they add little load.
+
+With send_request_async() the slower request is cancelled. send_request()
+sends the request on the calling thread and only its copy from the policy's
+thread pool. Whichever request loses is aborted when the transport has an
+abort() method, as L{PooledHttpTransport<fedex.transport.PooledHttpTransport>}
+does. Other transports can't interrupt a request in flight: send_request()
+then returns once the request completes, using the copy's reply if it came
+first or the request failed, and a losing copy completes in the background.
+Copies wait for the rate limiter and go through the circuit breaker just as
+the requests themselves. The number of copies sent is reported to the
+observers as the C{hedges} of the request's
+L{RequestMetrics<fedex.instrumentation.RequestMetrics>}.
+"""
+
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .retry import UNSAFE_OPERATIONS
+
+HEDGE_OPERATIONS = frozenset(['getRates', 'serviceAvailability'])
+"""Operations hedged by default."""
+
+
+class HedgingPolicy(object):
+    """
+    When to send a second copy of a slow request. One policy may be shared
+    by any number of requests and threads.
+    """
+
+    def __init__(self, percentile=95, initial_delay=None, min_delay=0.05, max_delay=2.0, min_samples=20,
+                 window=500, operations=HEDGE_OPERATIONS, budget_ratio=0.05, budget_initial=5, max_workers=16):
+        """
+        @type percentile: L{float}
+        @keyword percentile: A copy is sent once a request has taken longer
+            than this percentile of the operation's recent latencies.
+        @type initial_delay: L{float}
+        @keyword initial_delay: Seconds to wait before sending a copy until
+            C{min_samples} latencies were measured. None to not hedge until
+            then.
+        @type min_delay: L{float}
+        @keyword min_delay: The shortest wait before sending a copy.
+        @type max_delay: L{float}
+        @keyword max_delay: The longest wait before sending a copy.
+        @type min_samples: L{int}
+        @keyword min_samples: Latencies needed to compute the percentile.
+        @type window: L{int}
+        @keyword window: Recent latencies kept per operation.
+        @type operations: iterable
+        @keyword operations: The WSDL operations to hedge. They must be safe
+            to repeat, see L{UNSAFE_OPERATIONS<fedex.retry.UNSAFE_OPERATIONS>}.
+        @type budget_ratio: L{float}
+        @keyword budget_ratio: Hedges allowed per request sent, per
+            operation.
+        @type budget_initial: L{float}
+        @keyword budget_initial: Hedges allowed before any request was sent,
+            and the most that can be saved up.
+        @type max_workers: L{int}
+        @keyword max_workers: Threads sending copies of requests for
+            send_request().
+        """
+
+        operations = frozenset(operations)
+        if operations & UNSAFE_OPERATIONS:
+            raise ValueError("Operations that aren't safe to repeat can't be hedged: {}".format(
+                ', '.join(sorted(operations & UNSAFE_OPERATIONS))))
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.operations = operations
+        self.budget_ratio = budget_ratio
+        self.budget_initial = budget_initial
+        self.max_workers = max_workers
+        self.logger = logging.getLogger('fedex.hedging')
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._budgets = {}
+        self._executor = None
+        self._scheduled = []
+        self._scheduled_changed = threading.Condition(self._lock)
+        self._sequence = itertools.count()
+        self._scheduler = None
+        _POLICIES.add(self)
+        self.hedges = 0
+        """@ivar: Number of copies sent."""
+        self.wins = 0
+        """@ivar: Number of copies whose reply came first."""
+
+    def request_started(self, operation):
+        """
+        Called once per request, before it is sent. Adds to the operation's
+        hedge budget.
+        """
+
+        if operation not in self.operations:
+            return
+        with self._lock:
+            budget = self._budgets.get(operation, self.budget_initial)
+            self._budgets[operation] = min(self.budget_initial, budget + self.budget_ratio)
+
+    def hedge_delay(self, operation):
+        """
+        Returns the seconds to wait for a reply before sending a copy of a
+        request, or None if it isn't hedged.
+        """
+
+        if operation not in self.operations:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies.get(operation, ()))
+        if len(latencies) < max(1, self.min_samples):
+            return self.initial_delay
+        delay = latencies[max(0, int(math.ceil(len(latencies) * self.percentile / 100.0)) - 1)]
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def allow_hedge(self, operation):
+        """
+        Called when a request is still waiting after its delay. Returns True
+        if a copy may be sent, taking it from the operation's budget.
+        """
+
+        with self._lock:
+            budget = self._budgets.get(operation, self.budget_initial)
+            if budget < 1:
+                return False
+            self._budgets[operation] = budget - 1
+            self.hedges += 1
+        self.logger.debug("Hedging %s.", operation)
+        return True
+
+    def record(self, operation, seconds, hedge_won=False):
+        """
+        Records how long a request took to get its reply, and whether the
+        reply was the copy's.
+        """
+
+        with self._lock:
+            latencies = self._latencies.get(operation)
+            if latencies is None:
+                latencies = self._latencies[operation] = deque(maxlen=self.window)
+            latencies.append(seconds)
+            if hedge_won:
+                self.wins += 1
+
+    def submit(self, function, *args):
+        """
+        Calls a function on the policy's thread pool, returning its Future.
+        """
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='fedex-hedging')
+            executor = self._executor
+        return executor.submit(function, *args)
+
+    def schedule(self, delay, function, *args):
+        """
+        Calls a function on the policy's thread pool after a delay, unless
+        the returned Future is cancelled before then.
+        """
+
+        future = Future()
+        with self._lock:
+            heapq.heappush(self._scheduled, (time.monotonic() + delay, next(self._sequence), future, function, args))
+            if self._scheduler is None:
+                self._scheduler = threading.Thread(target=self._run_scheduled, name='fedex-hedging-scheduler',
+                                                   daemon=True)
+                self._scheduler.start()
+            self._scheduled_changed.notify()
+        return future
+
+    def _run_scheduled(self):
+        while True:
+            with self._lock:
+                while not self._scheduled or self._scheduled[0][0] > time.monotonic():
+                    self._scheduled_changed.wait(self._scheduled[0][0] - time.monotonic() if self._scheduled
+                                                 else None)
+                _, _, future, function, args = heapq.heappop(self._scheduled)
+            if future.set_running_or_notify_cancel():
+                self.submit(_call, future, function, args)
+
+    def _after_fork(self):
+        """
+        Forgets the scheduler thread and thread pool in a forked child,
+        where their threads don't run, so that they are started again. The
+        lock is replaced, as another thread of the parent may have held it
+        while forking.
+        """
+
+        self._lock = threading.Lock()
+        self._scheduled_changed = threading.Condition(self._lock)
+        self._scheduled = []
+        self._scheduler = None
+        self._executor = None
+
+    def stats(self):
+        """
+        Returns a dict with the number of C{hedges} sent and the number of
+        C{wins}, hedges whose reply came first.
+        """
+
+        with self._lock:
+            return {'hedges': self.hedges, 'wins': self.wins}
+
+
+_POLICIES = weakref.WeakSet()
+
+
+def _after_fork():
+    for policy in list(_POLICIES):
+        policy._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _call(future, function, args):
+    """Calls a function, setting the result or exception of a Future."""
+
+    try:
+        result = function(*args)
+    except BaseException as e:
+        future.set_exception(e)
+    else:
+        future.set_result(result)
@@ -0,0 +1,287 @@
+"""
+The L{instrumentation} module reports where the time of a Fedex request
+goes. Every request sent by a L{FedexBaseService} is timed phase by phase
+and the resulting L{RequestMetrics} are handed to the observers listed on
+the L{FedexConfig<fedex.config.FedexConfig>} C{observers} option.
+
+The phases are:
+    - construct: building the request object and its WSDL objects.
+    - marshal: suds turning the WSDL objects into a SOAP envelope.
+    - prune: removing empty WSDL objects from the envelope.
+    - network: sending the envelope and waiting for the reply.
+    - parse: suds turning the reply into the response object.
+    - checks: checking the response for errors and warnings.
+    - backoff: waiting between attempts, for retried requests.
+    - throttle: waiting for the rate limiter, see L{fedex.throttle}.
+
+Two observers are included, L{LoggingObserver} and the in-memory,
+Prometheus-style L{MetricsRegistry}. Write your own by subclassing
+L{RequestObserver}.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class RequestMetrics(object):
+    """
+    Timings and sizes for one request.
+    """
+
+    def __init__(self, service, operation=None):
+        self.service = service
+        """@ivar: Class name of the request, e.g. 'FedexRateServiceRequest'."""
+        self.operation = operation
+        """@ivar: Name of the WSDL operation, e.g. 'getRates'."""
+        self.phases = OrderedDict()
+        """@ivar: Seconds spent in each phase, in the order they ran."""
+        self.request_bytes = None
+        """@ivar: Size of the sent envelope."""
+        self.reply_bytes = None
+        """@ivar: Size of the received reply."""
+        self.error = None
+        """@ivar: The exception the request failed with, if any."""
+        self.attempts = 1
+        """@ivar: Number of times the request was sent."""
+        self.hedges = 0
+        """@ivar: Number of copies sent because the reply was slow."""
+
+    @property
+    def total(self):
+        """Seconds spent in all phases."""
+
+        return sum(self.phases.values())
+
+    def add(self, phase, seconds):
+        """
+        Adds time to a phase.
+        """
+
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, phase):
+        """
+        Context manager timing the code it wraps as the given phase.
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def __repr__(self):
+        return '<RequestMetrics {}.{} {}>'.format(
+                self.service, self.operation,
+                ' '.join('{}={:.1f}ms'.format(phase, seconds * 1000) for phase, seconds in self.phases.items()))
+
+
+class RequestObserver(object):
+    """
+    Base class for observers of finished requests.
+    """
+
+    def request_finished(self, metrics):
+        """
+        Called after every request, whether it succeeded or not.
+
+        @type metrics: L{RequestMetrics}
+        @param metrics: What was measured for the request.
+        """
+
+        pass
+
+
+class LoggingObserver(RequestObserver):
+    """
+    Logs one line per request with its phase timings and sizes.
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        """
+        @type logger: L{logging.Logger}
+        @keyword logger: Defaults to the C{fedex.metrics} logger.
+        @type level: L{int}
+        @keyword level: Level to log at.
+        """
+
+        self.logger = logger or logging.getLogger('fedex.metrics')
+        self.level = level
+
+    def request_finished(self, metrics):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        self.logger.log(self.level, "%s.%s %s in %.1fms (%s), sent %s bytes, received %s bytes, %d attempt(s)",
+                        metrics.service, metrics.operation,
+                        'failed' if metrics.error is not None else 'succeeded', metrics.total * 1000,
+                        ', '.join('{} {:.1f}ms'.format(phase, seconds * 1000)
+                                  for phase, seconds in metrics.phases.items()),
+                        metrics.request_bytes, metrics.reply_bytes, metrics.attempts)
+
+
+class _Histogram(object):
+    """
+    Cumulative bucket counts, sum and count, as in a Prometheus histogram.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry(RequestObserver):
+    """
+    Aggregates request metrics in memory and renders them in the Prometheus
+    text exposition format, for serving from your own metrics endpoint.
+
+    The following metrics are kept, labelled by service and operation:
+        - C{fedex_requests_total}: counter, also labelled by outcome.
+        - C{fedex_request_phase_seconds}: histogram, also labelled by phase.
+        - C{fedex_request_bytes_total}: counter, also labelled by direction.
+        - C{fedex_request_attempts_total}: counter of the times requests
+          were sent, including retries.
+        - C{fedex_request_hedges_total}: counter of the copies of slow
+          requests sent.
+    """
+
+    DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        @type buckets: L{tuple}
+        @keyword buckets: Upper bounds of the histogram buckets, in seconds.
+        """
+
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters = OrderedDict()
+        self._histograms = OrderedDict()
+
+    def request_finished(self, metrics):
+        labels = (('service', metrics.service), ('operation', metrics.operation))
+        outcome = 'success' if metrics.error is None else type(metrics.error).__name__
+        with self._lock:
+            self._increment('fedex_requests_total', labels + (('outcome', outcome),))
+            self._increment('fedex_request_attempts_total', labels, metrics.attempts)
+            if metrics.hedges:
+                self._increment('fedex_request_hedges_total', labels, metrics.hedges)
+            for phase, seconds in metrics.phases.items():
+                key = ('fedex_request_phase_seconds', labels + (('phase', phase),))
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = _Histogram(self.buckets)
+                histogram.observe(seconds)
+            sent = None
+            if metrics.request_bytes is not None:
+                # The envelope is sent again by every retry and hedge.
+                sent = metrics.request_bytes * (metrics.attempts + metrics.hedges)
+            for direction, size in (('sent', sent), ('received', metrics.reply_bytes)):
+                if size is not None:
+                    self._increment('fedex_request_bytes_total', labels + (('direction', direction),), size)
+
+    def _increment(self, name, labels, value=1):
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def get_counter(self, name, **labels):
+        """
+        Returns the value of a counter, summed over any labels not given.
+        """
+
+        with self._lock:
+            return sum(value for (counter_name, counter_labels), value in self._counters.items()
+                       if counter_name == name and set(labels.items()) <= set(counter_labels))
+
+    def get_histogram(self, name, **labels):
+        """
+        Returns the (count, sum) of a histogram, summed over any labels not
+        given.
+        """
+
+        count, total = 0, 0.0
+        with self._lock:
+            for (histogram_name, histogram_labels), histogram in self._histograms.items():
+                if histogram_name == name and set(labels.items()) <= set(histogram_labels):
+                    count += histogram.count
+                    total += histogram.sum
+        return count, total
+
+    def clear(self):
+        """
+        Resets all metrics.
+        """
+
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+
+        counters, histograms = OrderedDict(), OrderedDict()
+        with self._lock:
+            # Each metric's samples must follow its TYPE line together.
+            for (name, labels), value in self._counters.items():
+                counters.setdefault(name, []).append((labels, value))
+            for (name, labels), histogram in self._histograms.items():
+                histograms.setdefault(name, []).append((labels, histogram.counts[:], histogram.count,
+                                                        histogram.sum))
+        lines = []
+        for name, samples in counters.items():
+            lines.append('# HELP {} {}'.format(name, _HELP.get(name, name)))
+            lines.append('# TYPE {} counter'.format(name))
+            for labels, value in samples:
+                lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+        for name, samples in histograms.items():
+            lines.append('# HELP {} {}'.format(name, _HELP.get(name, name)))
+            lines.append('# TYPE {} histogram'.format(name))
+            for labels, counts, count, total in samples:
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append('{}_bucket{} {}'.format(name, _format_labels(labels + (('le', repr(bound)),)),
+                                                         bucket_count))
+                lines.append('{}_bucket{} {}'.format(name, _format_labels(labels + (('le', '+Inf'),)), count))
+                lines.append('{}_sum{} {!r}'.format(name, _format_labels(labels), total))
+                lines.append('{}_count{} {}'.format(name, _format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+
+_HELP = {
+    'fedex_requests_total': 'Fedex requests made, by outcome.',
+    'fedex_request_phase_seconds': 'Seconds spent in each phase of Fedex requests.',
+    'fedex_request_bytes_total': 'Bytes of Fedex request envelopes sent and replies received.',
+    'fedex_request_attempts_total': 'Times Fedex requests were sent, including retries.',
+    'fedex_request_hedges_total': 'Copies of slow Fedex requests sent.',
+}
+
+
+def _format_labels(labels):
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in labels) + '}'
+
+
+def notify_observers(observers, metrics):
+    """
+    Hands metrics to each observer. A failing observer is logged, it never
+    fails the request.
+    """
+
+    for observer in observers or ():
+        try:
+            observer.request_finished(metrics)
+        except Exception:
+            logging.getLogger('fedex').exception("Request observer %r failed.", observer)
@@ -0,0 +1,68 @@
+"""
+The L{preload} module loads service schemas ahead of time. Pre-fork servers
+can call L{warmup} (also available as C{fedex.warmup}) in the master process
+so WSDL parsing happens once and the children inherit the parsed clients
+through copy-on-write.
+"""
+
+import importlib
+import logging
+import time
+from collections import OrderedDict
+
+SERVICES = OrderedDict([
+    ('ship', ('fedex.services.ship_service', 'FedexProcessShipmentRequest')),
+    ('rate', ('fedex.services.rate_service', 'FedexRateServiceRequest')),
+    ('track', ('fedex.services.track_service', 'FedexTrackRequest')),
+    ('pickup', ('fedex.services.pickup_service', 'FedexCreatePickupRequest')),
+    ('location', ('fedex.services.location_service', 'FedexSearchLocationRequest')),
+    ('address_validation', ('fedex.services.address_validation_service', 'FedexAddressValidationRequest')),
+    ('country', ('fedex.services.country_service', 'FedexValidatePostalRequest')),
+    ('availability_commitment', ('fedex.services.availability_commitment_service',
+                                 'FedexAvailabilityCommitmentRequest')),
+    ('document', ('fedex.services.document_service', 'FedexDocumentServiceRequest')),
+])
+"""Service names accepted by L{warmup}, mapped to their request classes."""
+
+
+def _get_service_class(service):
+    """
+    Resolves a service name from L{SERVICES} to its request class. Request
+    classes themselves are passed through.
+    """
+
+    if isinstance(service, type):
+        return service.__name__, service
+    try:
+        module_name, class_name = SERVICES[service]
+    except KeyError:
+        raise ValueError("Unknown service '{}', expected one of: {}".format(service, ', '.join(SERVICES)))
+    return service, getattr(importlib.import_module(module_name), class_name)
+
+
+def warmup(config_obj, services=None):
+    """
+    Builds the suds clients and WSDL objects for the given services, so later
+    requests only clone the already-resolved schemas.
+
+    @type config_obj: L{FedexConfig}
+    @param config_obj: The config your requests will use. Test and production
+        servers have separate WSDLs, so this decides which ones are loaded.
+    @type services: L{list}
+    @keyword services: Names from L{SERVICES} (e.g. C{['ship', 'rate']}) or
+        request classes. Defaults to all services.
+    @rtype: L{OrderedDict}
+    @return: The number of seconds each service took to load, by name.
+    """
+
+    logger = logging.getLogger('fedex')
+    timings = OrderedDict()
+    for service in services or list(SERVICES):
+        name, service_class = _get_service_class(service)
+        start = time.time()
+        # Building a request both parses the WSDL and resolves the types
+        # the request creates through the client factory.
+        service_class(config_obj)
+        timings[name] = time.time() - start
+        logger.info("Warmed up %s in %.3fs.", name, timings[name])
+    return timings
@@ -0,0 +1,234 @@
+"""
+The L{retry} module decides when a failed Fedex request is sent again.
+Set a L{RetryPolicy} as the C{retry_policy} of your
+L{FedexConfig<fedex.config.FedexConfig>} and requests are resent, with
+exponential backoff and jitter, when they fail in a way that may not happen
+again: transport errors, HTTP 429, 502, 503 and 504 replies, and replies
+with FAILURE notifications (L{FedexFailure<fedex.base_service.FedexFailure>}).
+Problems with the request itself, such as
+L{FedexError<fedex.base_service.FedexError>}, are never retried.
+
+Operations that create something at Fedex, such as processShipment and
+createPickup, could be carried out twice if resent after Fedex got them.
+They are only retried when the request is known not to have reached Fedex:
+the connection was refused, the host wasn't found, or the reply was HTTP 429
+or 503.
+
+The same envelope is resent. The number of attempts a request took is
+reported to the observers with its
+L{RequestMetrics<fedex.instrumentation.RequestMetrics>}, and time spent
+waiting between attempts as its C{backoff} phase.
+"""
+
+import asyncio
+import http.client
+import logging
+import random
+import socket
+import threading
+import time
+
+UNSAFE_OPERATIONS = frozenset(['processShipment', 'processTag', 'createPickup', 'uploadDocuments', 'uploadImages'])
+"""Operations that aren't safe to repeat once Fedex got them."""
+
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+"""HTTP statuses worth retrying."""
+
+NOT_DELIVERED_STATUSES = frozenset([429, 503])
+"""HTTP statuses meaning Fedex didn't handle the request."""
+
+NOT_DELIVERED_ERRORS = (ConnectionRefusedError, socket.gaierror)
+"""Transport errors meaning the request never reached Fedex."""
+
+
+class RetryPolicy(object):
+    """
+    When and how often to resend failed requests. One policy may be shared
+    by any number of requests and threads.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.1, max_delay=5.0, jitter=True, operation_attempts=None,
+                 unsafe_operations=UNSAFE_OPERATIONS, retry_failures=True, budget_ratio=0.2, budget_initial=10,
+                 sleep=time.sleep, random=random.random):
+        """
+        @type max_attempts: L{int}
+        @keyword max_attempts: The most times a request is sent, 1 to never
+            retry.
+        @type base_delay: L{float}
+        @keyword base_delay: Seconds to wait before the first retry. The
+            wait doubles for every further retry.
+        @type max_delay: L{float}
+        @keyword max_delay: The longest wait between attempts, in seconds.
+        @type jitter: L{bool}
+        @keyword jitter: Wait a random time up to the backoff delay
+            ("full jitter"), so that clients failing together don't retry
+            together.
+        @type operation_attempts: L{dict}
+        @keyword operation_attempts: max_attempts per WSDL operation name,
+            e.g. C{{'getRates': 5}}.
+        @type unsafe_operations: iterable
+        @keyword unsafe_operations: Operations only retried when the request
+            didn't reach Fedex, see L{UNSAFE_OPERATIONS}.
+        @type retry_failures: L{bool}
+        @keyword retry_failures: Retry replies with FAILURE notifications.
+        @type budget_ratio: L{float}
+        @keyword budget_ratio: Retries allowed per request sent, per
+            operation, so that an outage isn't made worse by retries. None
+            for no budget.
+        @type budget_initial: L{float}
+        @keyword budget_initial: Retries allowed before any request was sent,
+            and the most that can be saved up.
+        @type sleep: L{callable}
+        @keyword sleep: Waits the given seconds.
+        @type random: L{callable}
+        @keyword random: Returns a random float in [0, 1).
+        """
+
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.operation_attempts = dict(operation_attempts or {})
+        self.unsafe_operations = frozenset(unsafe_operations)
+        self.retry_failures = retry_failures
+        self.budget_ratio = budget_ratio
+        self.budget_initial = budget_initial
+        self.sleep = sleep
+        self.random = random
+        self.logger = logging.getLogger('fedex.retry')
+        self._lock = threading.Lock()
+        self._budgets = {}
+        self.retries = 0
+        """@ivar: Number of retries made."""
+        self.exhausted = 0
+        """@ivar: Number of retries refused because the budget ran out."""
+
+    def attempts_for(self, operation):
+        """
+        Returns the most times a request for an operation is sent.
+        """
+
+        return self.operation_attempts.get(operation, self.max_attempts)
+
+    def request_started(self, operation):
+        """
+        Called once per request, before its first attempt. Adds to the
+        operation's retry budget.
+        """
+
+        if self.budget_ratio is None:
+            return
+        with self._lock:
+            budget = self._budgets.get(operation, self.budget_initial)
+            self._budgets[operation] = min(self.budget_initial, budget + self.budget_ratio)
+
+    def retry_delay(self, operation, attempt, error, status=None, time_left=None):
+        """
+        Decides whether to retry a failed attempt.
+
+        @type operation: L{str}
+        @param operation: Name of the WSDL operation.
+        @type attempt: L{int}
+        @param attempt: The attempt that failed, from 1.
+        @param error: The exception it failed with.
+        @type status: L{int}
+        @param status: The HTTP status of the reply, None for 200 or if
+            there was no reply.
+        @type time_left: L{float}
+        @param time_left: Seconds left until the request's deadline, None if
+            it has none. No retry is made that would start after it.
+        @rtype: L{float}
+        @return: Seconds to wait before the next attempt, or None to give up.
+        """
+
+        if attempt >= self.attempts_for(operation) or not self.is_transient(error, status):
+            return None
+        if operation in self.unsafe_operations and not self.not_delivered(error, status):
+            return None
+        delay = self.delay(attempt)
+        if time_left is not None and delay >= time_left:
+            return None
+        if self.budget_ratio is not None:
+            with self._lock:
+                budget = self._budgets.get(operation, self.budget_initial)
+                if budget < 1:
+                    self.exhausted += 1
+                    self.logger.warning("Retry budget of %s exhausted, not retrying.", operation)
+                    return None
+                self._budgets[operation] = budget - 1
+        with self._lock:
+            self.retries += 1
+        return delay
+
+    def delay(self, attempt):
+        """
+        Returns the seconds to wait after a failed attempt.
+        """
+
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        if self.jitter:
+            delay *= self.random()
+        return delay
+
+    def is_transient(self, error, status=None):
+        """
+        Returns True if an attempt failed in a way that may not happen again
+        and that this policy retries.
+        """
+
+        from .base_service import FedexFailure
+
+        if isinstance(error, FedexFailure) and not self.retry_failures:
+            return False
+        return is_transient(error, status)
+
+    @staticmethod
+    def not_delivered(error, status=None):
+        """
+        Returns True if an attempt is known not to have reached Fedex.
+        """
+
+        return not_delivered(error, status)
+
+    def stats(self):
+        """
+        Returns a dict with the C{retries} made and the retries refused
+        because the budget was C{exhausted}.
+        """
+
+        with self._lock:
+            return {'retries': self.retries, 'exhausted': self.exhausted}
+
+
+def is_transient(error, status=None):
+    """
+    Returns True if a request failed in a way that may not happen again: a
+    transport error, a reply with one of the L{RETRY_STATUSES}, or a
+    L{FedexFailure<fedex.base_service.FedexFailure>}.
+
+    @param error: The exception the request failed with.
+    @type status: L{int}
+    @param status: The HTTP status of the reply, None for 200 or if there
+        was no reply.
+    """
+
+    from .base_service import FedexFailure
+
+    if isinstance(error, FedexFailure):
+        return True
+    if status is not None:
+        return status in RETRY_STATUSES
+    # asyncio.TimeoutError is only an OSError from Python 3.11 on.
+    return isinstance(error, (OSError, http.client.HTTPException, asyncio.TimeoutError))
+
+
+def not_delivered(error, status=None):
+    """
+    Returns True if a request is known not to have reached Fedex.
+    """
+
+    if status is not None:
+        return status in NOT_DELIVERED_STATUSES
+    # urllib wraps the socket error.
+    return isinstance(error, NOT_DELIVERED_ERRORS) or \
+        isinstance(getattr(error, 'reason', None), NOT_DELIVERED_ERRORS)
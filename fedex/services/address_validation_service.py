@@ -8,7 +8,26 @@ documentation.
 """
 
 import datetime
-from ..base_service import FedexBaseService
+import functools
+import re
+
+from ..base_service import FedexBaseService, FedexError, FedexRequestPool
+from ..batch import BatchResult, chunked, deadline_after, run_batch, time_left
+from ..cache import make_cache_key
+from ..decoding import ResponseRecord, to_response_record
+
+ADDRESS_ABBREVIATIONS = {
+    'NORTH': 'N', 'SOUTH': 'S', 'EAST': 'E', 'WEST': 'W',
+    'NORTHEAST': 'NE', 'NORTHWEST': 'NW', 'SOUTHEAST': 'SE', 'SOUTHWEST': 'SW',
+    'ALLEY': 'ALY', 'AVENUE': 'AVE', 'AV': 'AVE', 'BOULEVARD': 'BLVD', 'CIRCLE': 'CIR', 'COURT': 'CT',
+    'DRIVE': 'DR', 'EXPRESSWAY': 'EXPY', 'FREEWAY': 'FWY', 'HIGHWAY': 'HWY', 'LANE': 'LN',
+    'PARKWAY': 'PKWY', 'PLACE': 'PL', 'PLAZA': 'PLZ', 'ROAD': 'RD', 'ROUTE': 'RTE', 'SQUARE': 'SQ',
+    'STREET': 'ST', 'TERRACE': 'TER', 'TRAIL': 'TRL',
+    'APARTMENT': 'APT', 'BUILDING': 'BLDG', 'DEPARTMENT': 'DEPT', 'FLOOR': 'FL', 'ROOM': 'RM',
+    'SUITE': 'STE',
+    'FORT': 'FT', 'MOUNT': 'MT', 'SAINT': 'ST',
+}
+"""Words folded to their USPS abbreviation when comparing addresses."""
 
 
 class FedexAddressValidationRequest(FedexBaseService):
@@ -35,6 +54,8 @@ class FedexAddressValidationRequest(FedexBaseService):
 
         self.AddressesToValidate = []
         """@ivar: Holds the AddressToValidate WSDL object."""
+        self._uncached = None
+        self._cached_results = {}
         # Call the parent FedexBaseService class for basic setup work.
         super(FedexAddressValidationRequest, self).__init__(
                 self._config_obj, 'AddressValidationService_v4.wsdl', *args, **kwargs)
@@ -55,12 +76,18 @@ class FedexAddressValidationRequest(FedexBaseService):
 
         # We get an exception like this when specifying an IntegratorId:
         # suds.TypeNotFound: Type not found: 'IntegratorId'
-        # Setting it to None does not seem to appease it.
-        del self.ClientDetail.IntegratorId
+        # Setting it to None does not seem to appease it. It's gone already
+        # when a request is sent again.
+        if hasattr(self.ClientDetail, 'IntegratorId'):
+            del self.ClientDetail.IntegratorId
         self.logger.debug(self.WebAuthenticationDetail)
         self.logger.debug(self.ClientDetail)
         self.logger.debug(self.TransactionDetail)
         self.logger.debug(self.VersionId)
+        # Only the addresses missing from the address cache, if it has some.
+        addresses = self.AddressesToValidate
+        if self._uncached is not None:
+            addresses = [address for key, address in self._uncached]
         # Fire off the query.
         return self.client.service.addressValidation(
                 WebAuthenticationDetail=self.WebAuthenticationDetail,
@@ -68,7 +95,101 @@ class FedexAddressValidationRequest(FedexBaseService):
                 TransactionDetail=self.TransactionDetail,
                 Version=self.VersionId,
                 InEffectAsOfTimestamp=datetime.datetime.now(),
-                AddressesToValidate=self.AddressesToValidate)
+                AddressesToValidate=addresses)
+
+    def send_request(self, send_function=None, timeout=None):
+        try:
+            super(FedexAddressValidationRequest, self).send_request(send_function, timeout=timeout)
+        finally:
+            # A failed send must not leave its misses to the next one.
+            self._uncached = None
+
+    async def send_request_async(self, send_function=None, transport=None, timeout=None):
+        try:
+            return await super(FedexAddressValidationRequest, self).send_request_async(
+                    send_function, transport=transport, timeout=timeout)
+        finally:
+            self._uncached = None
+
+    def _response_cache(self):
+        """
+        With the address_cache option of the config object, addresses
+        validated before are answered from the cache and only the others
+        are sent, each distinct address once. The results are merged back in
+        the order of AddressesToValidate, with their ClientReferenceIds, and
+        the new ones are cached.
+        """
+
+        self._uncached = None
+        cache = self.config_obj.address_cache
+        if cache is None:
+            return None
+        key_function = cache.key_function or address_cache_key
+        return cache, [key_function(self, address) for address in self.AddressesToValidate]
+
+    def _serve_from_cache(self, cache, keys):
+        """
+        Looks every address up, answering the request if all of them are
+        cached, or else leaving the others to be sent.
+        """
+
+        self._cached_results = {}
+        uncached = {}
+        for key, address in zip(keys, self.AddressesToValidate):
+            if key in self._cached_results or key in uncached:
+                continue
+            entry = cache.get(key)
+            if entry is not None and entry[1]:
+                self._cached_results[key] = entry[0]
+            else:
+                # Stale entries are sent again along with the misses.
+                uncached[key] = address
+        if uncached:
+            self._uncached = list(uncached.items())
+            return False
+        self.response = ResponseRecord(HighestSeverity='SUCCESS', Notifications=[], AddressResults=[])
+        self.metrics = None
+        self._merge_results(keys, self._cached_results)
+        return True
+
+    def _store_in_cache(self, cache, keys):
+        """
+        Caches the results of the addresses sent and merges them with the
+        cached ones.
+        """
+
+        uncached = self._uncached
+        reply_results = getattr(self.response, 'AddressResults', None) or []
+        if len(reply_results) != len(uncached):
+            if len(uncached) == len(keys):
+                # Every address was sent, in order: the reply stands as is.
+                self.logger.warning("Got %d address results for %d addresses, not caching them.",
+                                    len(reply_results), len(uncached))
+                return
+            raise FedexError(-1, "Got {} address results for {} addresses.".format(
+                len(reply_results), len(uncached)))
+        results = dict(self._cached_results)
+        for (key, _), result in zip(uncached, reply_results):
+            results[key] = to_response_record(result)
+            results[key].pop('ClientReferenceId', None)
+            cache.put(key, results[key])
+        self._merge_results(keys, results)
+
+    def _merge_results(self, keys, results):
+        """
+        Sets the response's AddressResults to the results by key, in the
+        order of AddressesToValidate, with their ClientReferenceIds.
+        """
+
+        merged = []
+        for key, address in zip(keys, self.AddressesToValidate):
+            # Cached results are shared, answer with a copy.
+            result = ResponseRecord(results[key])
+            reference = _client_reference_id(address)
+            if reference is not None:
+                result.ClientReferenceId = reference
+            merged.append(result)
+        self.response.AddressResults = merged
 
     def add_address(self, address_item):
         """
@@ -82,3 +203,129 @@ class FedexAddressValidationRequest(FedexBaseService):
         """
 
         self.AddressesToValidate.append(address_item)
+
+
+class FedexBulkAddressValidationRequest(object):
+    """
+    This class validates any number of addresses. They are packed into
+    requests of up to MAX_ADDRESSES addresses each, the requests are sent
+    concurrently, and every reply is split back into one result per
+    address. The address_cache option of the config object applies.
+    """
+
+    MAX_ADDRESSES = 100
+    """The most AddressesToValidate Fedex accepts in one request."""
+
+    def __init__(self, config_obj, batch_size=MAX_ADDRESSES, max_workers=8, *args, **kwargs):
+        """
+        The optional keyword args detailed on L{FedexBaseService}
+        apply to each address validation request.
+
+        @type config_obj: L{FedexConfig}
+        @param config_obj: A valid FedexConfig object.
+        @type batch_size: L{int}
+        @keyword batch_size: Addresses per request.
+        @type max_workers: L{int}
+        @keyword max_workers: Maximum number of requests in flight.
+        """
+
+        self.config_obj = config_obj
+        self.batch_size = min(batch_size, self.MAX_ADDRESSES)
+        self.max_workers = max_workers
+        self._pool = FedexRequestPool(FedexAddressValidationRequest, config_obj, max_workers, *args, **kwargs)
+
+    def validate(self, addresses, ordered=True, timeout=None):
+        """
+        Validates the given addresses, yielding a L{BatchResult} per address.
+        Its value is the AddressValidationResult for the address, and its
+        error a L{FedexError} if its request failed.
+
+        Addresses are read lazily and at most twice max_workers requests'
+        worth are held at once, so address books of any size run in bounded
+        memory.
+
+        @type addresses: iterable
+        @param addresses: AddressToValidate WSDL objects, or dicts of the
+            same shape.
+        @type ordered: L{bool}
+        @keyword ordered: When True, results are yielded in input order,
+            otherwise a request's results are yielded as soon as it is done.
+        @type timeout: L{float}
+        @keyword timeout: Seconds the whole batch must complete in. Requests
+            that run out of time fail with a L{FedexTimeoutError<fedex.base_service.FedexTimeoutError>}.
+        """
+
+        batches = ((offset * self.batch_size, chunk)
+                   for offset, chunk in enumerate(chunked(addresses, self.batch_size)))
+        validate_batch = functools.partial(self._validate_batch, deadline=deadline_after(timeout))
+        for batch in run_batch(validate_batch, batches, max_workers=self.max_workers, ordered=ordered):
+            if batch.ok:
+                for result in batch.value:
+                    yield result
+            else:
+                offset, chunk = batch.item
+                for position, address in enumerate(chunk):
+                    yield BatchResult(offset + position, address, error=batch.error)
+
+    def _validate_batch(self, batch, deadline=None):
+        """
+        Sends one request for a batch of addresses and splits its reply.
+        Fedex answers in the order of the AddressesToValidate.
+        """
+
+        offset, chunk = batch
+        with self._pool.request() as request:
+            request.AddressesToValidate = list(chunk)
+            request.send_request(timeout=time_left(deadline))
+            address_results = list(getattr(request.response, 'AddressResults', None) or [])
+
+        results = []
+        for position, address in enumerate(chunk):
+            if position < len(address_results):
+                results.append(BatchResult(offset + position, address, value=address_results[position]))
+            else:
+                error = FedexError(-1, "No address result returned for address {}".format(offset + position))
+                results.append(BatchResult(offset + position, address, error=error))
+        return results
+
+
+def _client_reference_id(address_item):
+    if isinstance(address_item, dict):
+        return address_item.get('ClientReferenceId')
+    return getattr(address_item, 'ClientReferenceId', None)
+
+
+def normalize_address_line(line):
+    """
+    Returns an address line upper-cased, without punctuation or repeated
+    whitespace, and with common words abbreviated, so that
+    C{"155 Old Greenville Highway, Suite 103"} and
+    C{"155 old greenville hwy ste. 103"} compare equal.
+    """
+
+    words = re.sub(r'[.,;:]', ' ', str(line)).upper().split()
+    return ' '.join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
+
+
+def address_cache_key(request, address_item):
+    """
+    Returns the L{ResponseCache<fedex.cache.ResponseCache>} key of an
+    AddressToValidate: its contact and address, with street lines and city
+    normalized by L{normalize_address_line}. The ClientReferenceId is left
+    out.
+
+    @type request: L{FedexAddressValidationRequest}
+    @param request: The request validating the address.
+    """
+
+    # A copy, as plain dicts.
+    item = to_response_record(address_item)
+    item.pop('ClientReferenceId', None)
+    address = item.get('Address')
+    if address:
+        if address.get('StreetLines'):
+            lines = address.StreetLines if isinstance(address.StreetLines, list) else [address.StreetLines]
+            address.StreetLines = [normalize_address_line(line) for line in lines if line]
+        if address.get('City'):
+            address.City = normalize_address_line(address.City)
+    return make_cache_key('address', request.config_obj.use_test_server, request.VersionId, item)
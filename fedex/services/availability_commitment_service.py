@@ -7,8 +7,15 @@ easy access. For more details on each, refer to the respective class's
 documentation.
 """
 
+import copy
 import datetime
-from ..base_service import FedexBaseService
+import time
+from collections import namedtuple
+
+from ..base_service import FedexBaseService, FedexRequestPool
+from ..batch import fill_cache
+from ..cache import make_cache_key
+from ..decoding import to_response_record
 
 
 class FedexAvailabilityCommitmentRequest(FedexBaseService):
@@ -71,6 +78,53 @@ class FedexAvailabilityCommitmentRequest(FedexBaseService):
         self.Service = None
         self.Packaging = 'YOUR_PACKAGING'
 
+    def _refresh_wsdl_objects(self):
+        """
+        Ship on the day of the reset.
+        """
+
+        self.ShipDate = datetime.date.today().isoformat()
+
+    def _response_cache(self):
+        """
+        Serves availability requests from the config object's
+        availability_cache, per lane and weekday.
+        """
+
+        cache = self.config_obj.availability_cache
+        if cache is None:
+            return None
+        return cache, (cache.key_function or lane_cache_key)(self)
+
+    def _cache_entry(self):
+        """
+        Caches the reply with the ship date it was for, until the first
+        midnight after the cache's ttl, so lanes are refreshed at a day
+        boundary rather than during the day.
+        """
+
+        cache = self.config_obj.availability_cache
+        expires = datetime.datetime.fromtimestamp(cache.clock() + cache.ttl).date() + datetime.timedelta(days=1)
+        return ((_ship_date(self.ShipDate).isoformat(), to_response_record(self.response)),
+                _timestamp(expires))
+
+    def _cached_response(self, value):
+        """
+        Moves the delivery dates of a cached reply to this request's ship
+        date, which is on the same weekday.
+        """
+
+        ship_date, response = value
+        days = (_ship_date(self.ShipDate) - _ship_date(ship_date)).days
+        if not days:
+            return response
+        response = copy.deepcopy(response)
+        for option in response.get('Options') or []:
+            delivery_date = option.get('DeliveryDate')
+            if delivery_date:
+                option.DeliveryDate = _ship_date(delivery_date) + datetime.timedelta(days=days)
+        return response
+
     def _assemble_and_send_request(self):
         """
         Fires off the Fedex request.
@@ -99,3 +153,96 @@ class FedexAvailabilityCommitmentRequest(FedexBaseService):
                 CarrierCode=self.CarrierCode,
                 Service=self.Service,
                 Packaging=self.Packaging)
+
+
+Lane = namedtuple('Lane', ['origin_postal_code', 'origin_country_code', 'destination_postal_code',
+                           'destination_country_code', 'service', 'packaging'])
+Lane.__new__.__defaults__ = (None, 'YOUR_PACKAGING')
+"""
+A shipping lane to precompute availability for, see L{precompute_lanes}.
+"""
+
+
+def lane_cache_key(request):
+    """
+    Returns the L{ResponseCache<fedex.cache.ResponseCache>} key of an
+    availability request: its origin and destination postal and country
+    codes, the weekday of its ship date, its service, packaging and carrier
+    code. Answers for the same lane on the same weekday share a key; the
+    delivery dates of a cached answer are moved to the request's ship date.
+
+    @type request: L{FedexAvailabilityCommitmentRequest}
+    @param request: A populated availability request.
+    """
+
+    return make_cache_key('lane', request.config_obj.use_test_server, request.VersionId, request.CarrierCode,
+                          _postal_code(request.Origin), getattr(request.Origin, 'CountryCode', None),
+                          _postal_code(request.Destination), getattr(request.Destination, 'CountryCode', None),
+                          _ship_date(request.ShipDate).weekday(), request.Service, request.Packaging)
+
+
+def precompute_lanes(config_obj, lanes, days=7, max_workers=8, *args, **kwargs):
+    """
+    Fills the config object's availability_cache with the answers for a
+    list of lanes, for each of the next days' ship dates, so checkout
+    delivery promises for them are served locally. Lanes and weekdays that
+    are cached already are not looked up again. The optional keyword args
+    detailed on L{FedexBaseService} apply to each request.
+
+    @type config_obj: L{FedexConfig}
+    @param config_obj: A valid FedexConfig object with an
+        availability_cache.
+    @type lanes: iterable
+    @param lanes: L{Lane}s, or tuples of the same fields.
+    @type days: L{int}
+    @keyword days: Number of ship dates from today to look up, 7 for
+        every weekday.
+    @type max_workers: L{int}
+    @keyword max_workers: Maximum number of requests in flight.
+    @rtype: L{dict}
+    @return: How many lanes and days were C{loaded} from Fedex, were
+        C{cached} already or C{failed}.
+    """
+
+    if config_obj.availability_cache is None:
+        raise ValueError("The config object has no availability_cache.")
+    pool = FedexRequestPool(FedexAvailabilityCommitmentRequest, config_obj, max_workers, *args, **kwargs)
+    today = datetime.date.today()
+
+    def lookup(item):
+        lane, ship_date = item
+        with pool.request() as request:
+            request.Origin.PostalCode = lane.origin_postal_code
+            request.Origin.CountryCode = lane.origin_country_code
+            request.Destination.PostalCode = lane.destination_postal_code
+            request.Destination.CountryCode = lane.destination_country_code
+            request.Service = lane.service
+            request.Packaging = lane.packaging
+            request.ShipDate = ship_date.isoformat()
+            request.send_request()
+            # Requests answered from the cache have no metrics.
+            return request.metrics is not None
+
+    items = ((Lane(*lane), today + datetime.timedelta(days=day)) for lane in lanes for day in range(days))
+    return fill_cache(lookup, items, max_workers)
+
+
+def _postal_code(address):
+    postal_code = getattr(address, 'PostalCode', None)
+    return ''.join(str(postal_code).split()) if postal_code is not None else None
+
+
+def _ship_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _timestamp(day):
+    """
+    Returns the time.time() of local midnight at the start of a day.
+    """
+
+    return time.mktime(day.timetuple())
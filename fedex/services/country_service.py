@@ -7,8 +7,16 @@ easy access. For more details on each, refer to the respective class's
 documentation.
 """
 
+import csv
 import datetime
-from ..base_service import FedexBaseService
+
+from ..base_service import FedexBaseService, FedexRequestPool
+from ..batch import fill_cache
+from ..cache import make_cache_key
+
+POSTAL_CODE_TTL = 30 * 24 * 3600
+"""Suggested ttl of a postal code cache, in seconds. Postal codes rarely
+change, so their answers can be kept for weeks."""
 
 
 class FedexValidatePostalRequest(FedexBaseService):
@@ -59,6 +67,23 @@ class FedexValidatePostalRequest(FedexBaseService):
         self.Address = self.client.factory.create('Address')
         self.ShipDateTime = datetime.datetime.now().isoformat()
 
+    def _refresh_wsdl_objects(self):
+        """
+        Ship at the time of the reset.
+        """
+
+        self.ShipDateTime = datetime.datetime.now().isoformat()
+
+    def _response_cache(self):
+        """
+        Serves postal code lookups from the config object's postal_code_cache.
+        """
+
+        cache = self.config_obj.postal_code_cache
+        if cache is None:
+            return None
+        return cache, (cache.key_function or postal_code_cache_key)(self)
+
     def _assemble_and_send_request(self):
         """
         Fires off the Fedex request.
@@ -86,3 +111,68 @@ class FedexValidatePostalRequest(FedexBaseService):
                 CarrierCode=self.CarrierCode,
                 CheckForMismatch=self.CheckForMismatch,
                 RoutingCode=self.RoutingCode)
+
+
+def postal_code_cache_key(request):
+    """
+    Returns the L{ResponseCache<fedex.cache.ResponseCache>} key of a postal
+    code lookup. It covers the address, with spaces left out of the postal
+    code, and the carrier and routing codes, but not the ship date.
+
+    @type request: L{FedexValidatePostalRequest}
+    @param request: A populated postal code request.
+    """
+
+    address = request.Address
+    postal_code = getattr(address, 'PostalCode', None)
+    if postal_code is not None:
+        postal_code = ''.join(str(postal_code).split())
+    return make_cache_key('postal', request.config_obj.use_test_server, request.VersionId, request.CarrierCode,
+                          request.RoutingCode, request.CheckForMismatch, postal_code,
+                          getattr(address, 'CountryCode', None), getattr(address, 'StateOrProvinceCode', None),
+                          getattr(address, 'City', None))
+
+
+def preload_postal_codes(config_obj, source, max_workers=8, *args, **kwargs):
+    """
+    Fills the config object's postal_code_cache with the answers for a list
+    of known postal codes, so that later lookups of them never wait on
+    Fedex. Codes that are cached already are not looked up again. The
+    optional keyword args detailed on L{FedexBaseService} apply to each
+    request.
+
+    @type config_obj: L{FedexConfig}
+    @param config_obj: A valid FedexConfig object with a postal_code_cache.
+    @type source: L{str} or iterable
+    @param source: The path of a CSV file, or an iterable of rows, each
+        holding a postal code, a country code and optionally a state or
+        province code. Blank rows and rows starting with # are skipped.
+    @type max_workers: L{int}
+    @keyword max_workers: Maximum number of requests in flight.
+    @rtype: L{dict}
+    @return: How many codes were C{loaded} from Fedex, were C{cached}
+        already or C{failed}.
+    """
+
+    if config_obj.postal_code_cache is None:
+        raise ValueError("The config object has no postal_code_cache.")
+    pool = FedexRequestPool(FedexValidatePostalRequest, config_obj, max_workers, *args, **kwargs)
+
+    def lookup(row):
+        with pool.request() as request:
+            request.Address.PostalCode = row[0].strip()
+            request.Address.CountryCode = row[1].strip()
+            if len(row) > 2 and row[2].strip():
+                request.Address.StateOrProvinceCode = row[2].strip()
+            request.send_request()
+            # Requests answered from the cache have no metrics.
+            return request.metrics is not None
+
+    if isinstance(source, str):
+        with open(source) as source_file:
+            return fill_cache(lookup, _rows(csv.reader(source_file)), max_workers)
+    return fill_cache(lookup, _rows(source), max_workers)
+
+
+def _rows(rows):
+    return (row for row in rows if row and row[0].strip() and not row[0].lstrip().startswith('#'))
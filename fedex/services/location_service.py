@@ -7,7 +7,19 @@ easy access. For more details on each, refer to the respective class's
 documentation.
 """
 
+import decimal
+import math
+import re
+import threading
+import time
+from collections import namedtuple
+
 from ..base_service import FedexBaseService
+from ..cache import ResponseCache, make_cache_key
+from ..decoding import ResponseRecord, to_response_record
+
+KM_PER_UNIT = {'KM': 1.0, 'MI': 1.609344}
+"""Kilometres per Fedex distance unit."""
 
 
 class FedexSearchLocationRequest(FedexBaseService):
@@ -71,6 +83,19 @@ class FedexSearchLocationRequest(FedexBaseService):
         self.GeographicCoordinates = None
         self.SortDetail = self.create_wsdl_object_of_type('LocationSortDetail')
 
+    def _response_cache(self):
+        """
+        Serves searches from the config object's location_cache.
+        """
+
+        cache = self.config_obj.location_cache
+        if cache is None:
+            return None
+        search = (cache.key_function or location_search)(self)
+        if search is None:
+            return None
+        return cache, search
+
     def _assemble_and_send_request(self):
         """
         Fires off the Fedex request.
@@ -100,3 +125,324 @@ class FedexSearchLocationRequest(FedexBaseService):
                 Address=self.Address,
                 SortDetail=self.SortDetail,
                 GeographicCoordinates=self.GeographicCoordinates)
+
+
+LocationSearch = namedtuple('LocationSearch', ['constraints', 'address', 'latitude', 'longitude', 'radius', 'units',
+                                               'skip', 'count'])
+"""
+A location search as L{LocationCache} sees it: the key of its constraints,
+the key of its address, where it searches from, its radius in kilometres,
+the units distances are given in, and how many results it skips and wants.
+"""
+
+
+def location_search(request):
+    """
+    Returns the L{LocationSearch} of a request, or None if it can't be
+    answered from a L{LocationCache}: phone number searches and searches
+    sorted by anything but distance.
+
+    @type request: L{FedexSearchLocationRequest}
+    @param request: A populated location search request.
+    """
+
+    if request.LocationsSearchCriterion not in ('ADDRESS', 'GEOGRAPHIC_COORDINATES'):
+        return None
+    sort_detail = request.SortDetail
+    if getattr(sort_detail, 'Criterion', None) not in (None, 'DISTANCE') or \
+            getattr(sort_detail, 'Order', None) not in (None, 'LOWEST_TO_HIGHEST'):
+        return None
+
+    # A copy, as plain dicts.
+    constraints = to_response_record(request.Constraints)
+    if isinstance(constraints, list):
+        constraints = constraints[0] if len(constraints) == 1 else ResponseRecord()
+    radius = constraints.pop('RadiusDistance', None)
+    skip = constraints.pop('ResultsToSkip', None)
+    count = constraints.pop('ResultsRequested', None)
+    units = radius.get('Units') if radius else None
+    if units not in KM_PER_UNIT:
+        units = 'MI'
+    if radius and radius.get('Value') is not None:
+        radius = float(radius.Value) * KM_PER_UNIT[units]
+    else:
+        radius = None
+
+    latitude = longitude = None
+    address = None
+    if request.LocationsSearchCriterion == 'GEOGRAPHIC_COORDINATES':
+        coordinates = parse_coordinates(request.GeographicCoordinates)
+        if coordinates is None:
+            return None
+        latitude, longitude = coordinates
+    else:
+        address = make_cache_key('location-address', request.Address)
+    return LocationSearch(make_cache_key('location', request.config_obj.use_test_server, request.VersionId,
+                                         request.MultipleMatchesAction, constraints),
+                          address, latitude, longitude, radius, units, int(skip or 0),
+                          int(count) if count else None)
+
+
+def parse_coordinates(coordinates):
+    """
+    Returns the latitude and longitude of Fedex's ISO 6709 geographic
+    coordinates, such as C{"+34.07-118.40/"}, or None.
+    """
+
+    match = re.match(r'\s*([+-]?\d+(?:\.\d*)?)([+-]\d+(?:\.\d*)?)', str(coordinates or ''))
+    if match is None:
+        return None
+    return float(match.group(1)), float(match.group(2))
+
+
+def distance(latitude1, longitude1, latitude2, longitude2):
+    """
+    Returns the great circle distance between two points, in kilometres.
+    """
+
+    latitude1, longitude1, latitude2, longitude2 = map(math.radians, (latitude1, longitude1, latitude2, longitude2))
+    a = math.sin((latitude2 - latitude1) / 2) ** 2 + \
+        math.cos(latitude1) * math.cos(latitude2) * math.sin((longitude2 - longitude1) / 2) ** 2
+    return 2 * 6371.0088 * math.asin(min(1.0, math.sqrt(a)))
+
+
+class LocationCache(ResponseCache):
+    """
+    Keeps the locations Fedex returned in a grid of cells of C{cell_size}
+    degrees, and remembers the area each search covered: the circle within
+    its radius, or within its farthest location if Fedex returned fewer
+    locations than it has. Later searches inside a covered area, with the
+    same constraints, are answered from the grid, sorted by distance.
+    Searches by address are answered once an earlier search for the same
+    address told where it is. Set it as the C{location_cache} of a
+    L{FedexConfig<fedex.config.FedexConfig>}.
+
+    Areas are fresh for C{ttl} seconds, and may be served for another
+    C{stale_ttl} seconds while they are searched again in the background.
+    Searches need a RadiusDistance to be answered locally. Distances are
+    computed from the coordinates, so they may differ a little from the
+    ones Fedex returns.
+    """
+
+    def __init__(self, ttl=24 * 3600, stale_ttl=0, cell_size=0.1, max_searches=1000, max_addresses=10000,
+                 key_function=None, clock=time.time):
+        """
+        @type ttl: L{float}
+        @keyword ttl: Seconds a searched area is fresh for.
+        @type stale_ttl: L{float}
+        @keyword stale_ttl: The staleness bound: seconds an area may still be
+            served, and searched again in the background, after it stopped
+            being fresh.
+        @type cell_size: L{float}
+        @keyword cell_size: Size of the grid cells, in degrees.
+        @type max_searches: L{int}
+        @keyword max_searches: The most searched areas remembered. The
+            locations only they cover are forgotten with them.
+        @type max_addresses: L{int}
+        @keyword max_addresses: The most address coordinates remembered.
+        @type key_function: L{callable}
+        @keyword key_function: Called with a request to get its
+            L{LocationSearch}, replacing L{location_search}.
+        @type clock: L{callable}
+        @keyword clock: Returns the current time.time().
+        """
+
+        super(LocationCache, self).__init__(ttl=ttl, stale_ttl=stale_ttl, max_size=max_addresses,
+                                            key_function=key_function, clock=clock)
+        self.cell_size = cell_size
+        self.max_searches = max_searches
+        self._index_lock = threading.Lock()
+        # (constraints, cell) to {location id: (latitude, longitude, detail)}
+        self._cells = {}
+        # Searched areas: (constraints, latitude, longitude, radius, expires)
+        self._areas = []
+
+    def get(self, search):
+        """
+        Answers a search from the grid.
+
+        @type search: L{LocationSearch}
+        @rtype: L{tuple}
+        @return: A reply and whether it is fresh, or None if the search
+            isn't inside a usable searched area.
+        """
+
+        latitude, longitude = search.latitude, search.longitude
+        if latitude is None and search.address is not None:
+            entry = self.backend.get(search.address)
+            if entry is not None:
+                latitude, longitude = entry[0]
+        if latitude is None or search.radius is None:
+            self._count('misses')
+            return None
+
+        now = self.clock()
+        expires = None
+        with self._index_lock:
+            expired = [area for area in self._areas if now >= area[4] + self.stale_ttl]
+            if expired:
+                self._areas = [area for area in self._areas if now < area[4] + self.stale_ttl]
+                self._evict(expired)
+            for constraints, area_latitude, area_longitude, radius, area_expires in self._areas:
+                if constraints == search.constraints and (expires is None or area_expires > expires) and \
+                        distance(latitude, longitude, area_latitude, area_longitude) + search.radius <= radius:
+                    expires = area_expires
+            if expires is None:
+                self._count('misses')
+                return None
+            found = sorted((distance(latitude, longitude, location[0], location[1]), location_id, location[2])
+                           for location_id, location in self._near(search.constraints, latitude, longitude,
+                                                                   search.radius))
+        found = [location for location in found if location[0] <= search.radius]
+        fresh = now < expires
+        self._count('hits' if fresh else 'stale_hits')
+
+        page = found[search.skip:]
+        if search.count:
+            page = page[:search.count]
+        km_per_unit = KM_PER_UNIT[search.units]
+        details = [ResponseRecord(Distance=ResponseRecord(
+                       Value=decimal.Decimal('{:.2f}'.format(location_distance / km_per_unit)), Units=search.units),
+                       LocationDetail=detail)
+                   for location_distance, location_id, detail in page]
+        relationship = ResponseRecord(MatchedAddressGeographicCoordinates=format_coordinates(latitude, longitude),
+                                      DistanceAndLocationDetails=details)
+        return ResponseRecord(HighestSeverity='SUCCESS', Notifications=[], TotalResultsAvailable=len(found),
+                              ResultsReturned=len(page), AddressToLocationRelationships=[relationship]), fresh
+
+    def put(self, search, value, ttl=None, expires=None):
+        """
+        Adds the locations of a search's reply to the grid, and remembers
+        the area it covered.
+        """
+
+        if expires is None:
+            expires = self.clock() + (self.ttl if ttl is None else ttl)
+        value = to_response_record(value)
+        relationships = value.get('AddressToLocationRelationships') or []
+        if not relationships:
+            return
+        relationship = relationships[0]
+        latitude, longitude = search.latitude, search.longitude
+        if latitude is None:
+            coordinates = parse_coordinates(relationship.get('MatchedAddressGeographicCoordinates'))
+            if coordinates is None:
+                return
+            latitude, longitude = coordinates
+            if search.address is not None:
+                self.backend.set(search.address, coordinates, float('inf'))
+
+        locations = {}
+        farthest = 0.0
+        for detail in relationship.get('DistanceAndLocationDetails') or []:
+            location = detail.get('LocationDetail')
+            coordinates = parse_coordinates(location and location.get('GeographicCoordinates'))
+            if coordinates is None:
+                continue
+            location_id = location.get('LocationId') or coordinates
+            locations[location_id] = (coordinates[0], coordinates[1], location)
+            farthest = max(farthest, distance(latitude, longitude, coordinates[0], coordinates[1]))
+
+        radius = search.radius
+        total = value.get('TotalResultsAvailable')
+        if radius is None or search.skip or (total is not None and int(total) > len(locations)):
+            # Only the returned locations are known to be all there is.
+            radius = farthest
+        if radius <= 0:
+            return
+        # Only locations inside a searched area are kept, so that they are
+        # dropped along with it.
+        locations = dict((location_id, location) for location_id, location in locations.items()
+                         if distance(latitude, longitude, location[0], location[1]) <= radius)
+
+        with self._index_lock:
+            # Locations in the area that Fedex didn't return are gone.
+            for location_id, location in list(self._near(search.constraints, latitude, longitude, radius)):
+                if location_id not in locations and \
+                        distance(latitude, longitude, location[0], location[1]) < radius:
+                    self._cells[search.constraints, self._cell(location[0], location[1])].pop(location_id, None)
+            for location_id, location in locations.items():
+                self._cells.setdefault((search.constraints, self._cell(location[0], location[1])), {})[
+                    location_id] = location
+            self._areas.append((search.constraints, latitude, longitude, radius, expires))
+            if len(self._areas) > self.max_searches:
+                evicted = self._areas[:-self.max_searches]
+                del self._areas[:-self.max_searches]
+                self._evict(evicted)
+
+    def invalidate(self, key=None):
+        """
+        Forgets all locations and searched areas. Keys aren't supported.
+        """
+
+        with self._index_lock:
+            self._cells.clear()
+            del self._areas[:]
+        self.backend.clear()
+
+    def stats(self):
+        """
+        Returns a dict with the lookup and refresh counters, and the number
+        of C{locations} and searched C{areas} kept.
+        """
+
+        stats = super(LocationCache, self).stats()
+        del stats['entries']
+        with self._index_lock:
+            stats['locations'] = sum(len(cell) for cell in self._cells.values())
+            stats['areas'] = len(self._areas)
+        return stats
+
+    def _cell(self, latitude, longitude):
+        return int(math.floor(latitude / self.cell_size)), int(math.floor(longitude / self.cell_size))
+
+    def _cell_keys(self, constraints, latitude, longitude, radius):
+        """
+        Yields the keys of the cells around a circle.
+        """
+
+        latitude_span = radius / 111.0
+        longitude_span = radius / (111.0 * max(0.01, math.cos(math.radians(latitude))))
+        south, west = self._cell(latitude - latitude_span, longitude - longitude_span)
+        north, east = self._cell(latitude + latitude_span, longitude + longitude_span)
+        for row in range(south, north + 1):
+            for column in range(west, east + 1):
+                yield constraints, (row, column)
+
+    def _near(self, constraints, latitude, longitude, radius):
+        """
+        Yields the location ids and locations in the cells around a circle.
+        """
+
+        for key in self._cell_keys(constraints, latitude, longitude, radius):
+            cell = self._cells.get(key)
+            if cell:
+                for item in cell.items():
+                    yield item
+
+    def _evict(self, areas):
+        """
+        Drops the locations of areas that were forgotten, unless another
+        searched area still covers them. Called with the index lock held.
+        """
+
+        for constraints, latitude, longitude, radius, expires in areas:
+            remaining = [area for area in self._areas if area[0] == constraints]
+            for key in self._cell_keys(constraints, latitude, longitude, radius):
+                cell = self._cells.get(key)
+                if cell is None:
+                    continue
+                for location_id, location in list(cell.items()):
+                    if not any(distance(location[0], location[1], area[1], area[2]) <= area[3]
+                               for area in remaining):
+                        del cell[location_id]
+                if not cell:
+                    del self._cells[key]
+
+
+def format_coordinates(latitude, longitude):
+    """
+    Returns geographic coordinates as Fedex writes them.
+    """
+
+    return '{:+.6f}{:+.6f}/'.format(latitude, longitude)
@@ -7,7 +7,14 @@ returned with the rates if it is specified in the request.
 """
 
 import datetime
-from ..base_service import FedexBaseService
+import functools
+import math
+from collections import namedtuple
+
+from ..base_service import FedexBaseService, FedexRequestPool
+from ..batch import deadline_after, run_batch, time_left
+from ..cache import make_cache_key
+from ..decoding import to_response_record
 
 
 class FedexRateServiceRequest(FedexBaseService):
@@ -37,8 +44,6 @@ class FedexRateServiceRequest(FedexBaseService):
         # Call the parent FedexBaseService class for basic setup work.
         super(FedexRateServiceRequest, self).__init__(
                 self._config_obj, 'RateService_v28.wsdl', *args, **kwargs)
-        self.ClientDetail.Region = config_obj.express_region_code
-        """@ivar: Holds the express region code from the config object."""
 
     def _prepare_wsdl_objects(self):
         """
@@ -46,6 +51,9 @@ class FedexRateServiceRequest(FedexBaseService):
         the data structure and get it ready for the WSDL request.
         """
 
+        # Holds the express region code from the config object.
+        self.ClientDetail.Region = self._config_obj.express_region_code
+
         # Default behavior is to not request transit information
         self.ReturnTransitAndCommit = False
 
@@ -90,6 +98,13 @@ class FedexRateServiceRequest(FedexBaseService):
         # looks like.
         self.logger.debug(self.RequestedShipment)
 
+    def _refresh_wsdl_objects(self):
+        """
+        Ship at the time of the reset.
+        """
+
+        self.RequestedShipment.ShipTimestamp = datetime.datetime.now()
+
     def _assemble_and_send_request(self):
         """
         Fires off the Fedex request.
@@ -107,6 +122,16 @@ class FedexRateServiceRequest(FedexBaseService):
                 RequestedShipment=self.RequestedShipment,
                 ReturnTransitAndCommit=self.ReturnTransitAndCommit)
 
+    def _response_cache(self):
+        """
+        Serves rate requests from the config object's rate_cache.
+        """
+
+        cache = self.config_obj.rate_cache
+        if cache is None:
+            return None
+        return cache, (cache.key_function or rate_cache_key)(self)
+
     def add_package(self, package_item):
         """
         Adds a package to the ship request.
@@ -123,3 +148,221 @@ class FedexRateServiceRequest(FedexBaseService):
         package_weight = package_item.Weight.Value
         self.RequestedShipment.TotalWeight.Value += package_weight
         self.RequestedShipment.PackageCount += 1
+
+
+def rate_cache_key(request, weight_band=None):
+    """
+    Returns the L{ResponseCache<fedex.cache.ResponseCache>} key of a rate
+    request. It covers everything that is sent except the credentials and
+    transaction details, with the ship timestamp cut to its date, empty
+    values left out and strings normalized, so requests for the same lane,
+    packages and services share a key.
+
+    @type request: L{FedexRateServiceRequest}
+    @param request: A populated rate request.
+    @type weight_band: L{float}
+    @keyword weight_band: Round package and total weights up to a multiple
+        of this, so that e.g. all parcels of 4 to 5 lb share quotes. Only
+        use it if rates don't differ within a band.
+    """
+
+    # A copy, as plain dicts.
+    shipment = to_response_record(request.RequestedShipment)
+    ship_date = shipment.get('ShipTimestamp')
+    if ship_date is not None:
+        shipment.ShipTimestamp = ship_date.date() if hasattr(ship_date, 'date') else str(ship_date)[:10]
+    if weight_band:
+        for weight in [shipment.get('TotalWeight')] + [package.get('Weight') for package in
+                                                      shipment.get('RequestedPackageLineItems') or []]:
+            if weight and weight.get('Value') is not None:
+                weight.Value = math.ceil(float(weight.Value) / weight_band) * weight_band
+    return make_cache_key('rate', request.config_obj.use_test_server, request.VersionId,
+                          request.ClientDetail.AccountNumber, request.ReturnTransitAndCommit, shipment)
+
+
+RateQuote = namedtuple('RateQuote', ['index', 'service_type', 'amount', 'currency', 'transit_days',
+                                     'delivery_timestamp', 'detail', 'delivery_date'])
+"""
+One service option out of a rate reply. C{index} is the position of the
+shipment in the batch, C{detail} is the RateReplyDetail WSDL object.
+C{delivery_date} is the date of the delivery timestamp, or else the ship
+date plus the transit time in business days, None if neither is known.
+"""
+
+# TransitTimeType enumeration values, in order.
+TRANSIT_TIMES = ['ONE_DAY', 'TWO_DAYS', 'THREE_DAYS', 'FOUR_DAYS', 'FIVE_DAYS', 'SIX_DAYS', 'SEVEN_DAYS',
+                 'EIGHT_DAYS', 'NINE_DAYS', 'TEN_DAYS', 'ELEVEN_DAYS', 'TWELVE_DAYS', 'THIRTEEN_DAYS',
+                 'FOURTEEN_DAYS', 'FIFTEEN_DAYS', 'SIXTEEN_DAYS', 'SEVENTEEN_DAYS', 'EIGHTEEN_DAYS',
+                 'NINETEEN_DAYS', 'TWENTY_DAYS']
+
+
+class FedexBulkRateRequest(object):
+    """
+    This class quotes many shipments at once, for example every carton
+    configuration and origin warehouse of a checkout. Add one spec per
+    shipment with add_shipment(), then call send_request(). The requests are
+    sent concurrently and share one parsed RateService client.
+
+    Results are kept in self.results in the order the shipments were added,
+    with per-shipment errors instead of failing the whole batch.
+    """
+
+    def __init__(self, config_obj, max_workers=8, return_transit_and_commit=True, *args, **kwargs):
+        """
+        The optional keyword args detailed on L{FedexBaseService}
+        apply to each rate request.
+
+        @type config_obj: L{FedexConfig}
+        @param config_obj: A valid FedexConfig object.
+        @type max_workers: L{int}
+        @keyword max_workers: Maximum number of requests in flight.
+        @type return_transit_and_commit: L{bool}
+        @keyword return_transit_and_commit: Ask for transit times, which
+            fastest_by_transit_time() needs.
+        """
+
+        self.config_obj = config_obj
+        self.max_workers = max_workers
+        self.return_transit_and_commit = return_transit_and_commit
+        # Requests are cloned from the pool and kept with the results, not
+        # returned to it.
+        self._pool = FedexRequestPool(FedexRateServiceRequest, config_obj, 0, *args, **kwargs)
+        self.shipments = []
+        """@ivar: The shipment specs, in order."""
+        self.results = []
+        """@ivar: One L{BatchResult} per shipment once sent. The value is the
+            sent L{FedexRateServiceRequest}, so its response is on
+            result.value.response."""
+
+    def add_shipment(self, shipment):
+        """
+        Adds a shipment to quote.
+
+        @type shipment: L{FedexRateServiceRequest} or callable
+        @param shipment: Either a populated rate request, or a function that
+            populates a fresh L{FedexRateServiceRequest} passed to it.
+        """
+
+        self.shipments.append(shipment)
+
+    def _send_shipment(self, shipment, deadline=None):
+        if isinstance(shipment, FedexRateServiceRequest):
+            request = shipment
+        else:
+            request = self._pool.checkout()
+            shipment(request)
+        if self.return_transit_and_commit:
+            request.ReturnTransitAndCommit = True
+        request.send_request(timeout=time_left(deadline))
+        return request
+
+    def send_request(self, timeout=None):
+        """
+        Sends all the rate requests and returns the results, in order.
+
+        @type timeout: L{float}
+        @keyword timeout: Seconds all the requests must complete in. Requests
+            that run out of time fail with a L{FedexTimeoutError<fedex.base_service.FedexTimeoutError>}.
+        """
+
+        send_shipment = functools.partial(self._send_shipment, deadline=deadline_after(timeout))
+        self.results = list(run_batch(send_shipment, self.shipments, max_workers=self.max_workers))
+        return self.results
+
+    def quotes(self):
+        """
+        Yields a L{RateQuote} for every service option of every successful
+        shipment.
+        """
+
+        for result in self.results:
+            if not result.ok:
+                continue
+            ship_timestamp = getattr(getattr(result.value, 'RequestedShipment', None), 'ShipTimestamp', None)
+            for detail in getattr(result.value.response, 'RateReplyDetails', None) or []:
+                yield _rate_quote(result.index, detail, ship_timestamp)
+
+    def cheapest_by_service(self):
+        """
+        Returns the cheapest L{RateQuote} of each service type across all
+        shipments, as a dict keyed by service type.
+        """
+
+        cheapest = {}
+        for quote in self.quotes():
+            if quote.amount is None:
+                continue
+            current = cheapest.get(quote.service_type)
+            if current is None or quote.amount < current.amount:
+                cheapest[quote.service_type] = quote
+        return cheapest
+
+    def fastest_by_transit_time(self):
+        """
+        Returns all quotes with a known delivery date, soonest first, see
+        L{RateQuote}. Quotes delivered the same day are ordered by delivery
+        time, those without one last, then by price.
+        """
+
+        def sort_key(quote):
+            # Times of day compare whatever the timestamps' time zones.
+            timestamp = quote.delivery_timestamp
+            return (quote.delivery_date,
+                    timestamp.time() if isinstance(timestamp, datetime.datetime) else datetime.time.max,
+                    quote.amount if quote.amount is not None else float('inf'))
+
+        return sorted((quote for quote in self.quotes() if quote.delivery_date is not None), key=sort_key)
+
+
+def _rate_quote(index, detail, ship_timestamp=None):
+    """
+    Builds a L{RateQuote} from a RateReplyDetail, using the rated shipment
+    detail of the rate type that actually applies.
+    """
+
+    amount = currency = None
+    rated_details = getattr(detail, 'RatedShipmentDetails', None) or []
+    actual_rate_type = getattr(detail, 'ActualRateType', None)
+    for rated_detail in rated_details:
+        rate_detail = getattr(rated_detail, 'ShipmentRateDetail', None)
+        if rate_detail is None or getattr(rate_detail, 'TotalNetCharge', None) is None:
+            continue
+        if amount is None or getattr(rate_detail, 'RateType', None) == actual_rate_type:
+            amount = float(rate_detail.TotalNetCharge.Amount)
+            currency = rate_detail.TotalNetCharge.Currency
+            if getattr(rate_detail, 'RateType', None) == actual_rate_type:
+                break
+
+    transit_time = getattr(detail, 'TransitTime', None)
+    delivery_timestamp = getattr(detail, 'DeliveryTimestamp', None)
+    for commit_detail in getattr(detail, 'CommitDetails', None) or []:
+        transit_time = transit_time or getattr(commit_detail, 'TransitTime', None)
+        delivery_timestamp = delivery_timestamp or getattr(commit_detail, 'CommitTimestamp', None)
+    transit_days = TRANSIT_TIMES.index(transit_time) + 1 if transit_time in TRANSIT_TIMES else None
+
+    if isinstance(delivery_timestamp, datetime.date):
+        delivery_date = delivery_timestamp.date() if isinstance(delivery_timestamp, datetime.datetime) \
+            else delivery_timestamp
+    elif transit_days is not None:
+        ship_date = ship_timestamp.date() if isinstance(ship_timestamp, datetime.datetime) else ship_timestamp
+        if not isinstance(ship_date, datetime.date):
+            ship_date = datetime.date.today()
+        delivery_date = _add_business_days(ship_date, transit_days)
+    else:
+        delivery_date = None
+
+    return RateQuote(index, detail.ServiceType, amount, currency, transit_days, delivery_timestamp, detail,
+                     delivery_date)
+
+
+def _add_business_days(date, days):
+    """
+    Returns the date a number of business days, Monday to Friday, after a
+    date.
+    """
+
+    while days > 0:
+        date += datetime.timedelta(days=1)
+        if date.weekday() < 5:
+            days -= 1
+    return date
@@ -8,6 +8,7 @@ For more details on each, refer to the respective class's documentation.
 
 import datetime
 from ..base_service import FedexBaseService
+from ..streaming import DEFAULT_CHUNK_SIZE, LabelStreamParser
 
 
 class FedexProcessShipmentRequest(FedexBaseService):
@@ -103,15 +104,58 @@ class FedexProcessShipmentRequest(FedexBaseService):
         # looks like.
         self.logger.debug(self.RequestedShipment)
 
-    def send_validation_request(self):
+    def _refresh_wsdl_objects(self):
+        """
+        Ship at the time of the reset.
+        """
+
+        self.RequestedShipment.ShipTimestamp = datetime.datetime.now()
+
+    def send_validation_request(self, timeout=None):
         """
         This is very similar to just sending the shipment via the typical
         send_request() function, but this doesn't create a shipment. It is
         used to make sure "good" values are given by the user or the
         application using the library.
+
+        @type timeout: L{float}
+        @keyword timeout: See L{FedexBaseService.send_request}.
+        """
+
+        self.send_request(send_function=self._assemble_and_send_validation_request, timeout=timeout)
+
+    def send_request_streaming(self, label_sink, chunk_size=DEFAULT_CHUNK_SIZE, timeout=None):
+        """
+        Sends the shipment like send_request(), but streams the label and
+        document images in the reply into sinks as they are received,
+        decoding them in chunks. self.response is filled in as usual, with
+        the images left empty, so peak memory depends on the chunk size
+        rather than the size of the labels.
+
+        The reply body is only streamed from the network with a transport
+        that supports it, such as the keep_alive one. Other transports
+        read the whole body first, but the images are still never decoded
+        as a whole.
+
+        Streamed requests are never resent, not even by a retry policy, as
+        the sinks would get the images twice. If the reply fails part way
+        through, the sinks may hold partial images: discard them.
+
+        @type label_sink: L{callable}
+        @param label_sink: Called with a L{LabelPart<fedex.streaming.LabelPart>} for every image, must
+            return an object with a C{write(bytes)} method, such as an open
+            file or a BytesIO. The objects are not closed.
+        @type chunk_size: L{int}
+        @keyword chunk_size: Bytes read and decoded at a time.
+        @type timeout: L{float}
+        @keyword timeout: See L{FedexBaseService.send_request}.
+        @rtype: L{list}
+        @return: The LabelParts written, each holding its sink.
         """
 
-        self.send_request(send_function=self._assemble_and_send_validation_request)
+        reply_parser = LabelStreamParser(label_sink, chunk_size=chunk_size)
+        self._send(reply_parser=reply_parser, timeout=timeout)
+        return reply_parser.parts
 
     def _assemble_and_send_validation_request(self):
         """
@@ -6,7 +6,10 @@ TrackService WSDL file. Each is encapsulated in a class for easy access.
 For more details on each, refer to the respective class's documentation.
 """
 
-from ..base_service import FedexBaseService, FedexError
+import functools
+
+from ..base_service import FedexBaseService, FedexError, FedexRequestPool
+from ..batch import BatchResult, chunked, deadline_after, run_batch, time_left
 
 
 class FedexInvalidTrackingNumber(FedexError):
@@ -55,7 +58,6 @@ class FedexTrackRequest(FedexBaseService):
         # Call the parent FedexBaseService class for basic setup work.
         super(FedexTrackRequest, self).__init__(
                 self._config_obj, 'TrackService_v16.wsdl', *args, **kwargs)
-        self.IncludeDetailedScans = False
 
     def _prepare_wsdl_objects(self):
         """
@@ -75,6 +77,8 @@ class FedexTrackRequest(FedexBaseService):
 
         self.SelectionDetails.PackageIdentifier = track_package_id
 
+        self.IncludeDetailedScans = False
+
     def _check_response_for_request_errors(self):
         """
         Checks the response to see if there were any errors specific to
@@ -83,11 +87,7 @@ class FedexTrackRequest(FedexBaseService):
         if self.response.HighestSeverity == "ERROR":  # pragma: no cover
             for notification in self.response.Notifications:
                 if notification.Severity == "ERROR":
-                    if "Invalid tracking number" in notification.Message:
-                        raise FedexInvalidTrackingNumber(
-                                notification.Code, notification.Message)
-                    else:
-                        raise FedexError(notification.Code, notification.Message)
+                    raise _track_error(notification)
 
     def _assemble_and_send_request(self):
         """
@@ -106,3 +106,138 @@ class FedexTrackRequest(FedexBaseService):
                 Version=self.VersionId,
                 SelectionDetails=self.SelectionDetails,
                 ProcessingOptions=self.ProcessingOptions)
+
+
+def _track_error(notification):
+    """
+    Classifies an error notification, returning the exception to raise.
+    """
+
+    if "Invalid tracking number" in notification.Message:
+        return FedexInvalidTrackingNumber(notification.Code, notification.Message)
+    return FedexError(notification.Code, notification.Message)
+
+
+class FedexBulkTrackRequest(object):
+    """
+    This class tracks any number of tracking numbers. They are packed into
+    requests of up to MAX_SELECTION_DETAILS SelectionDetails each, the
+    requests are sent concurrently, and every reply is split back into one
+    result per tracking number.
+    """
+
+    MAX_SELECTION_DETAILS = 30
+    """The most SelectionDetails Fedex accepts in one track request."""
+
+    def __init__(self, config_obj, batch_size=MAX_SELECTION_DETAILS, max_workers=8, carrier_code='FDXE',
+                 *args, **kwargs):
+        """
+        The optional keyword args detailed on L{FedexBaseService}
+        apply to each track request.
+
+        @type config_obj: L{FedexConfig}
+        @param config_obj: A valid FedexConfig object.
+        @type batch_size: L{int}
+        @keyword batch_size: Tracking numbers per request.
+        @type max_workers: L{int}
+        @keyword max_workers: Maximum number of requests in flight.
+        @type carrier_code: L{str}
+        @keyword carrier_code: CarrierCode for every SelectionDetails entry,
+            or None to let Fedex work it out.
+        """
+
+        self.config_obj = config_obj
+        self.batch_size = min(batch_size, self.MAX_SELECTION_DETAILS)
+        self.max_workers = max_workers
+        self.carrier_code = carrier_code
+        self._pool = FedexRequestPool(FedexTrackRequest, config_obj, max_workers, *args, **kwargs)
+
+    def track(self, tracking_numbers, ordered=True, timeout=None):
+        """
+        Tracks the given numbers, yielding a L{BatchResult} per number. Its
+        value is the list of TrackDetail WSDL objects for the number, and its
+        error a L{FedexInvalidTrackingNumber} or L{FedexError} if that
+        number (or its whole request) failed.
+
+        @type tracking_numbers: iterable
+        @param tracking_numbers: The numbers to track. They are read lazily.
+        @type ordered: L{bool}
+        @keyword ordered: When True, results are yielded in input order,
+            otherwise a request's results are yielded as soon as it is done.
+        @type timeout: L{float}
+        @keyword timeout: Seconds the whole batch must complete in. Requests
+            that run out of time fail with a L{FedexTimeoutError<fedex.base_service.FedexTimeoutError>}.
+        """
+
+        batches = ((offset * self.batch_size, numbers)
+                   for offset, numbers in enumerate(chunked(tracking_numbers, self.batch_size)))
+        track_batch = functools.partial(self._track_batch, deadline=deadline_after(timeout))
+        for batch in run_batch(track_batch, batches, max_workers=self.max_workers, ordered=ordered):
+            if batch.ok:
+                for result in batch.value:
+                    yield result
+            else:
+                offset, numbers = batch.item
+                for position, number in enumerate(numbers):
+                    yield BatchResult(offset + position, number, error=batch.error)
+
+    def _track_batch(self, batch, deadline=None):
+        """
+        Sends one track request for a batch of numbers and splits its reply.
+        """
+
+        offset, numbers = batch
+        with self._pool.request() as request:
+            request.SelectionDetails = [self._create_selection_detail(request, number) for number in numbers]
+            try:
+                request.send_request(timeout=time_left(deadline))
+            except FedexError:
+                # The request as a whole reports the first error. If the reply
+                # has per-number details, classify each number separately.
+                if not getattr(request.response, 'CompletedTrackDetails', None):
+                    raise
+            return self._split_reply(request.response, offset, numbers)
+
+    def _create_selection_detail(self, request, tracking_number):
+        selection_detail = request.create_wsdl_object_of_type('TrackSelectionDetail')
+        selection_detail.CarrierCode = self.carrier_code
+        selection_detail.PackageIdentifier = request.create_wsdl_object_of_type('TrackPackageIdentifier')
+        selection_detail.PackageIdentifier.Type = 'TRACKING_NUMBER_OR_DOORTAG'
+        selection_detail.PackageIdentifier.Value = tracking_number
+        return selection_detail
+
+    @staticmethod
+    def _split_reply(response, offset, numbers):
+        """
+        Matches CompletedTrackDetails to tracking numbers by the tracking
+        numbers of their TrackDetails. Numbers without details of their own
+        get an error, rather than the details at their position, which may
+        be another package's.
+        """
+
+        completed_details = list(getattr(response, 'CompletedTrackDetails', None) or [])
+        by_number = {}
+        for completed_detail in completed_details:
+            for track_detail in getattr(completed_detail, 'TrackDetails', None) or []:
+                by_number.setdefault(getattr(track_detail, 'TrackingNumber', None), completed_detail)
+
+        results = []
+        for position, number in enumerate(numbers):
+            completed_detail = by_number.get(number)
+            if completed_detail is None:
+                error = FedexError(-1, "No tracking details returned for {}".format(number))
+                results.append(BatchResult(offset + position, number, error=error))
+                continue
+
+            track_details = list(getattr(completed_detail, 'TrackDetails', None) or [])
+            notifications = list(getattr(completed_detail, 'Notifications', None) or [])
+            notifications.extend(track_detail.Notification for track_detail in track_details
+                                 if getattr(track_detail, 'Notification', None) is not None)
+            error = None
+            for notification in notifications:
+                if notification.Severity in ("ERROR", "FAILURE"):
+                    error = _track_error(notification)
+                    break
+            results.append(BatchResult(offset + position, number, value=track_details if error is None else None,
+                                       error=error))
+        return results
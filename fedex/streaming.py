@@ -0,0 +1,174 @@
+"""
+The L{streaming} module pulls label and document images out of a reply as
+it is received. Shipping replies carry their images base64 encoded, one per
+ShippingDocumentPart, and they are by far the largest part of the reply.
+L{LabelStreamParser} decodes them in chunks straight into sinks of your
+choosing and passes the rest of the reply on to suds, so neither the
+base64 text nor the decoded image is ever held in memory as a whole.
+
+See
+L{FedexProcessShipmentRequest.send_request_streaming<fedex.services.ship_service.FedexProcessShipmentRequest.send_request_streaming>}.
+"""
+
+import binascii
+from xml.parsers import expat
+from xml.sax.saxutils import escape, quoteattr
+
+DEFAULT_CHUNK_SIZE = 65536
+"""Bytes read from the network at a time."""
+
+
+class LabelPart(object):
+    """
+    Describes one streamed image, i.e. one Image of a ShippingDocumentPart.
+    """
+
+    def __init__(self, document, package_index=None, document_type=None, image_type=None,
+                 sequence_number=None):
+        self.document = document
+        """@ivar: Name of the element holding the ShippingDocument, e.g.
+            'Label', 'PackageDocuments' or 'ShipmentDocuments'."""
+        self.package_index = package_index
+        """@ivar: 0-based index of the CompletedPackageDetails the image
+            belongs to, or None for shipment level documents."""
+        self.document_type = document_type
+        """@ivar: The ShippingDocument Type, e.g. 'OUTBOUND_LABEL'."""
+        self.image_type = image_type
+        """@ivar: The ShippingDocument ImageType, e.g. 'PDF' or 'ZPLII'."""
+        self.sequence_number = sequence_number
+        """@ivar: The DocumentPartSequenceNumber."""
+        self.sink = None
+        """@ivar: The object the image was written to."""
+        self.size = 0
+        """@ivar: Number of decoded bytes written."""
+
+    def __repr__(self):
+        return '<LabelPart {} package={} type={} image={} {} bytes>'.format(
+                self.document, self.package_index, self.document_type, self.image_type, self.size)
+
+
+class Base64StreamDecoder(object):
+    """
+    Decodes base64 text handed to it in pieces of any size, writing the
+    decoded bytes to a sink as soon as whole 4 character groups are in.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.size = 0
+        self._pending = ''
+
+    def write(self, text):
+        text = self._pending + ''.join(text.split())
+        end = len(text) - len(text) % 4
+        self._pending = text[end:]
+        if end:
+            self._write(binascii.a2b_base64(text[:end]))
+
+    def close(self):
+        if self._pending:
+            # Let binascii complain about truncated input.
+            self._write(binascii.a2b_base64(self._pending))
+            self._pending = ''
+
+    def _write(self, data):
+        self.sink.write(data)
+        self.size += len(data)
+
+
+class LabelStreamParser(object):
+    """
+    An incremental reply parser. Feed it the reply in chunks; images are
+    decoded into the sinks returned by C{sink_factory}, and L{close}
+    returns the reply with the images left empty, ready for suds.
+    """
+
+    def __init__(self, sink_factory, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        @type sink_factory: L{callable}
+        @param sink_factory: Called with a L{LabelPart} for every image, must
+            return an object with a C{write(bytes)} method, such as an open
+            file, a socket's makefile() or a BytesIO.
+        @type chunk_size: L{int}
+        @keyword chunk_size: Bytes of reply to feed at a time, and the most
+            characters of text buffered at once.
+        """
+
+        self.sink_factory = sink_factory
+        self.chunk_size = chunk_size
+        """@ivar: Bytes to feed at a time."""
+        self.parts = []
+        """@ivar: The L{LabelPart}s streamed so far."""
+        self.size = 0
+        """@ivar: Bytes of reply fed so far."""
+        self._skeleton = []
+        # Open element names, and the Type, ImageType and
+        # DocumentPartSequenceNumber values read inside each of them.
+        self._stack = []
+        self._fields = []
+        self._text = []
+        self._package_index = -1
+        self._decoder = None
+        self._parser = expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.buffer_size = chunk_size
+        self._parser.StartElementHandler = self._start_element
+        self._parser.EndElementHandler = self._end_element
+        self._parser.CharacterDataHandler = self._character_data
+
+    def feed(self, chunk):
+        """
+        Parses the next chunk of the reply.
+        """
+
+        self.size += len(chunk)
+        self._parser.Parse(chunk, False)
+
+    def close(self):
+        """
+        Finishes parsing.
+
+        @rtype: L{bytes}
+        @return: The reply without its images.
+        """
+
+        self._parser.Parse(b'', True)
+        return ''.join(self._skeleton).encode('utf-8')
+
+    def _start_element(self, tag, attributes):
+        name = tag.rsplit(':', 1)[-1]
+        if name == 'CompletedPackageDetails':
+            self._package_index += 1
+        elif name == 'Image' and self._stack and self._stack[-1] == 'Parts':
+            document_fields = self._fields[-2] if len(self._fields) > 1 else {}
+            part = LabelPart(self._stack[-2] if len(self._stack) > 1 else None,
+                             self._package_index if 'CompletedPackageDetails' in self._stack else None,
+                             document_fields.get('Type'), document_fields.get('ImageType'),
+                             self._fields[-1].get('DocumentPartSequenceNumber'))
+            part.sink = self.sink_factory(part)
+            self.parts.append(part)
+            self._decoder = Base64StreamDecoder(part.sink)
+        self._stack.append(name)
+        self._fields.append({})
+        self._text = []
+        self._skeleton.append('<' + tag + ''.join(' {}={}'.format(key, quoteattr(value))
+                                                  for key, value in attributes.items()) + '>')
+
+    def _end_element(self, tag):
+        name = self._stack.pop()
+        self._fields.pop()
+        if self._decoder is not None:
+            self._decoder.close()
+            self.parts[-1].size = self._decoder.size
+            self._decoder = None
+        elif name in ('Type', 'ImageType', 'DocumentPartSequenceNumber') and self._fields:
+            self._fields[-1][name] = ''.join(self._text)
+        self._text = []
+        self._skeleton.append('</' + tag + '>')
+
+    def _character_data(self, data):
+        if self._decoder is not None:
+            self._decoder.write(data)
+            return
+        self._text.append(data)
+        self._skeleton.append(escape(data))
@@ -0,0 +1,390 @@
+"""
+The L{stub_server} module runs a local stand-in for the Fedex web services,
+so requests can be benchmarked and tested offline. It reads the WSDLs in
+C{fedex/wsdl} to find every service endpoint and operation, and answers
+each request with a canned reply. Latency and errors can be injected to
+measure throughput and failure handling.
+
+Point a L{FedexConfig<fedex.config.FedexConfig>} at it with C{endpoint_url}::
+
+    with FedexStubServer(latency=0.05) as server:
+        config = FedexConfig(key='', password='', endpoint_url=server.url)
+        rate = FedexRateServiceRequest(config)
+        ...
+
+It can also be run on its own with C{python -m fedex.stub_server}.
+"""
+
+import argparse
+import base64
+import logging
+import os
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse
+from xml.sax.saxutils import escape
+
+WSDL_NS = '{http://schemas.xmlsoap.org/wsdl/}'
+SOAP_ENV_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+
+ENVELOPE = ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<SOAP-ENV:Envelope xmlns:SOAP-ENV="' + SOAP_ENV_NS + '">'
+            '<SOAP-ENV:Header/><SOAP-ENV:Body>{body}</SOAP-ENV:Body></SOAP-ENV:Envelope>')
+
+FAULT = ('<SOAP-ENV:Fault><faultcode>SOAP-ENV:Server</faultcode>'
+         '<faultstring>{message}</faultstring></SOAP-ENV:Fault>')
+
+OPERATION_BODIES = {
+    'getRates': (
+        '<RateReplyDetails><ServiceType>FEDEX_GROUND</ServiceType><PackagingType>YOUR_PACKAGING</PackagingType>'
+        '<TransitTime>THREE_DAYS</TransitTime><RatedShipmentDetails><ShipmentRateDetail>'
+        '<RateType>PAYOR_ACCOUNT_PACKAGE</RateType>'
+        '<TotalNetCharge><Currency>USD</Currency><Amount>10.0</Amount></TotalNetCharge>'
+        '</ShipmentRateDetail></RatedShipmentDetails></RateReplyDetails>'),
+    'processShipment': (
+        '<JobId>STUB</JobId><CompletedShipmentDetail><CarrierCode>FDXG</CarrierCode>'
+        '<MasterTrackingId><TrackingIdType>FEDEX</TrackingIdType><TrackingNumber>{tracking_number}</TrackingNumber>'
+        '</MasterTrackingId><CompletedPackageDetails><SequenceNumber>1</SequenceNumber>'
+        '<TrackingIds><TrackingIdType>FEDEX</TrackingIdType><TrackingNumber>{tracking_number}</TrackingNumber>'
+        '</TrackingIds><Label><Type>OUTBOUND_LABEL</Type><ShippingDocumentDisposition>RETURNED'
+        '</ShippingDocumentDisposition><ImageType>PNG</ImageType><Resolution>200</Resolution>'
+        '<CopiesToPrint>1</CopiesToPrint><Parts><DocumentPartSequenceNumber>1</DocumentPartSequenceNumber>'
+        '<Image>{label}</Image></Parts></Label></CompletedPackageDetails></CompletedShipmentDetail>'),
+    'createPickup': (
+        '<PickupConfirmationNumber>1</PickupConfirmationNumber><Location>STUB</Location>'),
+    'searchLocations': (
+        '<TotalResultsAvailable>1</TotalResultsAvailable><ResultsReturned>1</ResultsReturned>'
+        '<AddressToLocationRelationships><DistanceAndLocationDetails>'
+        '<Distance><Value>1.0</Value><Units>MI</Units></Distance>'
+        '<LocationDetail><LocationId>STUB</LocationId><StoreNumber>1</StoreNumber>'
+        '<GeographicCoordinates>+35.1234-080.1234/</GeographicCoordinates></LocationDetail>'
+        '</DistanceAndLocationDetails></AddressToLocationRelationships>'),
+}
+"""Canned reply contents for the main operations, after the Version element."""
+
+TRACK_DETAIL = ('<CompletedTrackDetails><HighestSeverity>SUCCESS</HighestSeverity>'
+                '<Notifications><Severity>SUCCESS</Severity><Source>trck</Source><Code>0</Code>'
+                '<Message>Request was successfully processed.</Message></Notifications>'
+                '<DuplicateWaybill>false</DuplicateWaybill><MoreData>false</MoreData>'
+                '<TrackDetailsCount>1</TrackDetailsCount><TrackDetails><Notification><Severity>SUCCESS</Severity>'
+                '<Source>trck</Source><Code>0</Code><Message>Request was successfully processed.</Message>'
+                '</Notification><TrackingNumber>{tracking_number}</TrackingNumber>'
+                '<StatusDetail><Code>DL</Code><Description>Delivered</Description></StatusDetail>'
+                '</TrackDetails></CompletedTrackDetails>')
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _find_all(root, name):
+    return [element for element in root.iter() if _local_name(element.tag) == name]
+
+
+def _find_text(root, name, default=None):
+    for element in _find_all(root, name):
+        return element.text
+    return default
+
+
+class StubOperation(object):
+    """
+    An operation read from a WSDL.
+    """
+
+    def __init__(self, name, namespace, request_element, reply_element, path):
+        self.name = name
+        """@ivar: Operation name, e.g. 'getRates'."""
+        self.namespace = namespace
+        """@ivar: Target namespace of the service."""
+        self.request_element = request_element
+        """@ivar: Name of the request element, e.g. 'RateRequest'."""
+        self.reply_element = reply_element
+        """@ivar: Name of the reply element, e.g. 'RateReply'."""
+        self.path = path
+        """@ivar: URL path of the service endpoint."""
+
+
+def load_operations(wsdl_path=None):
+    """
+    Reads the operations of all WSDLs in a directory.
+
+    @type wsdl_path: L{str}
+    @keyword wsdl_path: Defaults to the bundled production WSDLs.
+    @rtype: L{dict}
+    @return: L{StubOperation}s keyed by (namespace, request element name).
+    """
+
+    wsdl_path = wsdl_path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'wsdl')
+    operations = {}
+    for file_name in sorted(os.listdir(wsdl_path)):
+        if not file_name.endswith('.wsdl'):
+            continue
+        root = ET.parse(os.path.join(wsdl_path, file_name)).getroot()
+        namespace = root.get('targetNamespace')
+        messages = dict((message.get('name'), message.find(WSDL_NS + 'part').get('element').split(':')[-1])
+                        for message in root.findall(WSDL_NS + 'message'))
+        locations = [element.get('location') for element in root.iter()
+                     if _local_name(element.tag) == 'address' and element.get('location')]
+        path = urlparse(locations[0]).path if locations else '/'
+        for port_type in root.findall(WSDL_NS + 'portType'):
+            for operation in port_type.findall(WSDL_NS + 'operation'):
+                request_element = messages[operation.find(WSDL_NS + 'input').get('message').split(':')[-1]]
+                reply_element = messages[operation.find(WSDL_NS + 'output').get('message').split(':')[-1]]
+                operations[(namespace, request_element)] = StubOperation(
+                        operation.get('name'), namespace, request_element, reply_element, path)
+    return operations
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        status, reply = self.server.stub.handle(self.path, body)
+        if reply is None:
+            # Injected disconnect.
+            self.close_connection = True
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, format, *args):
+        self.server.stub.logger.debug(format, *args)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FedexStubServer(object):
+    """
+    A local HTTP server answering Fedex SOAP requests with canned replies.
+
+    Every operation of the bundled WSDLs gets a SUCCESS reply echoing the
+    request's Version and TransactionDetail. getRates, processShipment,
+    track, createPickup and searchLocations replies also carry typical
+    contents. Use L{set_reply} to answer an operation some other way.
+    """
+
+    FAILURE = 'FAILURE'
+    """Error kind: a FAILURE notification, raising L{FedexFailure<fedex.base_service.FedexFailure>}."""
+    ERROR = 'ERROR'
+    """Error kind: an ERROR notification, raising L{FedexError<fedex.base_service.FedexError>}."""
+    FAULT = 'FAULT'
+    """Error kind: a SOAP fault with HTTP status 500."""
+    UNAVAILABLE = 'UNAVAILABLE'
+    """Error kind: an empty HTTP 503 reply."""
+    DISCONNECT = 'DISCONNECT'
+    """Error kind: the connection is closed without a reply."""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, latency_jitter=0.0, error_rate=0.0,
+                 error_kind=FAILURE, label_bytes=4096, seed=None, wsdl_path=None):
+        """
+        @type host: L{str}
+        @keyword host: Interface to listen on.
+        @type port: L{int}
+        @keyword port: Port to listen on, 0 picks a free one.
+        @type latency: L{float}
+        @keyword latency: Seconds to wait before replying.
+        @type latency_jitter: L{float}
+        @keyword latency_jitter: Up to this many seconds are randomly added
+            to the latency.
+        @type error_rate: L{float}
+        @keyword error_rate: Share of requests, from 0 to 1, answered with an
+            error of C{error_kind} instead.
+        @type error_kind: L{str}
+        @keyword error_kind: One of L{FAILURE}, L{ERROR}, L{FAULT},
+            L{UNAVAILABLE} or L{DISCONNECT}.
+        @type label_bytes: L{int}
+        @keyword label_bytes: Size of the label image in processShipment
+            replies, before base64 encoding.
+        @type seed: L{int}
+        @keyword seed: Seeds the latency and error randomness.
+        @type wsdl_path: L{str}
+        @keyword wsdl_path: Directory of the WSDLs to serve.
+        """
+
+        self.logger = logging.getLogger('fedex.stub_server')
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_kind = error_kind
+        self.operations = load_operations(wsdl_path)
+        """@ivar: The served L{StubOperation}s."""
+        self.calls = Counter()
+        """@ivar: Number of requests received, by operation name."""
+        self._replies = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._label = base64.b64encode(os.urandom(label_bytes)).decode('ascii')
+        self._tracking_numbers = iter(range(794600000000, 794700000000))
+        self._paths = set(operation.path for operation in self.operations.values())
+        self._server = _ThreadingHTTPServer((host, port), _StubHandler)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL of the server, for the C{endpoint_url} config option."""
+
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        """
+        Serves requests on a background thread.
+        """
+
+        self._thread = threading.Thread(target=self._server.serve_forever, name='FedexStubServer')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops serving and closes the listening socket.
+        """
+
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def set_reply(self, operation, reply):
+        """
+        Answers an operation with a reply of your own.
+
+        @type operation: L{str}
+        @param operation: Operation name, e.g. 'getRates'.
+        @param reply: The whole SOAP envelope as bytes, or a callable that
+            is given the L{StubOperation} and parsed request element and
+            returns one. None restores the canned reply.
+        """
+
+        if reply is None:
+            self._replies.pop(operation, None)
+        else:
+            self._replies[operation] = reply
+
+    def handle(self, path, body):
+        """
+        Answers one request.
+
+        @rtype: L{tuple}
+        @return: HTTP status and reply body. A None body closes the
+            connection without replying.
+        """
+
+        try:
+            envelope = ET.fromstring(body)
+            request = [element for element in envelope.iter('{%s}Body' % SOAP_ENV_NS)][0][0]
+            namespace, request_element = request.tag[1:].split('}')
+            operation = self.operations[(namespace, request_element)]
+        except Exception:
+            return 500, self._fault("Unrecognized request")
+        if path.split('?')[0].rstrip('/') not in self._paths:
+            return 404, self._fault("No service at {}".format(path))
+
+        with self._lock:
+            self.calls[operation.name] += 1
+            delay = self.latency + self._random.uniform(0, self.latency_jitter) if self.latency_jitter \
+                else self.latency
+            failed = self.error_rate and self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+
+        if failed:
+            if self.error_kind == self.DISCONNECT:
+                return 200, None
+            if self.error_kind == self.UNAVAILABLE:
+                return 503, b''
+            if self.error_kind == self.FAULT:
+                return 500, self._fault("Injected fault")
+            return 200, self._reply(operation, request, self.error_kind, '')
+
+        reply = self._replies.get(operation.name)
+        if reply is not None:
+            return 200, reply(operation, request) if callable(reply) else reply
+        return 200, self._reply(operation, request, 'SUCCESS', self._body(operation, request))
+
+    def _body(self, operation, request):
+        if operation.name == 'track':
+            numbers = [_find_text(selection, 'Value', '') for selection in _find_all(request, 'SelectionDetails')]
+            return ''.join(TRACK_DETAIL.format(tracking_number=escape(number)) for number in numbers)
+        body = OPERATION_BODIES.get(operation.name, '')
+        if operation.name == 'processShipment':
+            with self._lock:
+                tracking_number = next(self._tracking_numbers)
+            body = body.format(tracking_number=tracking_number, label=self._label)
+        return body
+
+    def _reply(self, operation, request, severity, body):
+        if severity == 'SUCCESS':
+            code, message = 0, 'Request was successfully processed.'
+        else:
+            code, message = 9999, 'Injected {}.'.format(severity.lower())
+        version = ''.join('<{0}>{1}</{0}>'.format(name, escape(_find_text(request, name, '')))
+                           for name in ('ServiceId', 'Major', 'Intermediate', 'Minor'))
+        transaction_id = _find_text(request, 'CustomerTransactionId')
+        transaction_detail = '<TransactionDetail><CustomerTransactionId>{}</CustomerTransactionId>' \
+                             '</TransactionDetail>'.format(escape(transaction_id)) if transaction_id else ''
+        reply = ('<{element} xmlns="{namespace}"><HighestSeverity>{severity}</HighestSeverity>'
+                 '<Notifications><Severity>{severity}</Severity><Source>stub</Source><Code>{code}</Code>'
+                 '<Message>{message}</Message></Notifications>{transaction_detail}'
+                 '<Version>{version}</Version>{body}</{element}>').format(
+                element=operation.reply_element, namespace=operation.namespace, severity=severity, code=code,
+                message=message, transaction_detail=transaction_detail, version=version, body=body)
+        return ENVELOPE.format(body=reply).encode('utf-8')
+
+    def _fault(self, message):
+        return ENVELOPE.format(body=FAULT.format(message=escape(message))).encode('utf-8')
+
+
+def main(argv=None):
+    """
+    Runs a stub server until interrupted.
+    """
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the Fedex web services.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds to wait before replying")
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help="random extra latency, in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests answered with errors")
+    parser.add_argument('--error-kind', default=FedexStubServer.FAILURE,
+                        choices=[FedexStubServer.FAILURE, FedexStubServer.ERROR, FedexStubServer.FAULT,
+                                 FedexStubServer.UNAVAILABLE, FedexStubServer.DISCONNECT])
+    parser.add_argument('--label-bytes', type=int, default=4096)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    server = FedexStubServer(host=args.host, port=args.port, latency=args.latency,
+                             latency_jitter=args.latency_jitter, error_rate=args.error_rate,
+                             error_kind=args.error_kind, label_bytes=args.label_bytes)
+    server.logger.info("Serving Fedex stubs on %s", server.url)
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
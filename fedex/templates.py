@@ -0,0 +1,284 @@
+"""
+The L{templates} module contains a fast alternative to suds' request
+marshaller. suds builds every envelope as a tree of nodes, resolving the
+schema type of each one, and L{GeneralSudsPlugin<fedex.base_service.GeneralSudsPlugin>}
+then walks the whole tree again to prune the empty ones. For the small,
+frequent Rate and Track requests this is most of the time spent before
+anything is sent, even though the envelope around the request and its
+WebAuthenticationDetail, ClientDetail and Version are the same every time.
+
+An L{EnvelopeTemplate} is compiled per WSDL and operation from the first
+envelope suds renders for it. It keeps the envelope text around the
+request element, renders the static parameters once per distinct value
+(in practice once per L{FedexConfig<fedex.config.FedexConfig>} and service
+version), and writes the rest of the request straight to text, in schema
+order, leaving out what suds would prune. The template checks its output
+against suds' before it is used: the envelopes are byte-identical. Requests
+using features the template doesn't handle, such as xsi:type polymorphism
+or XML attributes, are simply marshalled by suds.
+
+Enable it with the C{envelope_templates} option of
+L{FedexConfig<fedex.config.FedexConfig>}.
+"""
+
+import logging
+import re
+import threading
+import weakref
+
+from suds import sax, tostr
+from suds.sax.element import Element
+from suds.sax.text import Text
+from suds.sudsobject import Object
+
+STATIC_PARAMETERS = ('WebAuthenticationDetail', 'ClientDetail', 'Version')
+"""Request parameters that rarely change between requests, whose rendered
+text is kept by the templates."""
+
+MAX_STATIC_FRAGMENTS = 64
+"""Rendered static parameters kept per template."""
+
+logger = logging.getLogger('fedex.templates')
+
+_MISSING = object()
+
+
+class Unsupported(Exception):
+    """
+    Raised while rendering a request that should be left to suds.
+    """
+
+    pass
+
+
+class _Child(object):
+    """
+    How to render one child element of a complex type.
+    """
+
+    __slots__ = ('name', 'element', 'resolved', 'optional', 'in_choice', 'required_none', 'qualified')
+
+    def __init__(self, element, ancestry, namespace):
+        self.name = element.name
+        self.element = element
+        self.resolved = element.resolve()
+        self.optional = element.optional() or any(parent.optional() for parent in ancestry)
+        self.in_choice = any(parent.choice() for parent in ancestry)
+        # suds renders None values of required elements with their default
+        # or as nil where allowed, both of which survive pruning.
+        self.required_none = element.default is not None or bool(element.nillable)
+        self.qualified = element.form_qualified and element.namespace()[1] == namespace
+
+
+class EnvelopeTemplate(object):
+    """
+    Renders the envelopes of one operation of a WSDL. Get one with
+    L{get_envelope_template}, templates are shared by all clients of a WSDL.
+    """
+
+    def __init__(self, wsdl, method):
+        self.wsdl = wsdl
+        self.operation = method.name
+        self.compiled = False
+        """@ivar: True once the template has been checked against suds."""
+        self.disabled = False
+        """@ivar: True if the template gave a different envelope than suds,
+            it is not used then."""
+        self._lock = threading.Lock()
+        self._plans = {}
+        self._fragments = {}
+        self._head = None
+        self._tail = None
+        self._prefix = None
+        self._request_type = None
+        self._namespace = None
+
+        parts = method.soap.input.body.parts
+        if len(parts) != 1 or not parts[0].element or not method.soap.input.body.wrapped:
+            self.disabled = True
+            return
+        self._element_name, self._namespace = parts[0].element
+        element = wsdl.schema.elements.get((self._element_name, self._namespace))
+        if element is None:
+            self.disabled = True
+            return
+        self._request_type = element.resolve()
+
+    def render(self, kwargs):
+        """
+        Renders the envelope for a call to the operation.
+
+        @type kwargs: L{dict}
+        @param kwargs: The keyword arguments the operation was called with.
+        @rtype: L{bytes}
+        @return: The envelope, or None if the template isn't compiled yet
+            or the request should be marshalled by suds.
+        """
+
+        if not self.compiled or self.disabled:
+            return None
+        try:
+            body = self._render_body(kwargs, self._prefix)
+        except Unsupported as e:
+            logger.debug("Marshalling %s with suds: %s", self.operation, e)
+            return None
+        return self._head + body.encode('utf-8') + self._tail
+
+    def compile(self, envelope, kwargs):
+        """
+        Compiles the template from an envelope suds rendered for the given
+        keyword arguments, if the template renders the same envelope.
+
+        @type envelope: L{bytes}
+        @param envelope: The envelope suds rendered.
+        @rtype: L{bool}
+        @return: True if the template can be used from now on.
+        """
+
+        if self.compiled or self.disabled:
+            return self.compiled
+        match = re.search(br'<(\w+):' + re.escape(self._element_name.encode('utf-8')) + br'>', envelope)
+        end_tag = match and b'</' + match.group(1) + b':' + self._element_name.encode('utf-8') + b'>'
+        if match is None or end_tag not in envelope or \
+                b'xmlns:' + match.group(1) + b'="' + self._namespace.encode('utf-8') + b'"' not in envelope:
+            return False
+        prefix = match.group(1).decode('ascii')
+        try:
+            body = self._render_body(kwargs, prefix)
+        except Unsupported:
+            # Not this request, maybe the next.
+            return False
+        head = envelope[:match.end()]
+        tail = envelope[envelope.rindex(end_tag):]
+        with self._lock:
+            if head + body.encode('utf-8') + tail == envelope:
+                self._head, self._tail, self._prefix = head, tail, prefix
+                self.compiled = True
+            else:
+                logger.warning("Envelope template for %s differs from suds, not using it.", self.operation)
+                self.disabled = True
+        return self.compiled
+
+    def _plan(self, complex_type):
+        """
+        Returns the children of a complex type in schema order and a set of
+        their names, building them on first use.
+        """
+
+        plan = self._plans.get(complex_type)
+        if plan is None:
+            with self._lock:
+                children = [_Child(child, ancestry, self._namespace)
+                            for child, ancestry in complex_type if child.name is not None and not child.isattr()]
+                plan = self._plans[complex_type] = (children, set(child.name for child in children))
+        return plan
+
+    def _render_body(self, kwargs, prefix):
+        children, names = self._plan(self._request_type)
+        for name in kwargs:
+            if name not in names:
+                raise Unsupported('unknown parameter {}'.format(name))
+        out = []
+        for child in children:
+            value = kwargs.get(child.name)
+            if value is None and (child.optional or child.in_choice):
+                continue
+            if child.name in STATIC_PARAMETERS and isinstance(value, Object):
+                out.append(self._render_static(child, value, prefix))
+            else:
+                self._render(out, child, value, prefix)
+        return ''.join(out)
+
+    def _render_static(self, child, value, prefix):
+        key = (child.name, prefix, _fingerprint(value))
+        fragment = self._fragments.get(key)
+        if fragment is None:
+            out = []
+            self._render(out, child, value, prefix)
+            fragment = ''.join(out)
+            with self._lock:
+                if len(self._fragments) >= MAX_STATIC_FRAGMENTS:
+                    self._fragments.clear()
+                self._fragments[key] = fragment
+        return fragment
+
+    def _render(self, out, child, value, prefix):
+        """
+        Appends the text suds would render, after pruning, for a child
+        element holding the given value.
+        """
+
+        if value is None:
+            if child.required_none:
+                raise Unsupported('default or nil value for {}'.format(child.name))
+            return
+        if isinstance(value, (list, tuple)):
+            for item in value:
+                if item is None:
+                    raise Unsupported('None in list {}'.format(child.name))
+                self._render(out, child, item, prefix)
+            return
+        if not child.qualified:
+            raise Unsupported('namespace of {}'.format(child.name))
+        tag = prefix + ':' + child.name
+        if isinstance(value, Object):
+            known = getattr(value.__metadata__, 'sxtype', None)
+            if known is not None and known is not child.resolved:
+                raise Unsupported('type of {}'.format(child.name))
+            if child.resolved.builtin():
+                raise Unsupported('object value for {}'.format(child.name))
+            children, names = self._plan(child.resolved)
+            for name in value.__keylist__:
+                if name not in names:
+                    raise Unsupported('unknown element {} in {}'.format(name, child.name))
+            start = len(out)
+            out.append('<' + tag + '>')
+            for grandchild in children:
+                # Deleted elements aren't rendered at all.
+                item = getattr(value, grandchild.name, _MISSING)
+                if item is _MISSING or item is None and grandchild.optional:
+                    continue
+                self._render(out, grandchild, item, prefix)
+            if len(out) == start + 1:
+                # Nothing left in it, suds prunes it.
+                del out[start]
+            else:
+                out.append('</' + tag + '>')
+            return
+        if isinstance(value, (dict, Text, Element)):
+            raise Unsupported('{} value for {}'.format(type(value).__name__, child.name))
+        text = tostr(child.resolved.translate(value, False))
+        out.append('<' + tag + '>' + (sax.encoder.encode(text) if text else '') + '</' + tag + '>')
+
+
+def _fingerprint(value):
+    """
+    Returns a hashable copy of a suds object's values.
+    """
+
+    if isinstance(value, Object):
+        return type(value), tuple((name, _fingerprint(getattr(value, name))) for name in value.__keylist__)
+    if isinstance(value, (list, tuple)):
+        return tuple(_fingerprint(item) for item in value)
+    return type(value), value
+
+
+_TEMPLATES = weakref.WeakKeyDictionary()
+_TEMPLATES_LOCK = threading.Lock()
+
+
+def get_envelope_template(client, method):
+    """
+    Returns the L{EnvelopeTemplate} for an operation of a suds client's WSDL.
+
+    @param method: The suds Method of the operation.
+    """
+
+    with _TEMPLATES_LOCK:
+        templates = _TEMPLATES.get(client.wsdl)
+        if templates is None:
+            templates = _TEMPLATES[client.wsdl] = {}
+        template = templates.get(method.name)
+        if template is None:
+            template = templates[method.name] = EnvelopeTemplate(client.wsdl, method)
+    return template
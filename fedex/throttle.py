@@ -0,0 +1,430 @@
+"""
+The L{throttle} module keeps requests within the rate Fedex allows an
+account, so that batch jobs don't get live traffic throttled.
+
+Set a L{RateLimiter} as the C{rate_limiter} of your
+L{FedexConfig<fedex.config.FedexConfig>}. It keeps a token bucket per
+account number, shared by all its services: every attempt at a request
+takes a token, and waits for one when the bucket is empty. It may also
+limit the number of requests in flight at once.
+
+Waiting requests are served by priority, then in order of arrival. A
+request's priority is its C{priority} attribute, or else the limiter's
+priority for its service: L{INTERACTIVE}, L{NORMAL} or L{BULK}. Since
+services share their account's queue, interactive rating goes ahead of a
+bulk tracking job. Bulk requests also leave C{bulk_reserve} tokens in the
+bucket, so that interactive requests arriving during a bulk job don't wait.
+
+Buckets are kept in a L{BucketBackend}: in memory with
+L{MemoryBucketBackend}, or shared between processes with
+L{SQLiteBucketBackend}. Time spent waiting is reported as the C{throttle}
+phase of the request's L{RequestMetrics<fedex.instrumentation.RequestMetrics>}.
+"""
+
+import asyncio
+import heapq
+import itertools
+import sqlite3
+import threading
+import time
+
+INTERACTIVE = 0
+"""Priority of requests someone is waiting on, such as rating at checkout."""
+NORMAL = 1
+"""The default priority."""
+BULK = 2
+"""Priority of batch jobs, such as tracking every open shipment."""
+
+
+class BucketBackend(object):
+    """
+    Storage for the token buckets of a L{RateLimiter}. Subclass it to keep
+    buckets elsewhere, such as in Redis.
+    """
+
+    def take(self, key, rate, burst, reserve, now):
+        """
+        Takes a token from a bucket if it has more than C{reserve} left.
+        Buckets start full.
+
+        @type key: L{str}
+        @param key: The bucket.
+        @type rate: L{float}
+        @param rate: Tokens added per second.
+        @type burst: L{float}
+        @param burst: The most tokens the bucket holds.
+        @type reserve: L{float}
+        @param reserve: Tokens to leave in the bucket.
+        @type now: L{float}
+        @param now: The current time.time().
+        @rtype: L{float}
+        @return: 0 if a token was taken, otherwise the seconds until there
+            may be one.
+        """
+
+        raise NotImplementedError
+
+
+def _take(tokens, updated, rate, burst, reserve, now):
+    """
+    Refills a bucket and takes a token from it, returning the wait as
+    L{BucketBackend.take} does and the bucket's new tokens.
+    """
+
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    needed = 1 + min(reserve, burst - 1)
+    if tokens >= needed:
+        return 0.0, tokens - 1
+    return (needed - tokens) / rate, tokens
+
+
+class MemoryBucketBackend(BucketBackend):
+    """
+    Keeps buckets in a dict, for the threads of one process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, rate, burst, reserve, now):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            wait, tokens = _take(tokens, updated, rate, burst, reserve, now)
+            self._buckets[key] = (tokens, now)
+        return wait
+
+
+class SQLiteBucketBackend(BucketBackend):
+    """
+    Keeps buckets in an SQLite database file, so that all processes on a
+    host share the rate of an account.
+    """
+
+    def __init__(self, path, table='fedex_buckets'):
+        """
+        @type path: L{str}
+        @param path: The database file, created if it doesn't exist.
+        @type table: L{str}
+        @keyword table: Name of the table holding the buckets.
+        """
+
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+        connection = self._connection()
+        with connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, tokens REAL, updated REAL)'
+                               .format(self.table))
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return connection
+
+    def take(self, key, rate, burst, reserve, now):
+        connection = self._connection()
+        # Lock the database between reading and writing the bucket.
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated FROM {} WHERE key = ?'.format(self.table),
+                                     (key,)).fetchone()
+            tokens, updated = row if row is not None else (burst, now)
+            wait, tokens = _take(tokens, updated, rate, burst, reserve, now)
+            connection.execute('INSERT OR REPLACE INTO {} (key, tokens, updated) VALUES (?, ?, ?)'
+                               .format(self.table), (key, tokens, max(now, updated)))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return wait
+
+
+class RateLimiter(object):
+    """
+    Limits the rate, and optionally the concurrency, of requests per account
+    number. One limiter is shared by any number of requests and threads.
+    """
+
+    def __init__(self, rate=10.0, burst=None, max_concurrent=None, service_rates=None, priorities=None,
+                 bulk_reserve=0, backend=None, clock=time.time, per_service=False):
+        """
+        @type rate: L{float}
+        @keyword rate: Requests per second allowed per account.
+        @type burst: L{float}
+        @keyword burst: Requests that may be sent at once after a quiet
+            spell. Defaults to one second's worth.
+        @type max_concurrent: L{int}
+        @keyword max_concurrent: The most requests in flight per account,
+            None for no limit.
+        @type service_rates: L{dict}
+        @keyword service_rates: (rate, burst) per service class name, e.g.
+            C{{'FedexTrackRequest': (5, 5)}}. These services get a bucket
+            of their own.
+        @type priorities: L{dict}
+        @keyword priorities: The priority of requests per service class
+            name. Defaults to L{NORMAL}.
+        @type bulk_reserve: L{float}
+        @keyword bulk_reserve: Tokens that L{BULK} requests leave in the
+            bucket for the others.
+        @type backend: L{BucketBackend}
+        @keyword backend: Where buckets are kept. Defaults to a
+            L{MemoryBucketBackend}.
+        @type clock: L{callable}
+        @keyword clock: Returns the current time.time().
+        @type per_service: L{bool}
+        @keyword per_service: When True, every service of an account gets
+            its own bucket and queue, instead of sharing the account's.
+        """
+
+        service_rates = dict(service_rates or {})
+        for limit in [rate] + [service_rate for service_rate, _ in service_rates.values()]:
+            if not limit > 0:
+                raise ValueError("Rates must be more than 0, not {!r}.".format(limit))
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.max_concurrent = max_concurrent
+        self.service_rates = service_rates
+        self.priorities = dict(priorities or {})
+        self.bulk_reserve = bulk_reserve
+        self.backend = backend if backend is not None else MemoryBucketBackend()
+        self.clock = clock
+        self.per_service = per_service
+        self._condition = threading.Condition()
+        self._tickets = itertools.count()
+        self._waiting = {}
+        self._active = {}
+        self._taking = set()
+        self._async_waiters = set()
+        self.waits = 0
+        """@ivar: Number of requests that had to wait."""
+        self.waited = 0.0
+        """@ivar: Seconds spent waiting, in total."""
+
+    def priority_for(self, service, priority=None):
+        """
+        Returns the priority of a request to a service, given its own
+        priority if it has one.
+        """
+
+        if priority is not None:
+            return priority
+        return self.priorities.get(service, NORMAL)
+
+    def bucket_for(self, account, service):
+        """
+        Returns the key of the bucket, and queue, that requests of an
+        account to a service share.
+        """
+
+        if self.per_service or service in self.service_rates:
+            return '{}|{}'.format(account, service)
+        return account
+
+    def acquire(self, account, service, priority=None, timeout=None):
+        """
+        Waits until a request may be sent. Every acquire() must be followed
+        by a L{release} once the reply is in.
+
+        @type account: L{str}
+        @param account: The account number the request is sent for.
+        @type service: L{str}
+        @param service: The service class name, e.g. 'FedexRateServiceRequest'.
+        @type priority: L{int}
+        @keyword priority: L{INTERACTIVE}, L{NORMAL} or L{BULK}, see
+            L{priority_for}.
+        @type timeout: L{float}
+        @keyword timeout: The longest to wait, in seconds, None to wait as
+            long as it takes.
+        @rtype: L{float}
+        @return: Seconds waited, or None if the timeout ran out first. The
+            request must not be sent then, nor released.
+        """
+
+        start = time.perf_counter()
+        end = None if timeout is None else start + timeout
+        key, ticket, take = self._enqueue(account, service, priority)
+        waited = False
+        try:
+            while True:
+                wait = self._try_acquire(key, ticket, take)
+                if wait == 0:
+                    return self._acquired(start, waited)
+                with self._condition:
+                    if wait is None and self._may_try(key, ticket):
+                        # Its turn came meanwhile.
+                        continue
+                    wait = self._wait_time(wait, end)
+                    if wait is not None and wait <= 0:
+                        return None
+                    waited = True
+                    self._condition.wait(wait)
+        finally:
+            self._dequeue(key, ticket)
+
+    async def acquire_async(self, account, service, priority=None, timeout=None):
+        """
+        L{acquire} for asyncio callers, waiting without blocking the event
+        loop. A request cancelled while waiting leaves the queue and holds
+        nothing to release.
+        """
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        end = None if timeout is None else start + timeout
+        key, ticket, take = self._enqueue(account, service, priority)
+        waited = False
+        try:
+            while True:
+                wait = self._try_acquire(key, ticket, take)
+                if wait == 0:
+                    return self._acquired(start, waited)
+                with self._condition:
+                    if wait is None and self._may_try(key, ticket):
+                        continue
+                    wait = self._wait_time(wait, end)
+                    if wait is not None and wait <= 0:
+                        return None
+                    # Registered under the lock, so that no wake-up is missed.
+                    waiter = (loop, loop.create_future())
+                    self._async_waiters.add(waiter)
+                waited = True
+                try:
+                    await asyncio.wait([waiter[1]], timeout=wait)
+                finally:
+                    with self._condition:
+                        self._async_waiters.discard(waiter)
+        finally:
+            self._dequeue(key, ticket)
+
+    @staticmethod
+    def _wait_time(wait, end):
+        """
+        Returns the seconds to wait for, given the wait for a token (None
+        until woken) and the perf_counter() the caller gives up at.
+        """
+
+        if end is None:
+            return wait
+        time_left = end - time.perf_counter()
+        return time_left if wait is None else min(wait, time_left)
+
+    def _enqueue(self, account, service, priority):
+        """
+        Queues a request, returning its bucket key, its ticket and the
+        arguments to take a token from the bucket with.
+        """
+
+        key = self.bucket_for(account, service)
+        rate, burst = self.service_rates.get(service, (self.rate, self.burst))
+        priority = self.priority_for(service, priority)
+        reserve = self.bulk_reserve if priority >= BULK else 0
+        with self._condition:
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._waiting.setdefault(key, []), ticket)
+        return key, ticket, (rate, burst, reserve)
+
+    def _may_try(self, key, ticket):
+        """
+        Returns True if a ticket is first in line and there is room in
+        flight for it. Called holding the condition.
+        """
+
+        return self._waiting[key][0] == ticket and key not in self._taking and \
+            (self.max_concurrent is None or self._active.get(key, 0) < self.max_concurrent)
+
+    def _try_acquire(self, key, ticket, take):
+        """
+        Takes a token for a ticket if it may have one.
+
+        @rtype: L{float}
+        @return: 0 if the request may go, the seconds until there may be a
+            token, or None if it must wait for its turn.
+        """
+
+        with self._condition:
+            if not self._may_try(key, ticket):
+                return None
+            # The backend may block, on another process, so it is called
+            # without the lock. Nobody else takes from the bucket meanwhile.
+            self._taking.add(key)
+        wait = None
+        try:
+            wait = self.backend.take(key, take[0], take[1], take[2], self.clock())
+        finally:
+            with self._condition:
+                self._taking.discard(key)
+                if wait == 0:
+                    self._active[key] = self._active.get(key, 0) + 1
+                    self._dequeue(key, ticket)
+                else:
+                    self._notify()
+        return wait
+
+    def _dequeue(self, key, ticket):
+        """
+        Takes a ticket out of its queue, if it is still in it, letting the
+        next in line go.
+        """
+
+        with self._condition:
+            waiting = self._waiting[key]
+            if ticket in waiting:
+                waiting.remove(ticket)
+                heapq.heapify(waiting)
+                self._notify()
+
+    def _acquired(self, start, waited):
+        """
+        Counts a request that may go, returning the seconds it waited.
+        """
+
+        if not waited:
+            return 0.0
+        waited = time.perf_counter() - start
+        with self._condition:
+            self.waits += 1
+            self.waited += waited
+        return waited
+
+    def _notify(self):
+        """
+        Wakes all waiting requests. Called holding the condition.
+        """
+
+        self._condition.notify_all()
+        for loop, future in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # The loop is closed.
+                pass
+
+    def release(self, account, service):
+        """
+        Marks a request acquired with L{acquire} as done.
+        """
+
+        key = self.bucket_for(account, service)
+        with self._condition:
+            self._active[key] -= 1
+            self._notify()
+
+    def stats(self):
+        """
+        Returns a dict with the number of requests that had to wait (C{waits}), the
+        seconds C{waited} in total, and the number of requests C{waiting}
+        and C{active} now.
+        """
+
+        with self._condition:
+            return {'waits': self.waits, 'waited': self.waited,
+                    'waiting': sum(len(waiting) for waiting in self._waiting.values()),
+                    'active': sum(self._active.values())}
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
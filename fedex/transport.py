@@ -0,0 +1,622 @@
+"""
+The L{transport} module contains a suds transport that keeps HTTP
+connections to the Fedex servers alive between requests.
+
+suds' default transport goes through urllib, which opens a new TCP and TLS
+connection for every request. L{PooledHttpTransport} instead checks
+connections out of per-host pools that are shared by every request in the
+process. A forked child process starts out with empty pools, rather than
+sharing the parent's connections. Enable it with
+C{FedexConfig(keep_alive=True)}.
+
+L{AsyncHttpTransport} does the same for asyncio code.
+"""
+
+import asyncio
+import gzip
+import http.client
+import logging
+import os
+import select
+import socket
+import ssl
+import threading
+import weakref
+import zlib
+from collections import deque
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from suds.transport import Reply, TransportError
+from suds.transport.http import HttpTransport
+
+# Guards the connections of requests being sent, see
+# PooledHttpTransport.abort.
+_SENDING_LOCK = threading.Lock()
+
+
+class HTTPConnectionPool(object):
+    """
+    A pool of idle connections to one host. Connections are handed out
+    last-in first-out, so the most recently used (and least likely to have
+    been closed by the server) connection is reused first. At most
+    C{maxsize} idle connections are kept; there is no limit on how many may
+    be checked out at once.
+    """
+
+    def __init__(self, scheme, host, port, maxsize=10, proxy_url=None, ssl_context=None):
+        """
+        @type scheme: L{str}
+        @param scheme: Either 'http' or 'https'.
+        @type host: L{str}
+        @param host: Host name to connect to.
+        @type port: L{int}
+        @param port: Port to connect to, or None for the scheme's default.
+        @type maxsize: L{int}
+        @keyword maxsize: Maximum number of idle connections to keep.
+        @type proxy_url: L{str}
+        @keyword proxy_url: Proxy to connect through, e.g. 'http://proxy:3128'.
+        @type ssl_context: L{ssl.SSLContext}
+        @keyword ssl_context: TLS settings for https connections.
+        """
+
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self.proxy_url = proxy_url
+        self.ssl_context = ssl_context
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self.connections_created = 0
+        """@ivar: Number of connections opened by this pool."""
+        self.connections_reused = 0
+        """@ivar: Number of times an idle connection was reused."""
+
+    def _new_connection(self, timeout):
+        """Creates a new, not yet connected, connection."""
+
+        if self.proxy_url:
+            proxy = urlsplit(self.proxy_url if '//' in self.proxy_url else '//' + self.proxy_url)
+            host, port = proxy.hostname, proxy.port
+        else:
+            host, port = self.host, self.port
+
+        if self.scheme == 'https':
+            connection = http.client.HTTPSConnection(host, port, timeout=timeout, context=self.ssl_context)
+            if self.proxy_url:
+                connection.set_tunnel(self.host, self.port)
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        return connection
+
+    def get(self, connect_timeout=None):
+        """
+        Checks a connection out of the pool, opening a new one if none are
+        idle. Idle connections that the server closed are dropped, since
+        requests aren't resent once they were written.
+
+        @rtype: L{tuple}
+        @return: The connection and whether it was reused.
+        """
+
+        with self._lock:
+            while self._idle:
+                connection = self._idle.pop()
+                if not _is_dropped(connection):
+                    self.connections_reused += 1
+                    return connection, True
+                connection.close()
+            self.connections_created += 1
+        connection = self._new_connection(connect_timeout)
+        connection.connect()
+        return connection, False
+
+    def put(self, connection):
+        """Returns a connection to the pool, closing it if the pool is full."""
+
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """Closes all idle connections."""
+
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
+
+def _is_dropped(connection):
+    """
+    Returns True if an idle connection was closed by the server, or has
+    anything to read, which it can't have before it sent a request.
+    """
+
+    if connection.sock is None:
+        return True
+    try:
+        return bool(select.select([connection.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+class PoolManager(object):
+    """
+    Holds one L{HTTPConnectionPool} per scheme, host, port and proxy, so that
+    every transport in the process shares the same connections.
+    """
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+        _POOL_MANAGERS.add(self)
+
+    def connection_pool(self, scheme, host, port, maxsize=10, proxy_url=None, ssl_context=None):
+        """
+        Returns the pool for the given host, creating it if needed. The pool
+        size is fixed by whoever creates the pool first.
+        """
+
+        key = (scheme, host, port, proxy_url)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = HTTPConnectionPool(scheme, host, port, maxsize=maxsize,
+                                          proxy_url=proxy_url, ssl_context=ssl_context)
+                self._pools[key] = pool
+            return pool
+
+    def clear(self):
+        """Closes and forgets all pools."""
+
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.close()
+
+    def _after_fork(self):
+        """
+        Forgets all pools in a forked child, which must not share the
+        parent's connections. The locks are replaced, as another thread of
+        the parent may have held them while forking.
+        """
+
+        self._lock = threading.Lock()
+        pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool._lock = threading.Lock()
+            pool.close()
+
+
+_POOL_MANAGERS = weakref.WeakSet()
+
+
+def _after_fork():
+    for pool_manager in list(_POOL_MANAGERS):
+        pool_manager._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+POOL_MANAGER = PoolManager()
+"""The process-wide L{PoolManager} used by L{PooledHttpTransport}."""
+
+
+class PooledHttpTransport(HttpTransport):
+    """
+    A suds transport that sends requests over persistent, pooled HTTP
+    connections. WSDL and other GET requests are still handled by suds'
+    default urllib based implementation.
+    """
+
+    def __init__(self, pool_maxsize=10, host_pool_maxsize=None, connect_timeout=None, read_timeout=None,
+                 pool_manager=None, ssl_context=None, **kwargs):
+        """
+        Any other keyword arguments, such as C{proxy}, are suds transport
+        options. The timeouts are cut short to a request's own timeout, if
+        it has one.
+
+        @type pool_maxsize: L{int}
+        @keyword pool_maxsize: Maximum number of idle connections kept per host.
+        @type host_pool_maxsize: L{dict}
+        @keyword host_pool_maxsize: Per-host overrides of C{pool_maxsize},
+            e.g. C{{'ws.fedex.com': 50}}.
+        @type connect_timeout: L{float}
+        @keyword connect_timeout: Seconds to wait for a connection to be
+            established. Defaults to the read timeout.
+        @type read_timeout: L{float}
+        @keyword read_timeout: Seconds to wait for the server between reads.
+            Defaults to the suds C{timeout} option.
+        @type pool_manager: L{PoolManager}
+        @keyword pool_manager: Defaults to the process-wide L{POOL_MANAGER}.
+        @type ssl_context: L{ssl.SSLContext}
+        @keyword ssl_context: TLS settings for new connections, defaults to
+            the system defaults.
+        """
+
+        HttpTransport.__init__(self, **kwargs)
+        self.logger = logging.getLogger('fedex')
+        self.pool_maxsize = pool_maxsize
+        self.host_pool_maxsize = host_pool_maxsize or {}
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_manager = pool_manager or POOL_MANAGER
+        self.ssl_context = ssl_context
+
+    def _pool_for(self, url):
+        proxy_url = (self.options.proxy or {}).get(url.scheme)
+        maxsize = self.host_pool_maxsize.get(url.hostname, self.pool_maxsize)
+        return self.pool_manager.connection_pool(url.scheme, url.hostname, url.port, maxsize=maxsize,
+                                                 proxy_url=proxy_url, ssl_context=self.ssl_context)
+
+    def send(self, request):
+        """
+        Sends a suds transport request and returns its reply, raising a suds
+        TransportError for HTTP error statuses just like the default
+        transport does.
+        """
+
+        response, message = self._send(request)
+        if response.status in (http.client.ACCEPTED, http.client.NO_CONTENT):
+            return None
+        return Reply(http.client.OK, dict(response.getheaders()), message)
+
+    def send_streaming(self, request, consumer, chunk_size=65536):
+        """
+        Sends a suds transport request like L{send}, but hands the body of a
+        successful reply to C{consumer} in chunks of at most C{chunk_size}
+        bytes as it is read, rather than returning it. A request whose reply
+        fails part way through is not resent, so the consumer never gets
+        the start of a reply twice, but it may have got part of it.
+
+        @rtype: L{int}
+        @return: The HTTP status of the reply.
+        """
+
+        response, message = self._send(request, consumer, chunk_size)
+        return response.status
+
+    def abort(self, request):
+        """
+        Aborts a request being sent from another thread by shutting down
+        its connection, so that it fails at once. Does nothing if it isn't
+        being sent.
+        """
+
+        with _SENDING_LOCK:
+            request.aborted = True
+            # Once released, the connection may be sending another request.
+            connection = getattr(request, 'connection', None)
+            if connection is not None and connection.sock is not None:
+                try:
+                    connection.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _send(self, request, consumer=None, chunk_size=None):
+        url = urlsplit(request.url)
+        pool = self._pool_for(url)
+        if pool.proxy_url and url.scheme == 'http':
+            path = request.url
+        else:
+            path = url.path or '/'
+            if url.query:
+                path += '?' + url.query
+
+        read_timeout = self.read_timeout if self.read_timeout is not None else self.options.timeout
+        connect_timeout = self.connect_timeout if self.connect_timeout is not None else read_timeout
+        if request.timeout is not None:
+            # The request must complete within its timeout, see
+            # FedexBaseService.send_request.
+            read_timeout = _shortest(read_timeout, request.timeout)
+            connect_timeout = _shortest(connect_timeout, request.timeout)
+
+        response, message = self._send_on_pool(pool, path, request, connect_timeout, read_timeout,
+                                               consumer, chunk_size)
+        if message:
+            decompressor = _decompressor(response)
+            if decompressor is not None:
+                message = decompressor.decompress(message) + decompressor.flush()
+        if not 200 <= response.status < 300:
+            raise TransportError(response.reason, response.status, BytesIO(message))
+        return response, message
+
+    def _send_on_pool(self, pool, path, request, connect_timeout, read_timeout, consumer=None, chunk_size=None):
+        """
+        Sends the request on a pooled connection. Failed requests aren't
+        resent, as they may have reached the server: that is left to the
+        L{RetryPolicy<fedex.retry.RetryPolicy>}, which knows which
+        operations are safe to repeat.
+
+        With a consumer, a successful reply's body is streamed to it and
+        the returned message is empty.
+        """
+
+        connection = pool.get(connect_timeout)[0]
+        with _SENDING_LOCK:
+            aborted = getattr(request, 'aborted', False)
+            if not aborted:
+                request.connection = connection
+        if aborted:
+            pool.put(connection)
+            raise ConnectionAbortedError()
+        complete = False
+        try:
+            connection.sock.settimeout(read_timeout)
+            connection.request('POST', path, request.message, request.headers)
+            response = connection.getresponse()
+            if consumer is not None and 200 <= response.status < 300:
+                message = b''
+                self._stream_body(response, consumer, chunk_size)
+            else:
+                message = response.read()
+            complete = True
+        finally:
+            with _SENDING_LOCK:
+                request.connection = None
+                aborted = getattr(request, 'aborted', False)
+            # Only connections that delivered a whole reply are reused,
+            # whatever the request failed with, even the consumer.
+            if complete and not response.will_close and not aborted:
+                pool.put(connection)
+            else:
+                connection.close()
+        return response, message
+
+    @staticmethod
+    def _stream_body(response, consumer, chunk_size):
+        decompressor = _decompressor(response)
+        while True:
+            chunk = response.read(chunk_size)
+            if not chunk:
+                if response.length:
+                    # http.client ends short bodies quietly when read in
+                    # chunks.
+                    raise http.client.IncompleteRead(b'', response.length)
+                break
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            if chunk:
+                consumer(chunk)
+        if decompressor is not None:
+            chunk = decompressor.flush()
+            if chunk:
+                consumer(chunk)
+
+    def __deepcopy__(self, memo={}):
+        clone = HttpTransport.__deepcopy__(self, memo)
+        clone.pool_maxsize = self.pool_maxsize
+        clone.host_pool_maxsize = self.host_pool_maxsize
+        clone.connect_timeout = self.connect_timeout
+        clone.read_timeout = self.read_timeout
+        clone.pool_manager = self.pool_manager
+        clone.ssl_context = self.ssl_context
+        return clone
+
+
+def _shortest(timeout, other):
+    """Returns the shorter of two timeouts, either of which may be None."""
+
+    return other if timeout is None else min(timeout, other)
+
+
+def _decompressor(response):
+    """
+    Returns a zlib decompressor for a gzip or deflate encoded response, or
+    None.
+    """
+
+    encoding = response.getheader('Content-Encoding')
+    if encoding == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return zlib.decompressobj()
+    return None
+
+
+class AsyncHttpTransport(object):
+    """
+    A minimal non-blocking HTTP/1.1 client for sending SOAP envelopes from
+    asyncio code, used by L{FedexBaseService.send_request_async}. It keeps
+    up to C{pool_maxsize} idle connections alive per host and caps the
+    number of concurrent requests per host, so thousands of requests may be
+    in flight while only C{limit_per_host} connections are open.
+
+    Connections belong to the event loop they were opened on; use one
+    transport per loop (see L{get_async_transport}).
+    """
+
+    def __init__(self, limit_per_host=100, ssl_context=None, pool_maxsize=None):
+        """
+        @type limit_per_host: L{int}
+        @keyword limit_per_host: Maximum number of concurrent requests, and
+            so of open connections, per host.
+        @type pool_maxsize: L{int}
+        @keyword pool_maxsize: Idle connections kept per host, defaults to
+            limit_per_host. 0 closes every connection after its request.
+        @type ssl_context: L{ssl.SSLContext}
+        @keyword ssl_context: TLS settings, defaults to the system defaults.
+        """
+
+        self.logger = logging.getLogger('fedex')
+        self.limit_per_host = limit_per_host
+        self.ssl_context = ssl_context
+        self.pool_maxsize = limit_per_host if pool_maxsize is None else pool_maxsize
+        self._idle = {}
+        self._semaphores = {}
+
+    async def send(self, url, message, headers, connect_timeout=None, read_timeout=None, proxy=None):
+        """
+        POSTs a message and returns the reply.
+
+        @type url: L{str}
+        @param url: The URL to post to.
+        @type message: L{bytes}
+        @param message: The request body.
+        @type headers: L{dict}
+        @param headers: HTTP headers to send.
+        @type connect_timeout: L{float}
+        @keyword connect_timeout: Seconds to wait for a new connection.
+        @type read_timeout: L{float}
+        @keyword read_timeout: Seconds to wait for the reply.
+        @type proxy: L{dict}
+        @keyword proxy: Proxy servers by scheme, as on L{FedexConfig}.
+        @rtype: L{tuple}
+        @return: The HTTP status, reason, headers and body.
+        """
+
+        url = urlsplit(url)
+        proxy_url = (proxy or {}).get(url.scheme)
+        key = (url.scheme, url.hostname, url.port, proxy_url)
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._semaphores[key] = asyncio.Semaphore(self.limit_per_host)
+
+        path = url.path or '/'
+        if url.query:
+            path += '?' + url.query
+        if proxy_url and url.scheme == 'http':
+            path = url.geturl()
+        host_header = url.hostname if url.port is None else '%s:%d' % (url.hostname, url.port)
+        request_head = ['POST %s HTTP/1.1' % path, 'Host: %s' % host_header,
+                        'Content-Length: %d' % len(message)]
+        request_head.extend('%s: %s' % (name, value.decode('latin-1') if isinstance(value, bytes) else value)
+                            for name, value in headers.items())
+        request_bytes = ('\r\n'.join(request_head) + '\r\n\r\n').encode('latin-1') + message
+
+        async with semaphore:
+            # As in PooledHttpTransport, failed requests aren't resent.
+            reader, writer = await self._get_connection(key, url, proxy_url, connect_timeout)
+            try:
+                writer.write(request_bytes)
+                response = await asyncio.wait_for(self._read_response(reader), read_timeout)
+            except BaseException:
+                writer.close()
+                raise
+            status, reason, response_headers, body, keep_alive = response
+            idle = self._idle.setdefault(key, [])
+            if keep_alive and len(idle) < self.pool_maxsize:
+                idle.append((reader, writer))
+            else:
+                writer.close()
+
+        encoding = response_headers.get('content-encoding')
+        if encoding == 'gzip':
+            body = gzip.decompress(body)
+        elif encoding == 'deflate':
+            body = zlib.decompress(body)
+        return status, reason, response_headers, body
+
+    async def _get_connection(self, key, url, proxy_url, connect_timeout):
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        return await asyncio.wait_for(self._open_connection(url, proxy_url), connect_timeout)
+
+    async def _open_connection(self, url, proxy_url):
+        """Opens a connection, tunnelling through the proxy if there is one."""
+
+        port = url.port or (443 if url.scheme == 'https' else 80)
+        ssl_context = (self.ssl_context or ssl.create_default_context()) if url.scheme == 'https' else None
+        if not proxy_url:
+            return await asyncio.open_connection(url.hostname, port, ssl=ssl_context)
+
+        proxy = urlsplit(proxy_url if '//' in proxy_url else '//' + proxy_url)
+        reader, writer = await asyncio.open_connection(proxy.hostname, proxy.port or 80)
+        if url.scheme != 'https':
+            return reader, writer
+        if not hasattr(writer, 'start_tls'):
+            writer.close()
+            raise NotImplementedError("HTTPS proxies require Python 3.11 or later for asyncio requests.")
+        writer.write(('CONNECT %s:%d HTTP/1.1\r\nHost: %s:%d\r\n\r\n' % (
+            url.hostname, port, url.hostname, port)).encode('latin-1'))
+        status, reason, _, _, _ = await self._read_response(reader, head_only=True)
+        if status != 200:
+            writer.close()
+            raise OSError("Proxy CONNECT to %s failed: %d %s" % (url.hostname, status, reason))
+        await writer.start_tls(ssl_context, server_hostname=url.hostname)
+        return reader, writer
+
+    @staticmethod
+    async def _read_response(reader, head_only=False):
+        """
+        Reads an HTTP/1.1 response.
+
+        @rtype: L{tuple}
+        @return: The status, reason, lower-cased headers, body and whether
+            the connection may be kept alive.
+        """
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise http.client.RemoteDisconnected("Remote end closed connection without response")
+        version, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+        status = int(status)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if head_only:
+            return status, reason, headers, b'', True
+
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if not size:
+                    # Skip any trailers.
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        elif status in (http.client.NO_CONTENT, http.client.NOT_MODIFIED):
+            body = b''
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return status, reason, headers, body, keep_alive
+
+    def close(self):
+        """Closes all idle connections."""
+
+        for connections in self._idle.values():
+            for reader, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+_ASYNC_TRANSPORTS = weakref.WeakKeyDictionary()
+
+
+def get_async_transport(pool_maxsize=None):
+    """
+    Returns the shared L{AsyncHttpTransport} of the running event loop,
+    creating it on first use.
+
+    @type pool_maxsize: L{int}
+    @keyword pool_maxsize: See L{AsyncHttpTransport}. Each setting gets
+        its own transport.
+    """
+
+    loop = asyncio.get_event_loop()
+    transports = _ASYNC_TRANSPORTS.setdefault(loop, {})
+    transport = transports.get(pool_maxsize)
+    if transport is None:
+        transport = transports[pool_maxsize] = AsyncHttpTransport(pool_maxsize=pool_maxsize)
+    return transport
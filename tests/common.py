@@ -2,6 +2,8 @@
 This module contains common definitions and functions used within the
 test suite.
 """
+from suds.transport import Reply, Transport
+
 from fedex.config import FedexConfig
 
 
@@ -16,3 +18,34 @@ def get_fedex_config():
                          meter_number='',
                          use_test_server=True,
                          proxy = None)
+
+
+class CannedTransport(Transport):
+    """
+    A suds transport that answers every request with a fixed reply, for
+    testing without a Fedex server. Use it through the config object's
+    transport_factory.
+    """
+
+    def __init__(self, reply, sent=None):
+        Transport.__init__(self)
+        self.reply = reply
+        self.sent = sent if sent is not None else []
+
+    def send(self, request):
+        self.sent.append(request)
+        reply = self.reply(request) if callable(self.reply) else self.reply
+        return Reply(200, {}, reply)
+
+
+def get_canned_config(reply):
+    """
+    Returns a FedexConfig whose requests are answered by a L{CannedTransport}.
+    """
+
+    config = get_fedex_config()
+    config.sent = []
+    # suds links each transport to a single client, so every request needs
+    # its own instance.
+    config.transport_factory = lambda config_obj: CannedTransport(reply, config_obj.sent)
+    return config
@@ -2,21 +2,152 @@
 Test module for the Fedex AddressValidationService WSDL.
 """
 
+import asyncio
+import re
 import unittest
 import logging
 import sys
 
 sys.path.insert(0, '..')
-from fedex.services.address_validation_service import FedexAddressValidationRequest
+from fedex.base_service import FedexError
+from fedex.cache import ResponseCache
+from fedex.decoding import ResponseRecord
+from fedex.services.address_validation_service import FedexAddressValidationRequest, address_cache_key
 
 # Common global config object for testing.
-from tests.common import get_fedex_config
+from tests.common import get_canned_config, get_fedex_config
 
 CONFIG_OBJ = get_fedex_config()
 
 logging.getLogger('suds').setLevel(logging.ERROR)
 logging.getLogger('fedex').setLevel(logging.INFO)
 
+AVS_REPLY = """<?xml version="1.0" encoding="UTF-8"?>
+<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/">
+<SOAP-ENV:Body><AddressValidationReply xmlns="http://fedex.com/ws/addressvalidation/v4">
+<HighestSeverity>SUCCESS</HighestSeverity>
+<Notifications><Severity>SUCCESS</Severity><Source>wsi</Source><Code>0000</Code><Message>Success</Message></Notifications>
+<Version><ServiceId>aval</ServiceId><Major>4</Major><Intermediate>0</Intermediate><Minor>0</Minor></Version>
+{results}
+</AddressValidationReply></SOAP-ENV:Body></SOAP-ENV:Envelope>"""
+
+AVS_RESULT = """<AddressResults>{reference}<State>STANDARDIZED</State><Classification>BUSINESS</Classification>
+<EffectiveAddress><StreetLines>{street}</StreetLines><CountryCode>US</CountryCode></EffectiveAddress></AddressResults>"""
+
+
+def avs_reply(request):
+    # One result per address, echoing its first street line.
+    results = []
+    for address in re.findall(br'<(?:\w+:)?AddressesToValidate>(.*?)</(?:\w+:)?AddressesToValidate>', request.message):
+        reference = re.search(br'<(?:\w+:)?ClientReferenceId>(.*?)<', address)
+        street = re.search(br'<(?:\w+:)?StreetLines>(.*?)<', address).group(1).decode('utf-8')
+        results.append(AVS_RESULT.format(
+            reference='<ClientReferenceId>{}</ClientReferenceId>'.format(reference.group(1).decode('utf-8'))
+            if reference else '', street=street.upper()))
+    return AVS_REPLY.format(results=''.join(results)).encode('utf-8')
+
+
+class AddressCacheTests(unittest.TestCase):
+    """
+    These tests verify that validated addresses are cached.
+    """
+
+    def make_request(self, config, *streets):
+        avs_request = FedexAddressValidationRequest(config)
+        for index, street in enumerate(streets):
+            address = avs_request.create_wsdl_object_of_type('AddressToValidate')
+            address.ClientReferenceId = 'ref{}'.format(index)
+            address.Address = avs_request.create_wsdl_object_of_type('Address')
+            address.Address.StreetLines = [street]
+            address.Address.PostalCode = '29631'
+            address.Address.CountryCode = 'US'
+            avs_request.add_address(address)
+        return avs_request
+
+    def make_key(self, config, street):
+        avs_request = self.make_request(config, street)
+        return address_cache_key(avs_request, avs_request.AddressesToValidate[0])
+
+    def validate(self, config, *streets):
+        avs_request = self.make_request(config, *streets)
+        avs_request.send_request()
+        return avs_request
+
+    def test_cache(self):
+        config = get_canned_config(avs_reply)
+        config.address_cache = ResponseCache(ttl=3600)
+
+        # Duplicates are only sent once.
+        first = self.validate(config, '155 Old Greenville Highway', '155 old greenville hwy.')
+        self.assertEqual(len(config.sent), 1)
+        self.assertEqual(config.sent[0].message.count(b'StreetLines>') // 2, 1)
+        self.assertEqual([result.ClientReferenceId for result in first.response.AddressResults], ['ref0', 'ref1'])
+
+        # Only misses are sent, results keep the callers' order.
+        second = self.validate(config, '1 Main Street', '155  Old Greenville HWY')
+        self.assertEqual(len(config.sent), 2)
+        self.assertEqual(config.sent[1].message.count(b'StreetLines>') // 2, 1)
+        results = second.response.AddressResults
+        self.assertEqual([result.EffectiveAddress.StreetLines[0] for result in results],
+                         ['1 MAIN STREET', '155 OLD GREENVILLE HIGHWAY'])
+        self.assertEqual([result.ClientReferenceId for result in results], ['ref0', 'ref1'])
+
+        # No request at all when every address is known.
+        third = self.validate(config, '1 main st')
+        self.assertEqual(len(config.sent), 2)
+        self.assertEqual(third.response.HighestSeverity, 'SUCCESS')
+        self.assertEqual(third.response.AddressResults[0].State, 'STANDARDIZED')
+        # New and cached results are of the same type.
+        self.assertEqual(set(type(result) for result in second.response.AddressResults), {ResponseRecord})
+
+    def test_async(self):
+        # test_hedging imports this module's replies.
+        from tests.test_hedging import FakeAsyncTransport
+
+        config = get_canned_config(avs_reply)
+        config.address_cache = ResponseCache(ttl=3600)
+        self.validate(config, '1 Main Street')
+        transport = FakeAsyncTransport(reply=avs_reply)
+        avs_request = self.make_request(config, '1 main st', '2 Main Street')
+        asyncio.run(avs_request.send_request_async(transport=transport))
+        # Only the miss was sent.
+        self.assertEqual(len(transport.sent), 1)
+        self.assertEqual(transport.sent[0].count(b'StreetLines>') // 2, 1)
+        self.assertEqual([result.EffectiveAddress.StreetLines[0] for result in avs_request.response.AddressResults],
+                         ['1 MAIN STREET', '2 MAIN STREET'])
+
+    def test_missing_results(self):
+        def short_reply(request):
+            # Drops the last result.
+            return re.sub(br'(.*)<AddressResults>.*?</AddressResults>', br'\1', avs_reply(request), flags=re.S)
+
+        config = get_canned_config(short_reply)
+        config.address_cache = ResponseCache(ttl=3600)
+        self.validate(config, '1 Main Street')
+        self.assertEqual(len(config.address_cache.backend), 0)
+        # With some addresses answered from the cache, the results can't be
+        # matched up with the addresses.
+        config.address_cache.put(self.make_key(config, '1 Main Street'), ResponseRecord(State='STANDARDIZED'))
+        self.assertRaises(FedexError, self.validate, config, '1 Main Street', '2 Main Street', '3 Main Street')
+
+    def test_failed_send(self):
+        failures = []
+
+        def failing_reply(request):
+            if failures:
+                raise failures.pop()
+            return avs_reply(request)
+
+        config = get_canned_config(failing_reply)
+        config.address_cache = ResponseCache(ttl=3600)
+        self.validate(config, '1 Main Street')
+        avs_request = self.make_request(config, '1 main st', '2 Main Street')
+        failures.append(OSError("Connection refused"))
+        self.assertRaises(OSError, avs_request.send_request)
+        # Sending without the cache sends every address again.
+        avs_request.send_request(send_function=avs_request._assemble_and_send_request)
+        self.assertEqual(config.sent[-1].message.count(b'StreetLines>') // 2, 2)
+
 
 @unittest.skipIf(not CONFIG_OBJ.account_number, "No credentials provided.")
 class AddressValidationServiceTests(unittest.TestCase):
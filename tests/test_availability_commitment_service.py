@@ -2,21 +2,93 @@
 Test module for the Fedex ShipService WSDL.
 """
 
+import datetime
+import re
+import time
 import unittest
 import logging
 import sys
 
 sys.path.insert(0, '..')
-from fedex.services.availability_commitment_service import FedexAvailabilityCommitmentRequest
+from fedex.cache import ResponseCache
+from fedex.services.availability_commitment_service import (FedexAvailabilityCommitmentRequest, Lane,
+                                                            lane_cache_key, precompute_lanes)
 
 # Common global config object for testing.
-from tests.common import get_fedex_config
+from tests.common import get_canned_config, get_fedex_config
 
 CONFIG_OBJ = get_fedex_config()
 
 logging.getLogger('suds').setLevel(logging.ERROR)
 logging.getLogger('fedex').setLevel(logging.INFO)
 
+AVAILABILITY_REPLY = """<?xml version="1.0" encoding="UTF-8"?>
+<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/">
+<SOAP-ENV:Body><ServiceAvailabilityReply xmlns="http://fedex.com/ws/vacs/v8">
+<HighestSeverity>SUCCESS</HighestSeverity>
+<Notifications><Severity>SUCCESS</Severity><Source>vacs</Source><Code>0</Code><Message>Done</Message></Notifications>
+<Version><ServiceId>vacs</ServiceId><Major>8</Major><Intermediate>0</Intermediate><Minor>0</Minor></Version>
+<Options><Service>PRIORITY_OVERNIGHT</Service><DeliveryDate>{delivery_date}</DeliveryDate></Options>
+<Options><Service>FEDEX_GROUND</Service><TransitTime>THREE_DAYS</TransitTime></Options>
+</ServiceAvailabilityReply></SOAP-ENV:Body></SOAP-ENV:Envelope>"""
+
+
+def availability_reply(request):
+    # Overnight delivers the day after the ship date.
+    ship_date = re.search(br'<(?:\w+:)?ShipDate>([\d-]+)<', request.message).group(1).decode('ascii')
+    delivery_date = datetime.datetime.strptime(ship_date, '%Y-%m-%d').date() + datetime.timedelta(days=1)
+    return AVAILABILITY_REPLY.format(delivery_date=delivery_date.isoformat()).encode('utf-8')
+
+
+class LaneCacheTests(unittest.TestCase):
+    """
+    These tests verify that availability is cached per lane and weekday.
+    """
+
+    def check(self, config, ship_date, destination='27577'):
+        avc_request = FedexAvailabilityCommitmentRequest(config)
+        avc_request.Origin.PostalCode = '29631'
+        avc_request.Origin.CountryCode = 'US'
+        avc_request.Destination.PostalCode = destination
+        avc_request.Destination.CountryCode = 'US'
+        avc_request.ShipDate = ship_date
+        avc_request.send_request()
+        return avc_request
+
+    def test_cache(self):
+        config = get_canned_config(availability_reply)
+        config.availability_cache = ResponseCache(ttl=0)
+
+        # Monday.
+        first = self.check(config, '2026-10-19')
+        self.assertEqual(first.response.Options[0].DeliveryDate, datetime.date(2026, 10, 20))
+
+        # The next Monday is answered from the cache, moved a week on.
+        second = self.check(config, datetime.date(2026, 10, 26))
+        self.assertEqual(len(config.sent), 1)
+        self.assertEqual(second.response.Options[0].DeliveryDate, datetime.date(2026, 10, 27))
+        self.assertEqual(second.response.Options[1].TransitTime, 'THREE_DAYS')
+        self.assertEqual(first.response.Options[0].DeliveryDate, datetime.date(2026, 10, 20))
+
+        # Tuesdays and other lanes are not.
+        self.check(config, '2026-10-20')
+        self.check(config, '2026-10-19', '27578')
+        self.assertEqual(len(config.sent), 3)
+
+        # Entries expire at midnight.
+        expires = config.availability_cache.backend.get(lane_cache_key(first))[1]
+        self.assertEqual(expires, time.mktime((datetime.date.today() + datetime.timedelta(days=1)).timetuple()))
+
+    def test_precompute(self):
+        config = get_canned_config(availability_reply)
+        config.availability_cache = ResponseCache(ttl=3600)
+        lanes = [('29631', 'US', '27577', 'US'), Lane('29631', 'US', '10001', 'US', 'PRIORITY_OVERNIGHT')]
+
+        self.assertEqual(precompute_lanes(config, lanes), {'loaded': 14, 'cached': 0, 'failed': 0})
+        self.assertEqual(precompute_lanes(config, lanes[:1], days=3), {'loaded': 0, 'cached': 3, 'failed': 0})
+        self.check(config, datetime.date.today() + datetime.timedelta(days=9))
+        self.assertEqual(len(config.sent), 14)
+
 
 @unittest.skipIf(not CONFIG_OBJ.account_number, "No credentials provided.")
 class AvailabilityCommitmentServiceTests(unittest.TestCase):
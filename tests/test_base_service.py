@@ -0,0 +1,251 @@
+"""
+Test module for the Fedex base service and its supporting classes.
+"""
+
+import unittest
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from suds.plugin import DocumentPlugin
+from suds.transport import Request
+
+sys.path.insert(0, '..')
+from fedex.base_service import FedexClientCache, FedexRequestPool, GeneralSudsPlugin, CLIENT_CACHE
+from fedex.services.rate_service import FedexRateServiceRequest
+from fedex.services.track_service import FedexTrackRequest
+
+# Common global config object for testing.
+from tests.common import get_canned_config, get_fedex_config
+from tests.test_batch import track_reply
+
+CONFIG_OBJ = get_fedex_config()
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+
+class FedexClientCacheTests(unittest.TestCase):
+    """
+    These tests verify that parsed suds clients are shared between requests.
+    """
+
+    def test_client_reuse(self):
+        cache = FedexClientCache()
+        wsdl_path = FedexRateServiceRequest(CONFIG_OBJ).wsdl_path
+
+        client1 = cache.get_client(wsdl_path, plugins=[GeneralSudsPlugin()])
+        client2 = cache.get_client(wsdl_path, plugins=[GeneralSudsPlugin()])
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+        # Clones share the schema but not their options.
+        assert client1.wsdl is client2.wsdl
+        assert client1.options.plugins[0] is not client2.options.plugins[0]
+        client1.set_options(nosend=True)
+        assert not client2.options.nosend
+
+        # A different proxy is a different client.
+        cache.get_client(wsdl_path, proxy={'https': 'http://localhost:3128'}, plugins=[GeneralSudsPlugin()])
+        self.assertEqual(cache.stats()['misses'], 2)
+
+        cache.invalidate(wsdl_path)
+        self.assertEqual(cache.stats()['size'], 0)
+        client3 = cache.get_client(wsdl_path, plugins=[GeneralSudsPlugin()])
+        assert client3.wsdl is not client1.wsdl
+
+    def test_schema_cache(self):
+        cache = FedexClientCache()
+        wsdl_path = FedexRateServiceRequest(CONFIG_OBJ).wsdl_path
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+
+        # First process: parse the WSDL and save the resolved schema.
+        client = cache.get_client(wsdl_path, plugins=[GeneralSudsPlugin()], schema_cache_dir=cache_dir)
+        assert client.options.cache.misses == 1
+        assert [name for name in os.listdir(cache_dir) if name.endswith('.pickle')]
+
+        # "New process": load the schema from disk instead.
+        cache.invalidate()
+        client = cache.get_client(wsdl_path, plugins=[GeneralSudsPlugin()], schema_cache_dir=cache_dir)
+        assert client.options.cache.hits == 1
+        assert client.factory.create('RequestedShipment') is not None
+
+        # A failed write leaves no temporary file behind.
+        files = sorted(os.listdir(cache_dir))
+        client.options.cache.put('unpicklable', lambda: None)
+        self.assertEqual(sorted(os.listdir(cache_dir)), files)
+
+    def test_concurrent_parsing(self):
+        cache = FedexClientCache()
+        barrier = threading.Barrier(2, timeout=10)
+        errors = []
+
+        class MeetingPlugin(DocumentPlugin):
+            # Both WSDLs must be parsing at the same time to pass the barrier.
+            met = False
+
+            def parsed(self, context):
+                if not self.met:
+                    self.met = True
+                    barrier.wait()
+
+        def get_client(request_class):
+            try:
+                cache.get_client(request_class(CONFIG_OBJ).wsdl_path, plugins=[MeetingPlugin()])
+            except threading.BrokenBarrierError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=get_client, args=(request_class,))
+                   for request_class in (FedexRateServiceRequest, FedexTrackRequest)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_services_use_registry(self):
+        FedexRateServiceRequest(CONFIG_OBJ)
+        hits = CLIENT_CACHE.hits
+        rate = FedexRateServiceRequest(CONFIG_OBJ)
+        self.assertEqual(CLIENT_CACHE.hits, hits + 1)
+        assert rate.RequestedShipment.TotalWeight.Units == 'LB'
+
+    def test_concurrent_replies(self):
+        # Clones share the WSDL's bindings, replies must not mix up.
+        config = get_canned_config(track_reply)
+        errors = []
+        barrier = threading.Barrier(8)
+
+        def parse(number):
+            track = FedexTrackRequest(config)
+            track.SelectionDetails.PackageIdentifier.Value = number
+            prepared = track._prepare_request()
+            reply = track_reply(Request(prepared.url, prepared.envelope))
+            barrier.wait()
+            for attempt in range(100):
+                response = prepared.process_reply(reply)
+                parsed = response.CompletedTrackDetails[0].TrackDetails[0].TrackingNumber
+                if parsed != number:
+                    errors.append((number, parsed))
+
+        # Switching threads often makes a mix-up show reliably.
+        self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+        sys.setswitchinterval(1e-6)
+        threads = [threading.Thread(target=parse, args=(str(number),)) for number in range(100, 108)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+class GeneralSudsPluginTests(unittest.TestCase):
+    """
+    These tests verify that logged envelopes are only rendered when needed.
+    """
+
+    class Context(object):
+        envelope = b'<ns1:Key>secret</ns1:Key><ns1:Image>' + b'A' * 100 + b'</ns1:Image><ns1:Value>1</ns1:Value>'
+
+    def test_disabled_logger(self):
+        class Envelope(object):
+            def __str__(self):
+                raise AssertionError("Envelope rendered with logging disabled.")
+
+        plugin = GeneralSudsPlugin(max_length=10, redact_fields=GeneralSudsPlugin.REDACTED_FIELDS)
+        context = self.Context()
+        context.envelope = Envelope()
+        logger = logging.getLogger('fedex.request')
+        level = logger.level
+        logger.setLevel(logging.WARNING)
+        self.addCleanup(logger.setLevel, level)
+        plugin.sending(context)
+
+    def test_redact_and_truncate(self):
+        plugin = GeneralSudsPlugin(redact_fields=GeneralSudsPlugin.REDACTED_FIELDS)
+        self.assertEqual(plugin._format_message(self.Context.envelope),
+                         b'<ns1:Key>[6 bytes redacted]</ns1:Key><ns1:Image>[100 bytes redacted]</ns1:Image>'
+                         b'<ns1:Value>1</ns1:Value>')
+
+        plugin = GeneralSudsPlugin(max_length=20)
+        self.assertEqual(plugin._format_message(self.Context.envelope),
+                         b'<ns1:Key>secret</ns1... [152 bytes truncated]')
+
+        # Without options envelopes are logged as they are.
+        plugin = GeneralSudsPlugin()
+        assert plugin._format_message(self.Context.envelope) is self.Context.envelope
+
+
+
+class FedexRequestReuseTests(unittest.TestCase):
+    """
+    These tests verify that requests can be reset, cloned and pooled.
+    """
+
+    def test_reset_and_clone(self):
+        rate = FedexRateServiceRequest(CONFIG_OBJ, customer_transaction_id='first')
+        timestamp = rate.RequestedShipment.ShipTimestamp
+        rate.RequestedShipment.Shipper.Address.PostalCode = '29631'
+        package = rate.create_wsdl_object_of_type('RequestedPackageLineItem')
+        package.Weight = rate.create_wsdl_object_of_type('Weight')
+        package.Weight.Value = 2.0
+        rate.add_package(package)
+        rate.ReturnTransitAndCommit = True
+        rate.response = object()
+
+        self.assertIs(rate.reset(), rate)
+        self.assertEqual(rate.RequestedShipment.Shipper.Address.PostalCode, None)
+        self.assertEqual(rate.RequestedShipment.RequestedPackageLineItems, [])
+        self.assertEqual(rate.RequestedShipment.TotalWeight.Value, 0.0)
+        self.assertEqual(rate.ReturnTransitAndCommit, False)
+        self.assertEqual(rate.response, None)
+        self.assertEqual(rate.TransactionDetail.CustomerTransactionId, 'first')
+        assert rate.RequestedShipment.ShipTimestamp >= timestamp
+        # Shared objects stay shared.
+        self.assertIs(rate.WebAuthenticationDetail.UserCredential, rate.WebAuthenticationDetail.ParentCredential)
+
+        rate.reset(customer_transaction_id='second')
+        self.assertEqual(rate.TransactionDetail.CustomerTransactionId, 'second')
+
+        clone = rate.clone()
+        assert clone.client is not rate.client
+        assert clone.RequestedShipment is not rate.RequestedShipment
+        self.assertEqual(clone.TransactionDetail.CustomerTransactionId, 'first')
+        self.assertEqual(str(clone.RequestedShipment.Shipper), str(rate.RequestedShipment.Shipper))
+
+    def test_pool(self):
+        config = get_canned_config(track_reply)
+        pool = FedexRequestPool(FedexTrackRequest, config, max_idle=2)
+        errors = []
+
+        def track(number):
+            try:
+                for _ in range(5):
+                    with pool.request() as request:
+                        self.assertEqual(request.SelectionDetails.PackageIdentifier.Value, None)
+                        request.SelectionDetails.PackageIdentifier.Value = number
+                        request.send_request()
+                        self.assertEqual(request.response.CompletedTrackDetails[0].TrackDetails[0].TrackingNumber,
+                                         number)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=track, args=(str(number),)) for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        stats = pool.stats()
+        self.assertEqual(stats['created'] + stats['reused'], 20)
+        assert stats['idle'] <= 2
+        self.assertEqual(len(config.sent), 20)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,206 @@
+"""
+Test module for the batch helpers and bulk requests.
+"""
+
+import datetime
+import unittest
+import logging
+import re
+import sys
+import time
+
+sys.path.insert(0, '..')
+from fedex.base_service import FedexError
+from fedex.batch import BatchResult, chunked, run_batch
+from fedex.decoding import ResponseRecord
+from fedex.services.address_validation_service import FedexBulkAddressValidationRequest
+from fedex.services.rate_service import FedexBulkRateRequest
+from fedex.services.track_service import FedexBulkTrackRequest, FedexInvalidTrackingNumber
+
+from tests.common import get_canned_config
+from tests.test_address_validation_service import avs_reply
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+RATE_REPLY = """<?xml version="1.0" encoding="UTF-8"?>
+<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/">
+<SOAP-ENV:Body><RateReply xmlns="http://fedex.com/ws/rate/v28">
+<HighestSeverity>{severity}</HighestSeverity>
+<Notifications><Severity>{severity}</Severity><Source>crs</Source><Code>0</Code><Message>Done</Message></Notifications>
+<Version><ServiceId>crs</ServiceId><Major>28</Major><Intermediate>0</Intermediate><Minor>0</Minor></Version>
+<RateReplyDetails><ServiceType>FEDEX_GROUND</ServiceType><TransitTime>THREE_DAYS</TransitTime>
+<RatedShipmentDetails><ShipmentRateDetail><RateType>PAYOR_ACCOUNT_PACKAGE</RateType>
+<TotalNetCharge><Currency>USD</Currency><Amount>{ground}</Amount></TotalNetCharge>
+</ShipmentRateDetail></RatedShipmentDetails></RateReplyDetails>
+<RateReplyDetails><ServiceType>PRIORITY_OVERNIGHT</ServiceType>
+<DeliveryTimestamp>2026-10-20T10:30:00</DeliveryTimestamp>
+<RatedShipmentDetails><ShipmentRateDetail><RateType>PAYOR_ACCOUNT_PACKAGE</RateType>
+<TotalNetCharge><Currency>USD</Currency><Amount>{overnight}</Amount></TotalNetCharge>
+</ShipmentRateDetail></RatedShipmentDetails></RateReplyDetails>
+</RateReply></SOAP-ENV:Body></SOAP-ENV:Envelope>"""
+
+
+def rate_reply(request):
+    # Price by shipper postal code, fail for 99999.
+    postal_code = re.search(br'<(?:\w+:)?PostalCode>(\w+)<', request.message).group(1)
+    severity = 'ERROR' if postal_code == b'99999' else 'SUCCESS'
+    ground = 10.0 if postal_code == b'29631' else 12.0
+    return RATE_REPLY.format(severity=severity, ground=ground, overnight=ground * 5).encode('utf-8')
+
+
+TRACK_REPLY = """<?xml version="1.0" encoding="UTF-8"?>
+<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/">
+<SOAP-ENV:Body><TrackReply xmlns="http://fedex.com/ws/track/v16">
+<HighestSeverity>{severity}</HighestSeverity>
+<Notifications><Severity>{severity}</Severity><Source>trck</Source><Code>0</Code><Message>Done</Message></Notifications>
+<Version><ServiceId>trck</ServiceId><Major>16</Major><Intermediate>0</Intermediate><Minor>0</Minor></Version>
+{details}
+</TrackReply></SOAP-ENV:Body></SOAP-ENV:Envelope>"""
+
+TRACK_DETAIL = """<CompletedTrackDetails><HighestSeverity>{severity}</HighestSeverity>
+<Notifications><Severity>{severity}</Severity><Source>trck</Source><Code>{code}</Code><Message>{message}</Message></Notifications>
+<DuplicateWaybill>false</DuplicateWaybill><MoreData>false</MoreData>
+<TrackDetails><Notification><Severity>{severity}</Severity><Source>trck</Source><Code>{code}</Code>
+<Message>{message}</Message></Notification><TrackingNumber>{number}</TrackingNumber></TrackDetails>
+</CompletedTrackDetails>"""
+
+
+def track_reply(request):
+    # Answer in reverse order, rejecting numbers starting with 9.
+    numbers = [value.decode('utf-8') for value in
+               re.findall(br'<(?:\w+:)?PackageIdentifier>.*?<(?:\w+:)?Value>(\w+)<', request.message)]
+    details = []
+    for number in reversed(numbers):
+        if number.startswith('9'):
+            details.append(TRACK_DETAIL.format(severity='ERROR', code=9040, number=number,
+                                               message='Invalid tracking number'))
+        else:
+            details.append(TRACK_DETAIL.format(severity='SUCCESS', code=0, number=number, message='Request was successfully processed.'))
+    severity = 'ERROR' if any(number.startswith('9') for number in numbers) else 'SUCCESS'
+    return TRACK_REPLY.format(severity=severity, details=''.join(details)).encode('utf-8')
+
+
+class BatchTests(unittest.TestCase):
+    """
+    These tests verify that batches run concurrently and keep their order.
+    """
+
+    def test_run_batch(self):
+        def work(item):
+            time.sleep(0.01 * (5 - item))
+            if item == 3:
+                raise ValueError(item)
+            return item * 2
+
+        results = list(run_batch(work, iter(range(5)), max_workers=3))
+        self.assertEqual([result.index for result in results], [0, 1, 2, 3, 4])
+        self.assertEqual([result.value for result in results], [0, 2, 4, None, 8])
+        assert isinstance(results[3].error, ValueError)
+
+        results = list(run_batch(work, range(5), max_workers=5, ordered=False))
+        self.assertEqual(sorted(result.index for result in results), [0, 1, 2, 3, 4])
+        self.assertEqual(results[0].index, 4)
+
+    def test_chunked(self):
+        self.assertEqual(list(chunked(iter(range(5)), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_bulk_rate(self):
+        bulk = FedexBulkRateRequest(get_canned_config(rate_reply), max_workers=2)
+        for postal_code in ('27577', '29631', '99999'):
+            def shipment(rate, postal_code=postal_code):
+                # A Monday, ground delivers on Thursday.
+                rate.RequestedShipment.ShipTimestamp = datetime.datetime(2026, 10, 19, 9, 0)
+                rate.RequestedShipment.Shipper.Address.PostalCode = postal_code
+                rate.RequestedShipment.Recipient.Address.PostalCode = '27577'
+            bulk.add_shipment(shipment)
+        results = bulk.send_request()
+
+        self.assertEqual([result.ok for result in results], [True, True, False])
+        assert isinstance(results[2].error, FedexError)
+        assert results[0].value.ReturnTransitAndCommit
+
+        cheapest = bulk.cheapest_by_service()
+        self.assertEqual(cheapest['FEDEX_GROUND'].index, 1)
+        self.assertEqual(cheapest['FEDEX_GROUND'].amount, 10.0)
+        self.assertEqual(cheapest['PRIORITY_OVERNIGHT'].amount, 50.0)
+
+        # Overnight has a delivery timestamp but no transit time.
+        fastest = bulk.fastest_by_transit_time()
+        self.assertEqual([(quote.service_type, quote.amount) for quote in fastest],
+                         [('PRIORITY_OVERNIGHT', 50.0), ('PRIORITY_OVERNIGHT', 60.0),
+                          ('FEDEX_GROUND', 10.0), ('FEDEX_GROUND', 12.0)])
+        self.assertEqual(fastest[0].delivery_date, datetime.date(2026, 10, 20))
+        self.assertEqual(fastest[-1].transit_days, 3)
+        self.assertEqual(fastest[-1].delivery_date, datetime.date(2026, 10, 22))
+
+    def test_fastest(self):
+        # Delivery timestamps of the same day, with and without a time zone.
+        def detail(service_type, amount, **kwargs):
+            return ResponseRecord(ServiceType=service_type, RatedShipmentDetails=[ResponseRecord(
+                ShipmentRateDetail=ResponseRecord(TotalNetCharge=ResponseRecord(Amount=amount, Currency='USD')))],
+                **kwargs)
+
+        eastern = datetime.timezone(datetime.timedelta(hours=-5))
+        details = [detail('FEDEX_GROUND', 10, TransitTime='ONE_DAY'),
+                   detail('STANDARD_OVERNIGHT', 30, DeliveryTimestamp=datetime.datetime(2026, 10, 23, 15, 0)),
+                   detail('PRIORITY_OVERNIGHT', 50,
+                          DeliveryTimestamp=datetime.datetime(2026, 10, 23, 10, 30, tzinfo=eastern)),
+                   detail('FEDEX_2_DAY', 20)]
+        rate = ResponseRecord(response=ResponseRecord(RateReplyDetails=details),
+                              RequestedShipment=ResponseRecord(ShipTimestamp=datetime.datetime(2026, 10, 22, 9, 0)))
+        bulk = FedexBulkRateRequest(get_canned_config(rate_reply))
+        bulk.results = [BatchResult(0, None, value=rate)]
+        self.assertEqual([quote.service_type for quote in bulk.fastest_by_transit_time()],
+                         ['PRIORITY_OVERNIGHT', 'STANDARD_OVERNIGHT', 'FEDEX_GROUND'])
+
+    def test_bulk_track(self):
+        config = get_canned_config(track_reply)
+        bulk = FedexBulkTrackRequest(config, batch_size=2, max_workers=2)
+        numbers = ['111', '222', '933', '444', '555']
+        results = list(bulk.track(iter(numbers)))
+
+        # Three requests of at most two numbers each.
+        self.assertEqual(len(config.sent), 3)
+        self.assertEqual([result.item for result in results], numbers)
+        self.assertEqual([result.index for result in results], [0, 1, 2, 3, 4])
+        self.assertEqual([result.ok for result in results], [True, True, False, True, True])
+        self.assertEqual(results[1].value[0].TrackingNumber, '222')
+        assert isinstance(results[2].error, FedexInvalidTrackingNumber)
+        self.assertEqual(results[3].value[0].TrackingNumber, '444')
+
+    def test_bulk_track_missing(self):
+        # Details for numbers that weren't asked about aren't handed out
+        # by position.
+        def reply(request):
+            return track_reply(request).replace(b'<TrackingNumber>222<', b'<TrackingNumber>999<')
+
+        config = get_canned_config(reply)
+        results = list(FedexBulkTrackRequest(config, batch_size=2).track(['111', '222']))
+        self.assertEqual(results[0].value[0].TrackingNumber, '111')
+        assert isinstance(results[1].error, FedexError)
+        self.assertEqual(results[1].value, None)
+
+    def test_bulk_address_validation(self):
+        config = get_canned_config(avs_reply)
+        bulk = FedexBulkAddressValidationRequest(config, max_workers=3)
+        addresses = ({'ClientReferenceId': str(index), 'Address': {'StreetLines': ['{} Main St'.format(index)],
+                                                                  'CountryCode': 'US'}}
+                     for index in range(250))
+        results = list(bulk.validate(addresses))
+
+        # Three requests of at most a hundred addresses each.
+        self.assertEqual(len(config.sent), 3)
+        self.assertEqual([result.index for result in results], list(range(250)))
+        assert all(result.ok for result in results)
+        self.assertEqual(results[123].value.ClientReferenceId, '123')
+        self.assertEqual(results[123].value.EffectiveAddress.StreetLines[0], '123 MAIN ST')
+
+        results = list(bulk.validate(({'Address': {'StreetLines': [str(index)]}} for index in range(5)),
+                                     ordered=False))
+        self.assertEqual(sorted(result.index for result in results), list(range(5)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,131 @@
+"""
+Test module for the response caches.
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import logging
+import sys
+
+sys.path.insert(0, '..')
+from fedex.cache import MemoryCacheBackend, ResponseCache, SQLiteCacheBackend
+from fedex.decoding import ResponseRecord
+from fedex.services.rate_service import FedexRateServiceRequest, rate_cache_key
+
+from tests.common import get_canned_config
+from tests.test_batch import rate_reply
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def rate_request(config, postal_code='29631', weight=4.2):
+    rate = FedexRateServiceRequest(config)
+    rate.RequestedShipment.ShipTimestamp = datetime.datetime(2026, 10, 19, 10, 0)
+    rate.RequestedShipment.DropoffType = 'REGULAR_PICKUP'
+    rate.RequestedShipment.Shipper.Address.PostalCode = postal_code
+    rate.RequestedShipment.Shipper.Address.CountryCode = 'US'
+    rate.RequestedShipment.Recipient.Address.PostalCode = '27577'
+    rate.RequestedShipment.Recipient.Address.CountryCode = 'US'
+    package = rate.create_wsdl_object_of_type('RequestedPackageLineItem')
+    package.Weight = rate.create_wsdl_object_of_type('Weight')
+    package.Weight.Value = weight
+    package.Weight.Units = 'LB'
+    package.GroupPackageCount = 1
+    rate.add_package(package)
+    return rate
+
+
+class ResponseCacheTests(unittest.TestCase):
+    """
+    These tests verify the caches and their backends.
+    """
+
+    def test_memory_backend(self):
+        backend = MemoryCacheBackend(max_size=2)
+        backend.set('a', 1, 10)
+        backend.set('b', 2, 10)
+        backend.get('a')
+        backend.set('c', 3, 10)
+        # b was the least recently used.
+        self.assertEqual(backend.get('b'), None)
+        self.assertEqual(backend.get('a'), (1, 10))
+        self.assertEqual(len(backend), 2)
+
+    def test_sqlite_backend(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'cache.sqlite')
+            backend = SQLiteCacheBackend(path)
+            backend.set('a', ResponseRecord(Amount=12.5), 10)
+            # Another process sees the same entries.
+            value, expires = SQLiteCacheBackend(path).get('a')
+            self.assertEqual(value.Amount, 12.5)
+            self.assertEqual(expires, 10)
+            backend.delete('a')
+            self.assertEqual(backend.get('a'), None)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = ResponseCache(ttl=10, stale_ttl=5, clock=clock)
+        cache.put('a', 'value')
+        self.assertEqual(cache.get('a'), ('value', True))
+        clock.now += 12
+        self.assertEqual(cache.get('a'), ('value', False))
+        clock.now += 5
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.stats(), {'hits': 1, 'stale_hits': 1, 'misses': 1, 'refreshes': 0,
+                                         'refresh_errors': 0, 'entries': 0})
+
+    def test_rate_cache(self):
+        clock = FakeClock()
+        config = get_canned_config(rate_reply)
+        config.rate_cache = ResponseCache(ttl=60, stale_ttl=60, clock=clock)
+
+        first = rate_request(config)
+        first.send_request()
+        self.assertEqual(len(config.sent), 1)
+
+        # The same shipment, written differently, later that day.
+        second = rate_request(config, ' 29631 ')
+        second.RequestedShipment.ShipTimestamp = datetime.datetime(2026, 10, 19, 15, 0)
+        second.send_request()
+        self.assertEqual(len(config.sent), 1)
+        self.assertEqual(second.response.RateReplyDetails[0].RatedShipmentDetails[0]
+                         .ShipmentRateDetail.TotalNetCharge.Amount, 10.0)
+
+        rate_request(config, '29632').send_request()
+        self.assertEqual(len(config.sent), 2)
+
+        # Stale entries are served, and refreshed in the background.
+        clock.now += 90
+        rate_request(config).send_request()
+        for _ in range(100):
+            if config.rate_cache.get(rate_cache_key(first))[1]:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(config.sent), 3)
+        self.assertEqual(config.rate_cache.refreshes, 1)
+
+        # Weight bands.
+        self.assertNotEqual(rate_cache_key(first), rate_cache_key(rate_request(config, weight=4.8)))
+        self.assertEqual(rate_cache_key(first, weight_band=1), rate_cache_key(rate_request(config, weight=4.8), 1))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()
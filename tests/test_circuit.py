@@ -0,0 +1,155 @@
+"""
+Test module for the circuit breakers.
+"""
+
+import asyncio
+import unittest
+import logging
+import sys
+
+sys.path.insert(0, '..')
+from fedex.base_service import FedexError, FedexTimeoutError
+from fedex.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreakerRegistry, FedexCircuitOpenError, is_failure
+from fedex.services.track_service import FedexTrackRequest
+from fedex.throttle import RateLimiter
+
+from tests.common import get_canned_config
+from tests.test_batch import track_reply
+from tests.test_hedging import FakeAsyncTransport
+from tests.test_timeout import slow_reply
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+
+class CircuitTests(unittest.TestCase):
+    """
+    These tests verify when circuits open, fail fast and close again.
+    """
+
+    def setUp(self):
+        self.now = 0.0
+        self.fedex_down = True
+        self.registry = CircuitBreakerRegistry(failure_threshold=3, reset_timeout=30, clock=lambda: self.now)
+        self.config = get_canned_config(self.reply)
+        self.config.circuit_breakers = self.registry
+
+    def reply(self, request):
+        if self.fedex_down:
+            raise ConnectionResetError()
+        return track_reply(request)
+
+    def make_track(self):
+        track = FedexTrackRequest(self.config)
+        track.SelectionDetails.PackageIdentifier.Type = 'TRACKING_NUMBER_OR_DOORTAG'
+        track.SelectionDetails.PackageIdentifier.Value = '111'
+        return track
+
+    def send_track(self, timeout=None):
+        track = self.make_track()
+        track.send_request(timeout=timeout)
+        return track
+
+    def breaker(self):
+        return self.registry.breaker_for('FedexTrackRequest', self.config.sent[0].url)
+
+    def test_open(self):
+        for attempt in range(3):
+            self.assertRaises(ConnectionResetError, self.send_track)
+        self.assertEqual(self.breaker().state, OPEN)
+
+        # Requests fail fast without being sent.
+        self.fedex_down = False
+        try:
+            self.send_track()
+        except FedexCircuitOpenError as e:
+            self.assertEqual(e.retry_after, 30)
+        else:
+            self.fail('Circuit did not open.')
+        self.assertEqual(len(self.config.sent), 3)
+        stats = self.registry.stats()[self.breaker().name]
+        self.assertEqual(stats, {'state': OPEN, 'opened': 1, 'rejected': 1})
+
+    def test_half_open(self):
+        for attempt in range(3):
+            self.assertRaises(ConnectionResetError, self.send_track)
+        self.now = 30
+        self.assertEqual(self.breaker().state, HALF_OPEN)
+
+        # A failed probe opens it again.
+        self.assertRaises(ConnectionResetError, self.send_track)
+        self.assertEqual(self.breaker().state, OPEN)
+        self.assertRaises(FedexCircuitOpenError, self.send_track)
+
+        # A successful one closes it.
+        self.now = 60
+        self.fedex_down = False
+        self.assertEqual(self.send_track().response.HighestSeverity, 'SUCCESS')
+        self.assertEqual(self.breaker().state, CLOSED)
+        self.assertEqual(len(self.config.sent), 5)
+
+    def test_request_errors(self):
+        # Errors in the request show that the endpoint works.
+        self.config = get_canned_config(lambda request: track_reply(request).replace(b'SUCCESS', b'ERROR', 2))
+        self.config.circuit_breakers = self.registry
+        for attempt in range(5):
+            self.assertRaises(FedexError, self.send_track)
+        self.assertEqual(self.breaker().state, CLOSED)
+
+    def test_failures(self):
+        breaker = self.registry.breaker_for('FedexTrackRequest', 'https://example.com')
+        # Every 5xx reply counts.
+        for status in (500, 501, 503):
+            breaker.record(Exception(), status)
+        self.assertEqual(breaker.state, OPEN)
+
+        # Errors in the request don't, and a success closes the circuit.
+        breaker = self.registry.breaker_for('FedexTrackRequest', 'https://example.org')
+        for status in (400, 404, 500, 500, 400):
+            breaker.record(Exception(), status)
+        breaker.record()
+        breaker.record(Exception(), 500)
+        self.assertEqual(breaker.state, CLOSED)
+
+        # Timeouts count, those of asyncio too.
+        self.assertTrue(is_failure(FedexTimeoutError(1)))
+        self.assertTrue(is_failure(asyncio.TimeoutError()))
+        self.assertFalse(is_failure(FedexError(-1, 'error')))
+
+    def test_timeouts(self):
+        for attempt in range(3):
+            self.config = get_canned_config(slow_reply(0.05))
+            self.config.circuit_breakers = self.registry
+            self.assertRaises(FedexTimeoutError, self.send_track, 0.01)
+        self.assertEqual(self.breaker().state, OPEN)
+
+        # Attempts that the rate limiter ran out of time for weren't sent.
+        self.now = 30
+        self.config.rate_limiter = RateLimiter(rate=0.1, burst=1)
+        self.config.rate_limiter.acquire(self.config.account_number, 'FedexTrackRequest')
+        self.assertRaises(FedexTimeoutError, self.send_track, 0.01)
+        self.assertEqual(self.breaker().state, HALF_OPEN)
+        self.breaker().before_call()
+
+    def test_cancelled_probe(self):
+        for attempt in range(3):
+            self.assertRaises(ConnectionResetError, self.send_track)
+        self.now = 30
+        track = self.make_track()
+
+        async def cancel_probe():
+            sending = asyncio.ensure_future(track.send_request_async(transport=FakeAsyncTransport(10)))
+            await asyncio.sleep(0.05)
+            sending.cancel()
+            await asyncio.gather(sending, return_exceptions=True)
+
+        asyncio.run(cancel_probe())
+        # The probe's slot was freed, so another probe may go.
+        self.fedex_down = False
+        self.assertEqual(self.send_track().response.HighestSeverity, 'SUCCESS')
+        self.assertEqual(self.breaker().state, CLOSED)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()
@@ -2,21 +2,92 @@
 Test module for the Fedex CountryService WSDL.
 """
 
+import os
+import re
+import shutil
+import tempfile
 import unittest
 import logging
 import sys
 
 sys.path.insert(0, '..')
-from fedex.services.country_service import FedexValidatePostalRequest
+from fedex.cache import ResponseCache, SQLiteCacheBackend
+from fedex.services.country_service import FedexValidatePostalRequest, preload_postal_codes
 
 # Common global config object for testing.
-from tests.common import get_fedex_config
+from tests.common import get_canned_config, get_fedex_config
 
 CONFIG_OBJ = get_fedex_config()
 
 logging.getLogger('suds').setLevel(logging.ERROR)
 logging.getLogger('fedex').setLevel(logging.INFO)
 
+POSTAL_REPLY = """<?xml version="1.0" encoding="UTF-8"?>
+<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/">
+<SOAP-ENV:Body><ValidatePostalReply xmlns="http://fedex.com/ws/cnty/v8">
+<HighestSeverity>{severity}</HighestSeverity>
+<Notifications><Severity>{severity}</Severity><Source>cnty</Source><Code>0</Code><Message>Done</Message></Notifications>
+<Version><ServiceId>cnty</ServiceId><Major>8</Major><Intermediate>0</Intermediate><Minor>0</Minor></Version>
+<PostalDetail><CountryCode>US</CountryCode><StateOrProvinceCode>SC</StateOrProvinceCode>
+<CleanedPostalCode>{postal_code}</CleanedPostalCode></PostalDetail>
+</ValidatePostalReply></SOAP-ENV:Body></SOAP-ENV:Envelope>"""
+
+
+def postal_reply(request):
+    # Fail for 99999.
+    postal_code = re.search(br'<(?:\w+:)?PostalCode>([\w ]+)<', request.message).group(1).decode('utf-8')
+    severity = 'ERROR' if postal_code == '99999' else 'SUCCESS'
+    return POSTAL_REPLY.format(severity=severity, postal_code=postal_code).encode('utf-8')
+
+
+class PostalCodeCacheTests(unittest.TestCase):
+    """
+    These tests verify that postal code lookups are cached.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def lookup(self, config, postal_code):
+        inquiry = FedexValidatePostalRequest(config)
+        inquiry.Address.PostalCode = postal_code
+        inquiry.Address.CountryCode = 'US'
+        inquiry.send_request()
+        return inquiry
+
+    def test_cache(self):
+        config = get_canned_config(postal_reply)
+        path = os.path.join(self.directory, 'postal.sqlite')
+        config.postal_code_cache = ResponseCache(SQLiteCacheBackend(path), ttl=3600)
+
+        self.lookup(config, '29631')
+        inquiry = self.lookup(config, ' 29631')
+        self.assertEqual(len(config.sent), 1)
+        self.assertEqual(inquiry.response.PostalDetail.StateOrProvinceCode, 'SC')
+
+        # The cache outlives the process.
+        config.postal_code_cache = ResponseCache(SQLiteCacheBackend(path), ttl=3600)
+        self.assertEqual(self.lookup(config, '29631').response.PostalDetail.CleanedPostalCode, '29631')
+        self.assertEqual(len(config.sent), 1)
+        self.assertEqual(config.postal_code_cache.stats()['hits'], 1)
+
+    def test_preload(self):
+        config = get_canned_config(postal_reply)
+        config.postal_code_cache = ResponseCache(ttl=3600)
+        path = os.path.join(self.directory, 'postal_codes.csv')
+        with open(path, 'w') as csv_file:
+            csv_file.write('# postal code, country\n29631,US\n27577,US,\n\n99999,US\n')
+
+        self.assertEqual(preload_postal_codes(config, path), {'loaded': 2, 'cached': 0, 'failed': 1})
+        self.assertEqual(preload_postal_codes(config, [('29631', 'US')]), {'loaded': 0, 'cached': 1, 'failed': 0})
+        self.assertEqual(len(config.sent), 3)
+        self.lookup(config, '27577')
+        self.assertEqual(len(config.sent), 3)
+        self.assertEqual(config.postal_code_cache.stats()['entries'], 2)
+
 
 @unittest.skipIf(not CONFIG_OBJ.account_number, "No credentials provided.")
 class PackageMovementServiceTests(unittest.TestCase):
@@ -0,0 +1,95 @@
+"""
+Test module for the fast reply decoder.
+"""
+
+import pickle
+import unittest
+import logging
+import sys
+
+sys.path.insert(0, '..')
+from fedex.base_service import FedexError
+from fedex.decoding import ResponseRecord
+from fedex.services.rate_service import FedexRateServiceRequest
+from fedex.services.track_service import FedexTrackRequest
+from fedex.tools.conversion import basic_sobject_to_dict
+
+from tests.common import get_canned_config
+from tests.test_batch import rate_reply, track_reply
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+
+class ReplyDecoderTests(unittest.TestCase):
+    """
+    These tests verify that fast decoding gives the same results as suds.
+    """
+
+    def send_track(self, config, *numbers):
+        track = FedexTrackRequest(config)
+        track.SelectionDetails = []
+        for number in numbers:
+            selection_details = track.create_wsdl_object_of_type('TrackSelectionDetail')
+            selection_details.PackageIdentifier = track.create_wsdl_object_of_type('TrackPackageIdentifier')
+            selection_details.PackageIdentifier.Type = 'TRACKING_NUMBER_OR_DOORTAG'
+            selection_details.PackageIdentifier.Value = number
+            track.SelectionDetails.append(selection_details)
+        track.send_request()
+        return track
+
+    def test_same_as_suds(self):
+        suds_config = get_canned_config(track_reply)
+        fast_config = get_canned_config(track_reply)
+        fast_config.fast_decoding = True
+
+        suds_track = self.send_track(suds_config, '111', '222')
+        fast_track = self.send_track(fast_config, '111', '222')
+        assert isinstance(fast_track.response, ResponseRecord)
+        self.assertEqual(fast_track.response, basic_sobject_to_dict(suds_track.response))
+        self.assertEqual(basic_sobject_to_dict(fast_track.response), basic_sobject_to_dict(suds_track.response))
+
+        # Attribute access and types are as with suds objects.
+        detail = fast_track.response.CompletedTrackDetails[1]
+        self.assertEqual(detail.TrackDetails[0].TrackingNumber, '111')
+        self.assertEqual(fast_track.response.Version.Major, 16)
+        self.assertEqual(detail.DuplicateWaybill, False)
+        assert not hasattr(fast_track.response, 'Missing')
+
+        # Records are picklable, unlike suds objects.
+        self.assertEqual(pickle.loads(pickle.dumps(fast_track.response)), fast_track.response)
+
+        # The response checks work the same.
+        self.assertRaises(FedexError, self.send_track, fast_config, '999')
+
+    def test_whitespace(self):
+        def reply(request):
+            return track_reply(request).replace(b'<Message>Request was successfully processed.<',
+                                                b'<Message>  Done  <', 1)
+
+        suds_config = get_canned_config(reply)
+        fast_config = get_canned_config(reply)
+        fast_config.fast_decoding = True
+        suds_track = self.send_track(suds_config, '111')
+        fast_track = self.send_track(fast_config, '111')
+        self.assertEqual(fast_track.response.CompletedTrackDetails[0].Notifications[0].Message, '  Done  ')
+        self.assertEqual(fast_track.response, basic_sobject_to_dict(suds_track.response))
+
+    def test_per_service(self):
+        config = get_canned_config(rate_reply)
+        config.fast_decoding = ['track']
+        assert not FedexRateServiceRequest(config).fast_decoding
+        assert FedexTrackRequest(config).fast_decoding
+
+        config.fast_decoding = [FedexRateServiceRequest]
+        rate = FedexRateServiceRequest(config)
+        rate.RequestedShipment.Shipper.Address.PostalCode = '99999'
+        self.assertRaises(FedexError, rate.send_request)
+        assert isinstance(rate.response, ResponseRecord)
+        self.assertEqual(rate.response.RateReplyDetails[0].RatedShipmentDetails[0]
+                         .ShipmentRateDetail.TotalNetCharge.Amount, 12.0)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()
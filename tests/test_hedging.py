@@ -0,0 +1,242 @@
+"""
+Test module for hedged requests.
+"""
+
+import asyncio
+import time
+import unittest
+import logging
+import os
+import sys
+import threading
+
+from suds.transport import Reply, Request
+
+sys.path.insert(0, '..')
+from fedex.circuit import CLOSED, HALF_OPEN, CircuitBreakerRegistry
+from fedex.hedging import HedgingPolicy
+from fedex.throttle import RateLimiter
+
+from tests.common import CannedTransport, get_canned_config
+from tests.test_batch import rate_reply
+from tests.test_cache import rate_request
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+
+def slow_reply(*delays):
+    """
+    Returns a canned reply function that waits the given seconds before
+    answering each rate request in turn.
+    """
+
+    delays = list(delays)
+
+    def reply(request):
+        if delays:
+            time.sleep(delays.pop(0))
+        return rate_reply(request)
+    return reply
+
+
+class AbortableTransport(CannedTransport):
+    """
+    A canned transport answering rate requests after the given delays, one
+    per request in turn, unless they are aborted.
+    """
+
+    def __init__(self, sent, *delays):
+        CannedTransport.__init__(self, rate_reply, sent)
+        self.delays = list(delays)
+        self.aborted = []
+        self.threads = []
+        self._events = {}
+
+    def send(self, request):
+        self.sent.append(request)
+        self.threads.append(threading.current_thread())
+        delay = self.delays.pop(0) if self.delays else 0
+        if self._events.setdefault(id(request), threading.Event()).wait(delay):
+            raise ConnectionAbortedError()
+        return Reply(200, {}, rate_reply(request))
+
+    def abort(self, request):
+        self.aborted.append(request)
+        self._events.setdefault(id(request), threading.Event()).set()
+
+
+class FakeAsyncTransport(object):
+    """
+    An async transport answering rate requests, or with the given reply
+    function, after the given delays.
+    """
+
+    def __init__(self, *delays, reply=rate_reply):
+        self.delays = list(delays)
+        self.reply = reply
+        self.cancelled = 0
+        self.sent = []
+
+    async def send(self, url, envelope, headers, **kwargs):
+        try:
+            await asyncio.sleep(self.delays.pop(0) if self.delays else 0)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        self.sent.append(envelope)
+        return 200, 'OK', {}, self.reply(Request(url, envelope))
+
+
+class HedgingTests(unittest.TestCase):
+    """
+    These tests verify when copies of slow requests are sent.
+    """
+
+    def setUp(self):
+        self.policy = HedgingPolicy(initial_delay=0.05, min_samples=5)
+
+    def test_hedge(self):
+        config = get_canned_config(rate_reply)
+        transports = []
+
+        def transport_factory(config):
+            transports.append(AbortableTransport(config.sent, 1.0))
+            return transports[-1]
+        config.transport_factory = transport_factory
+        config.hedging_policy = self.policy
+        rate = rate_request(config)
+        rate.send_request()
+        self.assertEqual(rate.response.HighestSeverity, 'SUCCESS')
+        self.assertEqual(rate.metrics.hedges, 1)
+        # The slow request was aborted.
+        self.assertLess(rate.metrics.phases['network'], 0.5)
+        self.assertEqual(self.policy.stats(), {'hedges': 1, 'wins': 1})
+        self.assertEqual(len(config.sent), 2)
+        # Only the copy was sent from the thread pool, with the same envelope.
+        transport = transports[-1]
+        self.assertEqual(transport.threads[0], threading.current_thread())
+        self.assertNotEqual(transport.threads[1], threading.current_thread())
+        self.assertEqual(config.sent[0].message, config.sent[1].message)
+
+        # Quick replies aren't hedged.
+        config.transport_factory = lambda config: AbortableTransport(config.sent)
+        rate = rate_request(config)
+        rate.send_request()
+        self.assertEqual(rate.metrics.hedges, 0)
+
+    def test_losing_copy(self):
+        config = get_canned_config(rate_reply)
+        transports = []
+
+        def transport_factory(config):
+            transports.append(AbortableTransport(config.sent, 0.2, 1.0))
+            return transports[-1]
+        config.transport_factory = transport_factory
+        config.hedging_policy = self.policy
+        rate = rate_request(config)
+        rate.send_request()
+        self.assertEqual(rate.metrics.hedges, 1)
+        self.assertEqual(self.policy.stats(), {'hedges': 1, 'wins': 0})
+        # The copy was aborted, not the request that won.
+        self.assertEqual(transports[-1].aborted, [config.sent[1]])
+
+    def test_limits(self):
+        # Copies wait for the rate limiter and need the circuit breaker's
+        # leave, as the requests themselves do.
+        config = get_canned_config(slow_reply(0.2))
+        config.hedging_policy = self.policy
+        config.rate_limiter = RateLimiter(rate=5, burst=1)
+        rate = rate_request(config)
+        rate.send_request()
+        self.assertEqual(rate.metrics.hedges, 1)
+        for _ in range(100):
+            if config.rate_limiter.stats()['waits']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(config.rate_limiter.stats()['waits'], 1)
+
+        config = get_canned_config(slow_reply(0.2))
+        config.hedging_policy = self.policy
+        config.circuit_breakers = CircuitBreakerRegistry(failure_threshold=1, reset_timeout=0)
+        rate = rate_request(config)
+        breaker = config.circuit_breakers.breaker_for('FedexRateServiceRequest', rate.client.options.location or
+                                                      rate.client.wsdl.services[0].ports[0].location)
+        breaker.record(ConnectionResetError())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        # The request is the only probe let through.
+        rate.send_request()
+        self.assertEqual(len(config.sent), 1)
+        self.assertEqual(rate.metrics.hedges, 0)
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_no_abort(self):
+        # Requests that can't be aborted complete, and failed ones are
+        # answered by their copy.
+        config = get_canned_config(slow_reply(0.2))
+        config.hedging_policy = self.policy
+        rate = rate_request(config)
+        rate.send_request()
+        self.assertEqual(rate.metrics.hedges, 1)
+        self.assertGreaterEqual(rate.metrics.phases['network'], 0.2)
+
+        def reply(request):
+            if len(config.sent) == 1:
+                time.sleep(0.2)
+                raise ConnectionResetError()
+            return rate_reply(request)
+        config = get_canned_config(reply)
+        config.hedging_policy = self.policy
+        rate = rate_request(config)
+        rate.send_request()
+        self.assertEqual(rate.response.HighestSeverity, 'SUCCESS')
+        self.assertEqual(len(config.sent), 2)
+        self.assertEqual(self.policy.stats(), {'hedges': 2, 'wins': 2})
+
+    def test_budget(self):
+        self.policy.budget_initial = 0
+        config = get_canned_config(slow_reply(0.2))
+        config.hedging_policy = self.policy
+        rate = rate_request(config)
+        rate.send_request()
+        self.assertEqual(rate.metrics.hedges, 0)
+        self.assertEqual(len(config.sent), 1)
+
+    def test_async(self):
+        config = get_canned_config(rate_reply)
+        config.hedging_policy = self.policy
+        transport = FakeAsyncTransport(1.0)
+        rate = rate_request(config)
+        response = asyncio.run(rate.send_request_async(transport=transport))
+        self.assertEqual(response.HighestSeverity, 'SUCCESS')
+        self.assertEqual(rate.metrics.hedges, 1)
+        # The slow request was cancelled.
+        self.assertEqual(transport.cancelled, 1)
+
+    @unittest.skipIf(not hasattr(os, 'fork'), "No fork().")
+    def test_fork(self):
+        self.policy.schedule(0, time.sleep, 0).result(timeout=1)
+        pid = os.fork()
+        if pid == 0:
+            # The child starts its own scheduler and thread pool.
+            try:
+                self.policy.schedule(0, time.sleep, 0).result(timeout=1)
+            except BaseException:
+                os._exit(1)
+            os._exit(0)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+
+    def test_delay(self):
+        policy = HedgingPolicy(percentile=90, min_samples=10, min_delay=0.05, max_delay=2.0)
+        self.assertEqual(policy.hedge_delay('getRates'), None)
+        for latency in range(1, 21):
+            policy.record('getRates', latency / 10.0)
+        self.assertEqual(policy.hedge_delay('getRates'), 1.8)
+        # Only operations that are safe to repeat are hedged.
+        self.assertEqual(policy.hedge_delay('processShipment'), None)
+        self.assertRaises(ValueError, HedgingPolicy, operations=['getRates', 'processShipment'])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,136 @@
+"""
+Test module for the request instrumentation.
+"""
+
+import unittest
+import logging
+import sys
+
+sys.path.insert(0, '..')
+from fedex.base_service import FedexError
+from fedex.instrumentation import LoggingObserver, MetricsRegistry, RequestObserver
+from fedex.retry import RetryPolicy
+from fedex.services.rate_service import FedexRateServiceRequest
+from fedex.services.track_service import FedexTrackRequest
+
+from tests.common import get_canned_config
+from tests.test_batch import rate_reply
+from tests.test_retry import flaky_reply
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+
+class InstrumentationTests(unittest.TestCase):
+    """
+    These tests verify that every request reports its phase timings.
+    """
+
+    def send_rate(self, config, postal_code):
+        rate = FedexRateServiceRequest(config)
+        rate.RequestedShipment.Shipper.Address.PostalCode = postal_code
+        rate.send_request()
+        return rate
+
+    def test_request_metrics(self):
+        registry = MetricsRegistry()
+
+        class FailingObserver(RequestObserver):
+            def request_finished(self, metrics):
+                raise RuntimeError("Observers must not fail requests.")
+
+        config = get_canned_config(rate_reply)
+        config.observers = [registry, LoggingObserver(), FailingObserver()]
+
+        rate = self.send_rate(config, '27577')
+        metrics = rate.metrics
+        self.assertEqual(metrics.service, 'FedexRateServiceRequest')
+        self.assertEqual(metrics.operation, 'getRates')
+        self.assertEqual(list(metrics.phases), ['construct', 'marshal', 'prune', 'network', 'parse', 'checks'])
+        self.assertEqual(metrics.request_bytes, len(config.sent[0].message))
+        assert metrics.reply_bytes > 0
+        assert metrics.error is None
+
+        self.assertRaises(FedexError, self.send_rate, config, '99999')
+
+        self.assertEqual(registry.get_counter('fedex_requests_total', operation='getRates'), 2)
+        self.assertEqual(registry.get_counter('fedex_requests_total', outcome='FedexError'), 1)
+        self.assertEqual(registry.get_histogram('fedex_request_phase_seconds', phase='network')[0], 2)
+        self.assertEqual(registry.get_counter('fedex_request_bytes_total', direction='sent'),
+                         sum(len(request.message) for request in config.sent))
+
+        text = registry.render()
+        assert '# TYPE fedex_request_phase_seconds histogram' in text
+        assert ('fedex_request_phase_seconds_count{service="FedexRateServiceRequest",operation="getRates",'
+                'phase="parse"} 2') in text
+
+    def send_track(self, config):
+        track = FedexTrackRequest(config)
+        track.SelectionDetails.PackageIdentifier.Type = 'TRACKING_NUMBER_OR_DOORTAG'
+        track.SelectionDetails.PackageIdentifier.Value = '111'
+        track.send_request()
+        return track
+
+    def test_retries(self):
+        registry = MetricsRegistry()
+        config = get_canned_config(flaky_reply(ConnectionResetError(), ConnectionResetError(), ConnectionResetError(),
+                                               'ERROR'))
+        config.observers = [registry]
+        config.retry_policy = RetryPolicy(max_attempts=3, base_delay=0, jitter=False, sleep=lambda delay: None)
+
+        # Three attempts that all failed, then one with an error reply.
+        self.assertRaises(ConnectionResetError, self.send_track, config)
+        self.assertRaises(FedexError, self.send_track, config)
+        self.send_track(config)
+        self.assertEqual(len(config.sent), 5)
+
+        self.assertEqual(registry.get_counter('fedex_requests_total'), 3)
+        self.assertEqual(registry.get_counter('fedex_requests_total', outcome='ConnectionResetError'), 1)
+        self.assertEqual(registry.get_counter('fedex_requests_total', outcome='FedexError'), 1)
+        self.assertEqual(registry.get_counter('fedex_requests_total', outcome='success'), 1)
+        self.assertEqual(registry.get_counter('fedex_request_attempts_total'), 5)
+        self.assertEqual(registry.get_counter('fedex_request_attempts_total', operation='track'), 5)
+        self.assertEqual(registry.get_histogram('fedex_request_phase_seconds', phase='network')[0], 3)
+        self.assertEqual(registry.get_histogram('fedex_request_phase_seconds', phase='parse')[0], 2)
+        self.assertEqual(registry.get_counter('fedex_request_bytes_total', direction='sent'),
+                         sum(len(request.message) for request in config.sent))
+
+    def test_render(self):
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        config = get_canned_config(rate_reply)
+        config.observers = [registry]
+        self.send_rate(config, '27577')
+        config = get_canned_config(flaky_reply())
+        config.observers = [registry]
+        self.send_track(config)
+
+        lines = registry.render().splitlines()
+        # Each metric is declared once, with all of its samples after it.
+        names = []
+        for line in lines:
+            if line.startswith('# TYPE '):
+                names.append(line.split()[2])
+            elif not line.startswith('#'):
+                name = line.split('{')[0]
+                if name.endswith(('_bucket', '_sum', '_count')) and name.rsplit('_', 1)[0] in names:
+                    name = name.rsplit('_', 1)[0]
+                self.assertEqual(name, names[-1])
+        self.assertEqual(len(names), len(set(names)))
+        self.assertEqual(sorted(names), ['fedex_request_attempts_total', 'fedex_request_bytes_total',
+                                         'fedex_request_phase_seconds', 'fedex_requests_total'])
+        self.assertEqual(lines[0], '# HELP fedex_requests_total Fedex requests made, by outcome.')
+        self.assertEqual(lines[1], '# TYPE fedex_requests_total counter')
+        self.assertEqual(lines[2:4], [
+            'fedex_requests_total{service="FedexRateServiceRequest",operation="getRates",outcome="success"} 1',
+            'fedex_requests_total{service="FedexTrackRequest",operation="track",outcome="success"} 1'])
+        labels = 'service="FedexTrackRequest",operation="track",phase="network"'
+        index = lines.index('fedex_request_phase_seconds_bucket{' + labels + ',le="0.1"} 1')
+        self.assertEqual(lines[index + 1], 'fedex_request_phase_seconds_bucket{' + labels + ',le="1.0"} 1')
+        self.assertEqual(lines[index + 2], 'fedex_request_phase_seconds_bucket{' + labels + ',le="+Inf"} 1')
+        assert lines[index + 3].startswith('fedex_request_phase_seconds_sum{' + labels + '} ')
+        self.assertEqual(lines[index + 4], 'fedex_request_phase_seconds_count{' + labels + '} 1')
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()
@@ -2,20 +2,144 @@
 Test module for the Fedex LocationService WSDL.
 """
 
+import re
+import time
 import unittest
 import logging
 import sys
 
 sys.path.insert(0, '..')
-from fedex.services.location_service import FedexSearchLocationRequest
+from fedex.services.location_service import (FedexSearchLocationRequest, LocationCache, distance,
+                                             parse_coordinates)
 
 # Common global config object for testing.
-from tests.common import get_fedex_config
+from tests.common import get_canned_config, get_fedex_config
 
 CONFIG_OBJ = get_fedex_config()
 
 logging.getLogger('suds').setLevel(logging.ERROR)
 
+LOCATIONS_REPLY = """<?xml version="1.0" encoding="UTF-8"?>
+<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/">
+<SOAP-ENV:Body><SearchLocationsReply xmlns="http://fedex.com/ws/locs/v9">
+<HighestSeverity>SUCCESS</HighestSeverity>
+<Notifications><Severity>SUCCESS</Severity><Source>locs</Source><Code>0</Code><Message>Done</Message></Notifications>
+<Version><ServiceId>locs</ServiceId><Major>9</Major><Intermediate>0</Intermediate><Minor>0</Minor></Version>
+<TotalResultsAvailable>{total}</TotalResultsAvailable><ResultsReturned>{total}</ResultsReturned>
+<AddressToLocationRelationships>
+<MatchedAddressGeographicCoordinates>{center}</MatchedAddressGeographicCoordinates>
+{details}
+</AddressToLocationRelationships>
+</SearchLocationsReply></SOAP-ENV:Body></SOAP-ENV:Envelope>"""
+
+LOCATION_DETAIL = """<DistanceAndLocationDetails><Distance><Value>{distance:.2f}</Value><Units>KM</Units></Distance>
+<LocationDetail><LocationId>{location_id}</LocationId><GeographicCoordinates>{coordinates}</GeographicCoordinates>
+</LocationDetail></DistanceAndLocationDetails>"""
+
+LOCATIONS = [('L1', 35.01, -90.0), ('L2', 35.05, -90.0), ('L3', 35.2, -90.0)]
+
+
+def locations_reply(request):
+    # Addresses are at 35,-90. Returns the locations within the radius.
+    coordinates = re.search(br'<(?:\w+:)?GeographicCoordinates>([^<]+)<', request.message)
+    latitude, longitude = parse_coordinates(coordinates.group(1).decode('ascii')) if coordinates else (35.0, -90.0)
+    radius = float(re.search(br'<(?:\w+:)?Value>([\d.]+)<', request.message).group(1))
+    details = []
+    for location_id, location_latitude, location_longitude in LOCATIONS:
+        location_distance = distance(latitude, longitude, location_latitude, location_longitude)
+        if location_distance <= radius:
+            details.append(LOCATION_DETAIL.format(distance=location_distance, location_id=location_id,
+                                                  coordinates='{:+}{:+}/'.format(location_latitude,
+                                                                                 location_longitude)))
+    return LOCATIONS_REPLY.format(total=len(details), center='{:+}{:+}/'.format(latitude, longitude),
+                                  details=''.join(details)).encode('utf-8')
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class LocationCacheTests(unittest.TestCase):
+    """
+    These tests verify that nearby location searches are answered locally.
+    """
+
+    def search(self, config, coordinates=None, radius=10, location_types=None):
+        location_request = FedexSearchLocationRequest(config)
+        if coordinates:
+            location_request.LocationsSearchCriterion = 'GEOGRAPHIC_COORDINATES'
+            location_request.GeographicCoordinates = coordinates
+        else:
+            location_request.Address.PostalCode = '38119'
+        location_request.Address.CountryCode = 'US'
+        location_request.Constraints.RadiusDistance = location_request.create_wsdl_object_of_type('Distance')
+        location_request.Constraints.RadiusDistance.Value = radius
+        location_request.Constraints.RadiusDistance.Units = 'KM'
+        location_request.Constraints.LocationTypesToInclude = location_types
+        location_request.send_request()
+        return [detail.LocationDetail.LocationId for detail in
+                location_request.response.AddressToLocationRelationships[0].DistanceAndLocationDetails]
+
+    def test_cache(self):
+        clock = FakeClock()
+        config = get_canned_config(locations_reply)
+        config.location_cache = LocationCache(ttl=60, stale_ttl=60, clock=clock)
+
+        self.assertEqual(self.search(config, '+35.0-90.0/'), ['L1', 'L2'])
+        # Inside the searched area.
+        self.assertEqual(self.search(config, '+35.01-90.0/', radius=5), ['L1', 'L2'])
+        self.assertEqual(self.search(config, '+35.0-90.0/', radius=3), ['L1'])
+        self.assertEqual(len(config.sent), 1)
+
+        # Outside of it, or with other constraints.
+        self.assertEqual(self.search(config, '+35.01-90.0/', radius=25), ['L1', 'L2', 'L3'])
+        self.search(config, '+35.0-90.0/', location_types=['FEDEX_OFFICE'])
+        self.assertEqual(len(config.sent), 3)
+        self.assertEqual(self.search(config, '+35.15-90.0/', radius=8), ['L3'])
+        self.assertEqual(len(config.sent), 3)
+
+        # Searches by address once the address is known.
+        self.search(config)
+        self.assertEqual(self.search(config, radius=6), ['L1', 'L2'])
+        self.assertEqual(len(config.sent), 4)
+
+        # Stale areas are searched again in the background.
+        areas = config.location_cache.stats()['areas']
+        clock.now += 90
+        self.assertEqual(self.search(config, '+35.0-90.0/', radius=3), ['L1'])
+        for _ in range(100):
+            if config.location_cache.stats()['areas'] > areas:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(config.sent), 5)
+
+        # But not past the staleness bound.
+        clock.now += 200
+        self.search(config, '+35.0-90.0/', radius=3)
+        self.assertEqual(len(config.sent), 6)
+        stats = config.location_cache.stats()
+        self.assertEqual(stats['stale_hits'], 1)
+        # The locations of the expired areas were dropped with them.
+        self.assertEqual(stats['locations'], 1)
+
+    def test_eviction(self):
+        config = get_canned_config(locations_reply)
+        config.location_cache = LocationCache(max_searches=2)
+        self.search(config, '+35.0-90.0/')
+        self.search(config, '+35.0-90.0/', location_types=['FEDEX_OFFICE'])
+        self.assertEqual(config.location_cache.stats()['locations'], 4)
+
+        # Forgetting an area forgets the locations only it covered.
+        self.search(config, '+35.2-90.0/', radius=3)
+        stats = config.location_cache.stats()
+        self.assertEqual((stats['areas'], stats['locations']), (2, 3))
+        self.assertEqual(self.search(config, '+35.0-90.0/', location_types=['FEDEX_OFFICE']), ['L1', 'L2'])
+        self.assertEqual(len(config.sent), 3)
+
 
 @unittest.skipIf(not CONFIG_OBJ.account_number, "No credentials provided.")
 class SearchLocationServiceTests(unittest.TestCase):
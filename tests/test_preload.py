@@ -0,0 +1,45 @@
+"""
+Test module for preloading service schemas.
+"""
+
+import unittest
+import logging
+import sys
+
+sys.path.insert(0, '..')
+import fedex
+from fedex.base_service import CLIENT_CACHE
+from fedex.services.track_service import FedexTrackRequest
+
+# Common global config object for testing.
+from tests.common import get_fedex_config
+
+CONFIG_OBJ = get_fedex_config()
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+
+class FedexPreloadTests(unittest.TestCase):
+    """
+    These tests verify that services can be warmed up ahead of time.
+    """
+
+    def test_warmup(self):
+        timings = fedex.warmup(CONFIG_OBJ, services=['rate', FedexTrackRequest])
+        self.assertEqual(list(timings), ['rate', 'FedexTrackRequest'])
+        assert all(seconds >= 0 for seconds in timings.values())
+
+        # Requests built afterwards reuse the warmed-up clients.
+        hits = CLIENT_CACHE.hits
+        FedexTrackRequest(CONFIG_OBJ)
+        self.assertEqual(CLIENT_CACHE.hits, hits + 1)
+
+    def test_unknown_service(self):
+        with self.assertRaises(ValueError):
+            fedex.warmup(CONFIG_OBJ, services=['teleport'])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()
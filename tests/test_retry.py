@@ -0,0 +1,112 @@
+"""
+Test module for the retry policy.
+"""
+
+import socket
+import unittest
+import logging
+import sys
+from io import BytesIO
+
+from suds.transport import TransportError
+
+sys.path.insert(0, '..')
+from fedex.base_service import FedexError, FedexFailure
+from fedex.instrumentation import MetricsRegistry
+from fedex.retry import RetryPolicy
+from fedex.services.ship_service import FedexProcessShipmentRequest
+from fedex.services.track_service import FedexTrackRequest
+
+from tests.common import get_canned_config
+from tests.test_batch import track_reply
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+
+def flaky_reply(*errors):
+    """
+    Returns a canned reply function that fails with the given errors first,
+    then answers track requests. Strings are the severity of a reply.
+    """
+
+    errors = list(errors)
+
+    def reply(request):
+        if errors:
+            error = errors.pop(0)
+            if isinstance(error, Exception):
+                raise error
+            return track_reply(request).replace(b'SUCCESS', error.encode('ascii'), 2)
+        return track_reply(request)
+    return reply
+
+
+class RetryTests(unittest.TestCase):
+    """
+    These tests verify which failures are retried and how.
+    """
+
+    def setUp(self):
+        self.delays = []
+        self.policy = RetryPolicy(sleep=self.delays.append, random=lambda: 0.5)
+
+    def send_track(self, reply, policy=None):
+        config = get_canned_config(reply)
+        config.retry_policy = policy or self.policy
+        config.registry = MetricsRegistry()
+        config.observers = [config.registry]
+        track = FedexTrackRequest(config)
+        track.SelectionDetails.PackageIdentifier.Type = 'TRACKING_NUMBER_OR_DOORTAG'
+        track.SelectionDetails.PackageIdentifier.Value = '111'
+        try:
+            track.send_request()
+        finally:
+            self.config = config
+        return track
+
+    def test_transient(self):
+        track = self.send_track(flaky_reply(ConnectionResetError(), 'FAILURE'))
+        self.assertEqual(track.response.HighestSeverity, 'SUCCESS')
+        self.assertEqual(track.metrics.attempts, 3)
+        self.assertEqual(self.delays, [0.05, 0.1])
+        assert 'backoff' in track.metrics.phases
+        # The same envelope was sent every time.
+        self.assertEqual(len(set(request.message for request in self.config.sent)), 1)
+        self.assertEqual(self.config.registry.get_counter('fedex_request_attempts_total'), 3)
+        self.assertEqual(self.config.registry.get_counter('fedex_requests_total'), 1)
+
+        track = self.send_track(flaky_reply(TransportError('Service Unavailable', 503, BytesIO(b''))))
+        self.assertEqual(track.metrics.attempts, 2)
+
+    def test_give_up(self):
+        self.assertRaises(FedexFailure, self.send_track, flaky_reply('FAILURE', 'FAILURE', 'FAILURE'))
+        self.assertEqual(len(self.config.sent), 3)
+
+        # Problems with the request are never retried.
+        self.assertRaises(FedexError, self.send_track, flaky_reply('ERROR'))
+        self.assertEqual(len(self.config.sent), 1)
+
+        # Nor are failures with a budget that ran out.
+        policy = RetryPolicy(sleep=self.delays.append, budget_initial=1, budget_ratio=0)
+        self.assertRaises(FedexFailure, self.send_track, flaky_reply('FAILURE', 'FAILURE'), policy)
+        self.assertEqual(len(self.config.sent), 2)
+        self.assertEqual(policy.stats(), {'retries': 1, 'exhausted': 1})
+
+    def test_unsafe_operations(self):
+        def send_shipment(error):
+            config = get_canned_config(flaky_reply(error, error, error))
+            config.retry_policy = self.policy
+            shipment = FedexProcessShipmentRequest(config)
+            self.assertRaises(type(error), shipment.send_request)
+            return len(config.sent)
+
+        # A shipment may have been created if the reply timed out.
+        self.assertEqual(send_shipment(socket.timeout()), 1)
+        # But not if the connection was refused.
+        self.assertEqual(send_shipment(ConnectionRefusedError()), 3)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()
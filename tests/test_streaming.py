@@ -0,0 +1,82 @@
+"""
+Test module for streaming label extraction.
+"""
+
+import base64
+import unittest
+import logging
+import os
+import sys
+from io import BytesIO
+
+sys.path.insert(0, '..')
+from fedex.services.ship_service import FedexProcessShipmentRequest
+from fedex.streaming import LabelStreamParser
+from fedex.stub_server import FedexStubServer
+
+from tests.common import get_fedex_config
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+LABEL = os.urandom(1000)
+DOCUMENT = os.urandom(500)
+
+REPLY = """<?xml version="1.0" encoding="UTF-8"?>
+<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/">
+<SOAP-ENV:Body><ProcessShipmentReply xmlns="http://fedex.com/ws/ship/v26">
+<HighestSeverity>SUCCESS</HighestSeverity><CompletedShipmentDetail>
+<CompletedPackageDetails><SequenceNumber>1</SequenceNumber></CompletedPackageDetails>
+<CompletedPackageDetails><SequenceNumber>2</SequenceNumber><Label><Type>OUTBOUND_LABEL</Type>
+<ImageType>ZPLII</ImageType><Parts><DocumentPartSequenceNumber>1</DocumentPartSequenceNumber>
+<Image>{label}</Image></Parts></Label></CompletedPackageDetails>
+<ShipmentDocuments><Type>COMMERCIAL_INVOICE</Type><ImageType>PDF</ImageType>
+<Parts><DocumentPartSequenceNumber>1</DocumentPartSequenceNumber><Image>{document}</Image></Parts>
+</ShipmentDocuments></CompletedShipmentDetail></ProcessShipmentReply></SOAP-ENV:Body></SOAP-ENV:Envelope>"""
+
+
+class LabelStreamingTests(unittest.TestCase):
+    """
+    These tests verify that label images are decoded straight into sinks.
+    """
+
+    def test_parser(self):
+        # Wrapped base64, as Fedex sends it, fed a few bytes at a time.
+        reply = REPLY.format(label=base64.encodebytes(LABEL).decode('ascii'),
+                             document=base64.b64encode(DOCUMENT).decode('ascii')).encode('utf-8')
+        parser = LabelStreamParser(lambda part: BytesIO(), chunk_size=7)
+        for start in range(0, len(reply), 7):
+            parser.feed(reply[start:start + 7])
+        skeleton = parser.close()
+
+        label, document = parser.parts
+        self.assertEqual(label.sink.getvalue(), LABEL)
+        self.assertEqual((label.document, label.package_index, label.document_type, label.image_type,
+                          label.sequence_number, label.size), ('Label', 1, 'OUTBOUND_LABEL', 'ZPLII', '1', 1000))
+        self.assertEqual(document.sink.getvalue(), DOCUMENT)
+        self.assertEqual((document.document, document.package_index, document.document_type),
+                         ('ShipmentDocuments', None, 'COMMERCIAL_INVOICE'))
+        assert b'<Image></Image>' in skeleton
+        assert b'<ImageType>PDF</ImageType>' in skeleton
+
+    def test_send_request_streaming(self):
+        server = FedexStubServer(label_bytes=200000).start()
+        self.addCleanup(server.stop)
+        config = get_fedex_config()
+        config.endpoint_url = server.url
+        config.keep_alive = True
+
+        shipment = FedexProcessShipmentRequest(config)
+        parts = shipment.send_request_streaming(lambda part: BytesIO(), chunk_size=4096)
+
+        self.assertEqual(len(parts), 1)
+        self.assertEqual(parts[0].sink.getvalue(), base64.b64decode(server._label))
+        package = shipment.response.CompletedShipmentDetail.CompletedPackageDetails[0]
+        assert package.TrackingIds[0].TrackingNumber
+        assert not getattr(package.Label.Parts[0], 'Image', None)
+        assert shipment.metrics.reply_bytes > 200000
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Test module for the local stand-in Fedex server.
+"""
+
+import unittest
+import logging
+import sys
+import time
+
+sys.path.insert(0, '..')
+from fedex.base_service import FedexError, FedexFailure, SchemaValidationError
+from fedex.services.location_service import FedexSearchLocationRequest
+from fedex.services.rate_service import FedexRateServiceRequest
+from fedex.services.ship_service import FedexProcessShipmentRequest
+from fedex.services.track_service import FedexTrackRequest
+from fedex.stub_server import FedexStubServer
+
+from tests.common import get_fedex_config
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+
+class FedexStubServerTests(unittest.TestCase):
+    """
+    These tests send requests to a local stub server.
+    """
+
+    def start_server(self, **kwargs):
+        server = FedexStubServer(seed=1, **kwargs).start()
+        self.addCleanup(server.stop)
+        config = get_fedex_config()
+        config.endpoint_url = server.url
+        return server, config
+
+    def test_canned_replies(self):
+        server, config = self.start_server(label_bytes=100)
+
+        track = FedexTrackRequest(config, customer_transaction_id='stub')
+        track.SelectionDetails.PackageIdentifier.Value = '123456789012'
+        track.send_request()
+        self.assertEqual(track.client.options.location, server.url + '/web-services/track')
+        self.assertEqual(track.response.TransactionDetail.CustomerTransactionId, 'stub')
+        self.assertEqual(track.response.CompletedTrackDetails[0].TrackDetails[0].TrackingNumber, '123456789012')
+
+        rate = FedexRateServiceRequest(config)
+        rate.send_request()
+        self.assertEqual(rate.response.RateReplyDetails[0].RatedShipmentDetails[0]
+                         .ShipmentRateDetail.TotalNetCharge.Amount, 10.0)
+
+        shipment = FedexProcessShipmentRequest(config)
+        shipment.send_request()
+        package = shipment.response.CompletedShipmentDetail.CompletedPackageDetails[0]
+        self.assertEqual(len(package.Label.Parts[0].Image), 136)
+
+        location = FedexSearchLocationRequest(config)
+        location.send_request()
+        self.assertEqual(location.response.TotalResultsAvailable, 1)
+
+        self.assertEqual(server.calls, {'track': 1, 'getRates': 1, 'processShipment': 1, 'searchLocations': 1})
+
+    def test_latency_and_errors(self):
+        server, config = self.start_server(latency=0.05, error_rate=1.0)
+        start = time.time()
+        self.assertRaises(FedexFailure, FedexRateServiceRequest(config).send_request)
+        assert time.time() - start >= 0.05
+
+        server.error_kind = server.ERROR
+        self.assertRaises(FedexError, FedexRateServiceRequest(config).send_request)
+        server.error_kind = server.FAULT
+        self.assertRaises(SchemaValidationError, FedexRateServiceRequest(config).send_request)
+
+        server.error_rate = 0
+        server.set_reply('getRates', lambda operation, request: server._reply(operation, request, 'WARNING', ''))
+        FedexRateServiceRequest(config).send_request()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Test module for envelope templates.
+"""
+
+import datetime
+import unittest
+import logging
+import sys
+
+sys.path.insert(0, '..')
+from fedex.services.rate_service import FedexRateServiceRequest
+from fedex.services.track_service import FedexTrackRequest
+from fedex.templates import get_envelope_template
+
+from tests.common import get_canned_config, get_fedex_config
+from tests.test_batch import rate_reply
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+
+def build_rate(config, postal_code):
+    rate = FedexRateServiceRequest(config, customer_transaction_id='<rate & "quote">')
+    rate.RequestedShipment.ShipTimestamp = datetime.datetime(2017, 1, 2, 10, 0)
+    rate.RequestedShipment.DropoffType = 'REGULAR_PICKUP'
+    rate.RequestedShipment.Shipper.Address.PostalCode = postal_code
+    rate.RequestedShipment.Shipper.Address.CountryCode = 'US'
+    rate.RequestedShipment.Recipient.Address.Residential = True
+    rate.RequestedShipment.Recipient.Address.StreetLines = ['1 Main St', '']
+    package = rate.create_wsdl_object_of_type('RequestedPackageLineItem')
+    package.Weight = rate.create_wsdl_object_of_type('Weight')
+    package.Weight.Value = 1.5
+    package.Weight.Units = 'LB'
+    package.GroupPackageCount = 1
+    rate.add_package(package)
+    return rate
+
+
+def build_track(config, number):
+    track = FedexTrackRequest(config)
+    track.SelectionDetails.PackageIdentifier.Type = 'TRACKING_NUMBER_OR_DOORTAG'
+    track.SelectionDetails.PackageIdentifier.Value = number
+    return track
+
+
+class EnvelopeTemplateTests(unittest.TestCase):
+    """
+    These tests verify that templates render the same envelopes as suds.
+    """
+
+    def assertSameEnvelopes(self, build, *values):
+        suds_config = get_fedex_config()
+        template_config = get_fedex_config()
+        template_config.envelope_templates = True
+        for value in values:
+            request = build(template_config, value)
+            self.assertEqual(request._prepare_request().envelope,
+                             build(suds_config, value)._prepare_request().envelope)
+        return request
+
+    def test_same_as_suds(self):
+        rate = self.assertSameEnvelopes(build_rate, '29631', '27513', '10001')
+        template = get_envelope_template(rate.client, rate.client.service.getRates.method)
+        assert template.compiled and not template.disabled
+
+        track = self.assertSameEnvelopes(build_track, '123456789012', '987654321098')
+        assert get_envelope_template(track.client, track.client.service.track.method).compiled
+
+    def test_fallback(self):
+        # Dicts are converted by suds, they are left to it.
+        def build(config, postal_code):
+            rate = build_rate(config, '29631')
+            rate.RequestedShipment.Recipient.Address = {'PostalCode': postal_code, 'CountryCode': 'US'}
+            return rate
+
+        rate = self.assertSameEnvelopes(build, '27513', '10001')
+        assert not get_envelope_template(rate.client, rate.client.service.getRates.method).disabled
+
+    def test_send_request(self):
+        config = get_canned_config(rate_reply)
+        config.envelope_templates = ['track']
+        assert not FedexRateServiceRequest(config).envelope_templates
+
+        config.envelope_templates = True
+        rate = build_rate(config, '29631')
+        rate.send_request()
+        self.assertEqual(rate.response.HighestSeverity, 'SUCCESS')
+        # Nothing was left for suds to prune.
+        self.assertEqual(rate.metrics.phases['prune'], 0.0)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,147 @@
+"""
+Test module for the rate limiter.
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import logging
+import sys
+
+sys.path.insert(0, '..')
+from fedex.services.track_service import FedexTrackRequest
+from fedex.throttle import BULK, INTERACTIVE, MemoryBucketBackend, RateLimiter, SQLiteBucketBackend
+
+from tests.common import get_canned_config
+from tests.test_batch import track_reply
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+
+class ThrottleTests(unittest.TestCase):
+    """
+    These tests verify the token buckets and the order waiting requests go in.
+    """
+
+    def check_backend(self, backend, other=None):
+        other = other or backend
+        self.assertEqual(backend.take('a', 1.0, 2, 0, 100.0), 0)
+        self.assertEqual(other.take('a', 1.0, 2, 0, 100.0), 0)
+        self.assertEqual(backend.take('a', 1.0, 2, 0, 100.0), 1.0)
+        self.assertEqual(other.take('a', 1.0, 2, 0, 100.5), 0.5)
+        self.assertEqual(backend.take('a', 1.0, 2, 0, 101.0), 0)
+        # Buckets are kept per key.
+        self.assertEqual(other.take('b', 1.0, 2, 0, 101.0), 0)
+        # Bulk requests leave the reserve in the bucket.
+        self.assertEqual(backend.take('c', 1.0, 3, 1, 100.0), 0)
+        self.assertEqual(backend.take('c', 1.0, 3, 1, 100.0), 0)
+        self.assertEqual(backend.take('c', 1.0, 3, 1, 100.0), 1.0)
+        self.assertEqual(backend.take('c', 1.0, 3, 0, 100.0), 0)
+
+    def test_memory_backend(self):
+        self.check_backend(MemoryBucketBackend())
+
+    def test_sqlite_backend(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'buckets.db')
+            # Backends on the same file share their buckets, as processes do.
+            self.check_backend(SQLiteBucketBackend(path), SQLiteBucketBackend(path))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_priority(self):
+        limiter = RateLimiter(rate=1000, max_concurrent=1, priorities={'FedexTrackRequest': BULK})
+        served = []
+
+        def send(service, priority=None):
+            limiter.acquire('123', service, priority)
+            served.append(service)
+            limiter.release('123', service)
+
+        limiter.acquire('123', 'FedexTrackRequest')
+        threads = [threading.Thread(target=send, args=('FedexTrackRequest',)),
+                   threading.Thread(target=send, args=('FedexRateServiceRequest', INTERACTIVE))]
+        for waiting, thread in enumerate(threads, 1):
+            thread.start()
+            while limiter.stats()['waiting'] < waiting:
+                time.sleep(0.001)
+        limiter.release('123', 'FedexTrackRequest')
+        for thread in threads:
+            thread.join()
+        # Services share the account's queue, and the interactive rate
+        # request arrived last but went first.
+        self.assertEqual(served, ['FedexRateServiceRequest', 'FedexTrackRequest'])
+        self.assertEqual(limiter.stats()['active'], 0)
+        self.assertEqual(limiter.stats()['waits'], 2)
+
+        # Services may have buckets of their own.
+        limiter = RateLimiter(rate=1000, max_concurrent=1, per_service=True)
+        limiter.acquire('123', 'FedexTrackRequest')
+        self.assertEqual(limiter.acquire('123', 'FedexRateServiceRequest', timeout=0.01), 0.0)
+        self.assertEqual(limiter.acquire('123', 'FedexTrackRequest', timeout=0.01), None)
+        self.assertRaises(ValueError, RateLimiter, rate=0)
+        self.assertRaises(ValueError, RateLimiter, service_rates={'FedexTrackRequest': (0, 1)})
+
+    def test_slow_backend(self):
+        class SlowBackend(MemoryBucketBackend):
+            def take(self, key, rate, burst, reserve, now):
+                if key == 'slow':
+                    time.sleep(0.3)
+                return MemoryBucketBackend.take(self, key, rate, burst, reserve, now)
+
+        limiter = RateLimiter(rate=1000, backend=SlowBackend())
+        thread = threading.Thread(target=limiter.acquire, args=('slow', 'FedexTrackRequest'))
+        thread.start()
+        time.sleep(0.05)
+        # Other accounts aren't held up by a backend that blocks.
+        start = time.perf_counter()
+        limiter.acquire('fast', 'FedexTrackRequest')
+        limiter.stats()
+        self.assertLess(time.perf_counter() - start, 0.1)
+        thread.join()
+        self.assertEqual(limiter.stats()['active'], 2)
+
+    def test_async_cancel(self):
+        limiter = RateLimiter(rate=1000, max_concurrent=1)
+
+        async def main():
+            limiter.acquire('123', 'FedexTrackRequest')
+            waiting = asyncio.ensure_future(limiter.acquire_async('123', 'FedexTrackRequest'))
+            while limiter.stats()['waiting'] < 1:
+                await asyncio.sleep(0.001)
+            waiting.cancel()
+            await asyncio.gather(waiting, return_exceptions=True)
+            self.assertEqual(limiter.stats(), {'waits': 0, 'waited': 0.0, 'waiting': 0, 'active': 1})
+            # Released from another thread, the next request gets the slot.
+            acquiring = asyncio.ensure_future(limiter.acquire_async('123', 'FedexTrackRequest', timeout=1))
+            await asyncio.sleep(0.01)
+            threading.Thread(target=limiter.release, args=('123', 'FedexTrackRequest')).start()
+            self.assertGreater(await acquiring, 0)
+            limiter.release('123', 'FedexTrackRequest')
+
+        asyncio.run(asyncio.wait_for(main(), 5))
+        self.assertEqual(limiter.stats()['active'], 0)
+
+    def test_send(self):
+        config = get_canned_config(track_reply)
+        config.rate_limiter = RateLimiter(rate=2, burst=1)
+        for attempt in range(2):
+            track = FedexTrackRequest(config)
+            track.SelectionDetails.PackageIdentifier.Type = 'TRACKING_NUMBER_OR_DOORTAG'
+            track.SelectionDetails.PackageIdentifier.Value = '111'
+            track.send_request()
+        # The second request waited for a token.
+        self.assertGreater(track.metrics.phases['throttle'], 0.3)
+        self.assertEqual(config.rate_limiter.stats()['waits'], 1)
+        self.assertEqual(config.rate_limiter.stats()['active'], 0)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+Test module for request timeouts.
+"""
+
+import asyncio
+import socket
+import time
+import unittest
+import logging
+import sys
+
+sys.path.insert(0, '..')
+from fedex.base_service import FedexTimeoutError
+from fedex.cache import ResponseCache
+from fedex.retry import RetryPolicy
+from fedex.services.rate_service import rate_cache_key
+from fedex.services.track_service import FedexBulkTrackRequest, FedexTrackRequest
+from fedex.throttle import RateLimiter
+
+from tests.common import get_canned_config
+from tests.test_batch import track_reply
+from tests.test_cache import rate_request
+from tests.test_hedging import FakeAsyncTransport
+from tests.test_retry import flaky_reply
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+
+def slow_reply(seconds, error=None):
+    """
+    Returns a canned reply function that answers track requests, or raises
+    the given error, after the given seconds.
+    """
+
+    def reply(request):
+        time.sleep(seconds)
+        if error is not None:
+            raise error
+        return track_reply(request)
+    return reply
+
+
+class TimeoutTests(unittest.TestCase):
+    """
+    These tests verify that requests complete within their timeout.
+    """
+
+    def send_track(self, config, timeout):
+        track = FedexTrackRequest(config)
+        track.SelectionDetails.PackageIdentifier.Type = 'TRACKING_NUMBER_OR_DOORTAG'
+        track.SelectionDetails.PackageIdentifier.Value = '111'
+        self.track = track
+        track.send_request(timeout=timeout)
+        return track
+
+    def test_timeout(self):
+        config = get_canned_config(track_reply)
+        self.assertEqual(self.send_track(config, 5).response.HighestSeverity, 'SUCCESS')
+        # The transport is given the time left.
+        assert 0 < config.sent[0].timeout <= 5
+
+        # A reply arriving too late isn't parsed.
+        config = get_canned_config(slow_reply(0.2))
+        self.assertRaises(FedexTimeoutError, self.send_track, config, 0.1)
+        assert isinstance(self.track.metrics.error, FedexTimeoutError)
+        assert 'parse' not in self.track.metrics.phases
+
+        # Network errors after the deadline are reported as timeouts.
+        config = get_canned_config(slow_reply(0.2, socket.timeout()))
+        try:
+            self.send_track(config, 0.1)
+        except FedexTimeoutError as e:
+            self.assertEqual(e.timeout, 0.1)
+            assert isinstance(e.__cause__, socket.timeout)
+        else:
+            self.fail('No FedexTimeoutError raised.')
+
+    def test_retries(self):
+        delays = []
+        config = get_canned_config(flaky_reply(ConnectionResetError(), ConnectionResetError()))
+        config.retry_policy = RetryPolicy(base_delay=0.5, jitter=False, sleep=delays.append)
+        self.assertEqual(self.send_track(config, 5).response.HighestSeverity, 'SUCCESS')
+        self.assertEqual(delays, [0.5, 1.0])
+
+        # No retry is made that would start after the deadline.
+        config = get_canned_config(flaky_reply(ConnectionResetError(), ConnectionResetError()))
+        config.retry_policy = RetryPolicy(base_delay=0.5, jitter=False, sleep=delays.append)
+        self.assertRaises(ConnectionResetError, self.send_track, config, 0.8)
+        self.assertEqual(delays, [0.5, 1.0, 0.5])
+        self.assertEqual(len(config.sent), 2)
+
+    def test_rate_limiter(self):
+        config = get_canned_config(track_reply)
+        config.rate_limiter = RateLimiter(rate=0.1, burst=1)
+        self.send_track(config, 1)
+        start = time.perf_counter()
+        self.assertRaises(FedexTimeoutError, self.send_track, config, 0.1)
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(len(config.sent), 1)
+        self.assertEqual(config.rate_limiter.stats()['active'], 0)
+
+    def test_cache_lookup(self):
+        def slow_key(request):
+            time.sleep(0.2)
+            return rate_cache_key(request)
+
+        # The timeout starts before the request is looked up in the cache.
+        config = get_canned_config(track_reply)
+        config.rate_cache = ResponseCache(key_function=slow_key)
+        self.assertRaises(FedexTimeoutError, rate_request(config).send_request, timeout=0.1)
+        self.assertRaises(FedexTimeoutError, asyncio.run, rate_request(config).send_request_async(
+                transport=FakeAsyncTransport(), timeout=0.1))
+        self.assertEqual(config.sent, [])
+
+    def test_async(self):
+        transport = FakeAsyncTransport(1.0)
+        rate = rate_request(get_canned_config(track_reply))
+        start = time.perf_counter()
+        self.assertRaises(FedexTimeoutError, asyncio.run, rate.send_request_async(transport=transport, timeout=0.1))
+        self.assertLess(time.perf_counter() - start, 0.5)
+        # The request was cancelled.
+        self.assertEqual(transport.cancelled, 1)
+
+    def test_bulk(self):
+        config = get_canned_config(track_reply)
+        results = list(FedexBulkTrackRequest(config, batch_size=2).track(['1', '2', '3'], timeout=0))
+        assert all(isinstance(result.error, FedexTimeoutError) for result in results)
+        self.assertEqual(config.sent, [])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()
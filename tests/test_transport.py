@@ -0,0 +1,303 @@
+"""
+Test module for the pooled keep-alive HTTP transport.
+"""
+
+import asyncio
+import http.client
+import unittest
+import logging
+import os
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from suds.transport import Request
+
+sys.path.insert(0, '..')
+from fedex.config import FedexConfig
+from fedex.services.track_service import FedexTrackRequest
+from fedex.base_service import FedexError, FedexTimeoutError
+from fedex.transport import AsyncHttpTransport, PoolManager, PooledHttpTransport, get_async_transport
+
+logging.getLogger('suds').setLevel(logging.ERROR)
+logging.getLogger('fedex').setLevel(logging.INFO)
+
+TRACK_REPLY = b"""<?xml version="1.0" encoding="UTF-8"?>
+<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/">
+<SOAP-ENV:Body><TrackReply xmlns="http://fedex.com/ws/track/v16">
+<HighestSeverity>SUCCESS</HighestSeverity>
+<Notifications><Severity>SUCCESS</Severity><Source>trck</Source><Code>0</Code>
+<Message>Request was successfully processed.</Message></Notifications>
+<Version><ServiceId>trck</ServiceId><Major>16</Major><Intermediate>0</Intermediate><Minor>0</Minor></Version>
+</TrackReply></SOAP-ENV:Body></SOAP-ENV:Envelope>"""
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.ports.add(self.client_address[1])
+        self.server.requests += 1
+        time.sleep(self.server.delay)
+        if self.server.drop_request:
+            # Closes the connection without replying.
+            self.close_connection = True
+            return
+        # Closes the connection after replying, without telling the client.
+        self.close_connection = self.server.drop_idle
+        reply = self.server.reply
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        if self.server.truncate:
+            # Closes the connection half way through the reply.
+            self.close_connection = True
+            reply = reply[:len(reply) // 2]
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+class PooledHttpTransportTests(unittest.TestCase):
+    """
+    These tests verify that requests share kept-alive connections.
+    """
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        self.server.ports = set()
+        self.server.reply = TRACK_REPLY
+        self.server.delay = 0
+        self.server.requests = 0
+        self.server.drop_request = self.server.drop_idle = self.server.truncate = False
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:%d/web-services/track' % self.server.server_address[1]
+
+    def test_connection_reuse(self):
+        pool_manager = PoolManager()
+        self.addCleanup(pool_manager.clear)
+        config = FedexConfig(key='', password='', use_test_server=True,
+                             transport_factory=lambda config: PooledHttpTransport(pool_manager=pool_manager))
+
+        for i in range(3):
+            track = FedexTrackRequest(config)
+            track.client.set_options(location=self.url)
+            track.SelectionDetails.PackageIdentifier.Value = '123456789012'
+            track.send_request()
+            self.assertEqual(track.response.HighestSeverity, 'SUCCESS')
+
+        # All three requests went over a single connection.
+        self.assertEqual(len(self.server.ports), 1)
+
+    def test_dropped_connection(self):
+        pool_manager = PoolManager()
+        self.addCleanup(pool_manager.clear)
+        transport = PooledHttpTransport(pool_manager=pool_manager)
+        pool = pool_manager.connection_pool('http', '127.0.0.1', self.server.server_address[1])
+
+        # Idle connections the server closed aren't used.
+        self.server.drop_idle = True
+        transport.send(Request(self.url, b'<Envelope/>'))
+        time.sleep(0.05)
+        transport.send(Request(self.url, b'<Envelope/>'))
+        self.assertEqual((pool.connections_created, pool.connections_reused), (2, 0))
+
+        # Requests that were written aren't resent.
+        self.server.drop_idle = False
+        transport.send(Request(self.url, b'<Envelope/>'))
+        self.server.drop_request = True
+        self.assertRaises(http.client.RemoteDisconnected, transport.send, Request(self.url, b'<Envelope/>'))
+        self.assertEqual(self.server.requests, 4)
+
+    def test_truncated_stream(self):
+        pool_manager = PoolManager()
+        self.addCleanup(pool_manager.clear)
+        transport = PooledHttpTransport(pool_manager=pool_manager)
+        transport.send(Request(self.url, b'<Envelope/>'))
+
+        # A reply that was partly streamed is never asked for again.
+        self.server.truncate = True
+        chunks = []
+        self.assertRaises(http.client.IncompleteRead, transport.send_streaming, Request(self.url, b'<Envelope/>'),
+                          chunks.append, 16)
+        self.assertEqual(b''.join(chunks), TRACK_REPLY[:len(TRACK_REPLY) // 2])
+        self.assertEqual(self.server.requests, 2)
+
+    def test_keep_alive_config(self):
+        config = FedexConfig(key='', password='', use_test_server=True, keep_alive=True,
+                             connect_timeout=1, read_timeout=5)
+        track = FedexTrackRequest(config)
+        assert isinstance(track.client.options.transport, PooledHttpTransport)
+        self.assertEqual(track.client.options.transport.connect_timeout, 1)
+        self.assertEqual(track.client.options.timeout, 5)
+
+    def test_request_timeout(self):
+        pool_manager = PoolManager()
+        self.addCleanup(pool_manager.clear)
+        connect_timeouts = []
+        pool = pool_manager.connection_pool('http', '127.0.0.1', self.server.server_address[1])
+        get = pool.get
+        pool.get = lambda connect_timeout=None: connect_timeouts.append(connect_timeout) or get(connect_timeout)
+        config = FedexConfig(key='', password='', use_test_server=True,
+                             transport_factory=lambda config: PooledHttpTransport(
+                                 pool_manager=pool_manager, connect_timeout=30, read_timeout=30))
+        self.server.delay = 1.0
+
+        track = FedexTrackRequest(config)
+        track.client.set_options(location=self.url)
+        start = time.perf_counter()
+        self.assertRaises(FedexTimeoutError, track.send_request, timeout=0.2)
+        # The configured timeouts are cut short to the time left.
+        self.assertLess(time.perf_counter() - start, 0.5)
+        assert 0 < connect_timeouts[0] <= 0.2
+
+    def test_abort(self):
+        pool_manager = PoolManager()
+        self.addCleanup(pool_manager.clear)
+        transport = PooledHttpTransport(pool_manager=pool_manager)
+        request = Request(self.url, b'<Envelope/>')
+        self.server.delay = 1.0
+        threading.Timer(0.1, transport.abort, [request]).start()
+        start = time.perf_counter()
+        self.assertRaises(OSError, transport.send, request)
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_abort_released(self):
+        pool_manager = PoolManager()
+        self.addCleanup(pool_manager.clear)
+        transport = PooledHttpTransport(pool_manager=pool_manager)
+        done = Request(self.url, b'<Envelope/>')
+        transport.send(done)
+
+        # Aborting a request that was answered leaves its connection alone,
+        # though another request now uses it.
+        self.server.delay = 0.2
+        threading.Timer(0.1, transport.abort, [done]).start()
+        transport.send(Request(self.url, b'<Envelope/>'))
+        pool = pool_manager.connection_pool('http', '127.0.0.1', self.server.server_address[1])
+        self.assertEqual((pool.connections_created, pool.connections_reused), (1, 1))
+
+    def test_failed_consumer(self):
+        pool_manager = PoolManager()
+        self.addCleanup(pool_manager.clear)
+        transport = PooledHttpTransport(pool_manager=pool_manager)
+
+        def consumer(chunk):
+            raise ValueError(chunk)
+
+        pool = pool_manager.connection_pool('http', '127.0.0.1', self.server.server_address[1])
+        connections = []
+        get = pool.get
+        pool.get = lambda connect_timeout=None: connections.append(get(connect_timeout)[0]) or (connections[-1], False)
+        self.assertRaises(ValueError, transport.send_streaming, Request(self.url, b'<Envelope/>'), consumer)
+        # The connection was closed rather than returned half read.
+        self.assertEqual(connections[0].sock, None)
+        self.assertEqual(len(pool._idle), 0)
+        del pool.get
+        transport.send(Request(self.url, b'<Envelope/>'))
+        self.assertEqual((pool.connections_created, pool.connections_reused), (2, 0))
+
+    @unittest.skipIf(not hasattr(os, 'fork'), "No fork().")
+    def test_fork(self):
+        pool_manager = PoolManager()
+        self.addCleanup(pool_manager.clear)
+        PooledHttpTransport(pool_manager=pool_manager).send(Request(self.url, b'<Envelope/>'))
+        pid = os.fork()
+        if pid == 0:
+            # The child must not reuse the parent's connection.
+            os._exit(0 if not pool_manager._pools else 1)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        pool = pool_manager.connection_pool('http', '127.0.0.1', self.server.server_address[1])
+        self.assertEqual(len(pool._idle), 1)
+
+    def test_send_request_async(self):
+        config = FedexConfig(key='', password='', use_test_server=True)
+        transport = AsyncHttpTransport(limit_per_host=2)
+
+        async def track(tracking_number):
+            track = FedexTrackRequest(config)
+            track.client.set_options(location=self.url)
+            track.SelectionDetails.PackageIdentifier.Value = tracking_number
+            return await track.send_request_async(transport=transport)
+
+        async def track_all():
+            try:
+                return await asyncio.gather(*[track(str(i)) for i in range(10)])
+            finally:
+                transport.close()
+
+        responses = asyncio.run(track_all())
+        self.assertEqual([response.HighestSeverity for response in responses], ['SUCCESS'] * 10)
+        # Concurrency is capped at two connections.
+        assert len(self.server.ports) <= 2
+
+        # Replies go through the usual error checks.
+        self.server.reply = TRACK_REPLY.replace(b'SUCCESS', b'ERROR')
+        transport = AsyncHttpTransport()
+        with self.assertRaises(FedexError):
+            asyncio.run(track('1'))
+
+    def test_send_request_async_config(self):
+        pool_manager = PoolManager()
+        self.addCleanup(pool_manager.clear)
+
+        async def track(config, count=1):
+            def track_one():
+                track = FedexTrackRequest(config)
+                track.client.set_options(location=self.url)
+                track.SelectionDetails.PackageIdentifier.Value = '123456789012'
+                return track.send_request_async()
+            return await asyncio.gather(*[track_one() for i in range(count)])
+
+        # The transport_factory sends the request.
+        config = FedexConfig(key='', password='', use_test_server=True,
+                             transport_factory=lambda config: PooledHttpTransport(pool_manager=pool_manager))
+        response, = asyncio.run(track(config))
+        self.assertEqual(response.HighestSeverity, 'SUCCESS')
+        pool = pool_manager.connection_pool('http', '127.0.0.1', self.server.server_address[1])
+        self.assertEqual(len(pool._idle), 1)
+
+        # Without keep_alive, connections are closed after every request.
+        config = FedexConfig(key='', password='', use_test_server=True)
+
+        async def track_twice():
+            await track(config)
+            await track(config)
+
+        self.server.ports.clear()
+        asyncio.run(track_twice())
+        self.assertEqual(len(self.server.ports), 2)
+
+        # With it, at most pool_maxsize idle connections are kept.
+        config = FedexConfig(key='', password='', use_test_server=True, keep_alive=True, pool_maxsize=1)
+
+        async def track_twice():
+            await track(config, 3)
+            transport = get_async_transport(1)
+            self.assertEqual([len(idle) for idle in transport._idle.values()], [1])
+            ports = len(self.server.ports)
+            await track(config)
+            transport.close()
+            return ports
+
+        self.server.ports.clear()
+        ports = asyncio.run(track_twice())
+        self.assertEqual(len(self.server.ports), ports)
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    unittest.main()